@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+"""Benchmark planning, module resolution and command rendering.
+
+Every benchmark runs offline: plans are only dry-run or rendered as a
+script, and a stub executor is installed so a command that would
+really run is recorded instead.  The results are saved as JSON so two
+commits can be compared:
+
+    python scripts/bench.py --output before.json
+    git switch other-branch
+    python scripts/bench.py --output after.json --compare before.json
+"""
+
+import atexit
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Generator
+from typing import Any
+from unittest import mock
+
+import click
+
+# Keep the journal and download cache of the benchmarked runs out of the
+# user's home directory.
+_state = tempfile.mkdtemp(prefix="boss-bench-")
+atexit.register(shutil.rmtree, _state, ignore_errors=True)
+os.environ["XDG_STATE_HOME"] = os.path.join(_state, "state")
+os.environ["XDG_CACHE_HOME"] = os.path.join(_state, "cache")
+
+import distro
+
+from boss import bash, cli
+from boss.bash import Bash
+from boss.cli import SITE_DOCROOT, get_matching_modules
+from boss.download import DOWNLOADS
+from boss.registry import MODS, Mod, get
+from boss.util import display_cmd
+
+DIST_VERSION = "24.04"
+# The options every module could need, so any combination can be planned
+OPTIONS = [
+    "--dist-version", DIST_VERSION,
+    "--new-user-and-pass", "bench,password",
+    "--db-name", "bench",
+    "--db-root-pass", "password",
+    "--new-db-user-and-pass", "bench,password",
+    "--new-system-user-and-pass", "bench,password",
+    "--site-name-and-root", "bench.local,bench,y",
+    "--craft-credentials", "admin,admin@bench.local,password",
+    "--host-ip", "10.0.0.1",
+    "--netdata-user-pass", "bench,password",
+]  # fmt: skip
+# The module used when several provide a requirement
+PREFERRED = {"cert": get("SelfCert")}
+
+
+class StubExecutor:
+    """Stands in for the shell, nothing is run."""
+
+    def __init__(self) -> None:
+        self.commands: list[str] = []
+
+    def run(
+        self, cmd: str, capture: bool = False, input: bytes | None = None
+    ) -> bytes | int:
+        self.commands.append(cmd)
+        return b"" if capture else 0
+
+    def close(self) -> None:
+        return
+
+
+STUB = StubExecutor()
+
+
+@contextlib.contextmanager
+def offline() -> Generator[None]:
+    """Make every run deterministic and unable to touch the machine."""
+    # Plan as if on Ubuntu whatever the machine runs
+    with (
+        mock.patch.object(distro, "name", return_value="Ubuntu"),
+        mock.patch.object(bash, "executor", return_value=STUB),
+    ):
+        DOWNLOADS.offline = True
+        yield
+
+
+def with_requirements(mod: Mod) -> list[Mod]:
+    """The module plus the modules that provide what it requires."""
+    wanted = [mod]
+    for each in wanted:
+        for need in each.requires:
+            if any(need in i.provides for i in wanted):
+                continue
+            providers = [i for i in MODS if need in i.provides]
+            if providers:
+                wanted.append(PREFERRED.get(need, providers[0]))
+    return wanted
+
+
+def plan(mods: list[Mod], *options: str) -> Callable[[], None]:
+    names = [i.name.lower() for i in mods]
+    argv = ["bench.example.com", *names, *OPTIONS, *options]
+
+    def run() -> None:
+        # info() collects messages on the class for the summary
+        Bash.info_messages.clear()
+        sys.argv = ["boss", *argv]
+        cli.boss.main(argv, standalone_mode=False)
+
+    return run
+
+
+def benchmarks() -> dict[str, Callable[[], object]]:
+    benches: dict[str, Callable[[], object]] = {}
+    optional = [i for i in MODS if i not in (get("First"), get("Last"))]
+    names = [i.name.lower() for i in optional]
+    benches["resolve/get_matching_modules"] = lambda: get_matching_modules(names)
+
+    combinations = {i.name.lower(): with_requirements(i) for i in optional}
+    combinations["all"] = optional
+    for name, mods in combinations.items():
+        benches[f"plan/{name}/dry-run"] = plan(mods, "--dry-run")
+        benches[f"plan/{name}/script"] = plan(mods, "--generate-script")
+
+    sites = ":".join(f"site{i}.local,site{i},y" for i in range(500))
+    benches["parse/site-docroot-500"] = lambda: SITE_DOCROOT.convert(sites, None, None)
+
+    cmds = [
+        "sudo apt-get install -y " + " ".join(f"package{i}" for i in range(n % 40))
+        for n in range(200)
+    ]
+    benches["render/display_cmd-200"] = lambda: [display_cmd(i) for i in cmds]
+    benches["render/display_cmd-script-200"] = lambda: [
+        display_cmd(i, script=True) for i in cmds
+    ]
+    return benches
+
+
+def measure(bench: Callable[[], object], min_time: float) -> dict[str, Any]:
+    """Time bench until it has run for min_time seconds, at least 3 times."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        bench()  # warm up
+        times: list[float] = []
+        total = 0.0
+        while total < min_time or len(times) < 3:
+            start = time.perf_counter()
+            bench()
+            times.append(time.perf_counter() - start)
+            total += times[-1]
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times),
+        "runs": len(times),
+    }
+
+
+def commit() -> str:
+    try:
+        cmd = ["git", "rev-parse", "--short", "HEAD"]
+        return subprocess.check_output(
+            cmd, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any], threshold: float
+) -> None:
+    click.echo()
+    click.secho(f"Compared with {baseline['commit'] or 'baseline'}", bold=True)
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        if not old or "median" not in old or "median" not in result:
+            continue
+        ratio = result["median"] / old["median"]
+        color = None
+        if ratio > 1 + threshold:
+            color = "red"
+        elif ratio < 1 - threshold:
+            color = "green"
+        click.secho(
+            f"{name:45} {old['median'] * 1000:10.3f}ms -> "
+            f"{result['median'] * 1000:10.3f}ms {ratio:6.2f}x",
+            fg=color,
+        )
+
+
+@click.command()
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    default="bench-results.json",
+    show_default=True,
+    help="Where to save the results.",
+)
+@click.option(
+    "-c",
+    "--compare",
+    "baseline",
+    type=click.File(),
+    help="Results of an earlier run to compare with.",
+)
+@click.option("-k", "--filter", "pattern", help="Only run benchmarks containing this.")
+@click.option(
+    "--min-time",
+    type=float,
+    default=0.5,
+    show_default=True,
+    help="Seconds to spend on each benchmark.",
+)
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.1,
+    show_default=True,
+    help="The change in the median that counts as faster or slower.",
+)
+def main(
+    output: str, baseline: Any, pattern: str | None, min_time: float, threshold: float
+) -> None:
+    """Benchmark planning, module resolution and command rendering."""
+    results: dict[str, Any] = {
+        "commit": commit(),
+        "date": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {},
+    }
+    with offline():
+        for name, bench in benchmarks().items():
+            if pattern and pattern not in name:
+                continue
+            try:
+                result = measure(bench, min_time)
+            except SystemExit as e:
+                # error() exits, eg. a module that doesn't support DIST_VERSION
+                result = {"error": f"exit {e.code}"}
+            results["results"][name] = result
+            if "error" in result:
+                click.secho(f"{name:45} {result['error']}", fg="yellow")
+            else:
+                click.echo(
+                    f"{name:45} {result['median'] * 1000:10.3f}ms"
+                    f"  ({result['runs']} runs)"
+                )
+
+    if STUB.commands:
+        click.secho(f"{len(STUB.commands)} commands reached the executor", fg="red")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    click.echo(f"Saved {output}")
+
+    if baseline:
+        compare(results, json.load(baseline), threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import re
 import datetime
 import click
 from pathlib import Path
-from boss.cli import MODS
+from boss.registry import MODS, check
 
 
 def error(message: str) -> None:
@@ -53,7 +53,7 @@ def get_mods(full: bool = False) -> str:
 {description}
 """
     mods = []
-    for mod in MODS:
+    for mod in [i.load() for i in MODS]:
         name = mod.__name__
         description = mod.__doc__ if mod.__doc__ else ""
         lines = description.splitlines()
@@ -80,6 +80,11 @@ def main() -> None:
     # Run UV sync command
     subprocess.run(["uv", "sync"], check=True)
 
+    # The cli only knows the modules through the registry's table
+    problems = check()
+    if problems:
+        error("The module registry is out of date: " + "; ".join(problems))
+
     pretty_date, version = get_date_and_version()
 
     options = get_options()
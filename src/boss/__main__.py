@@ -0,0 +1,5 @@
+from .cli import boss
+
+# `python -m boss`, used by `boss fleet` to run boss for each host
+if __name__ == "__main__":
+    boss(prog_name="boss")
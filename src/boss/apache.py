@@ -0,0 +1,92 @@
+import threading
+
+# What a2enmod, a2enconf and a2ensite do, without starting perl for
+# every name: link the files from *-available into *-enabled.  A
+# module's dependencies, from the `# Depends:` line of its .load file,
+# are enabled first.
+ENABLE = r"""cd /etc/apache2
+enable_mod() {
+    local dep file
+    if [ ! -e "mods-available/$1.load" ]; then
+        echo "Apache has no module $1" >&2
+        return 1
+    fi
+    for dep in $(sed -n 's/^# Depends://p' "mods-available/$1.load" | tr , ' '); do
+        enable_mod "$dep"
+    done
+    for file in "$1.load" "$1.conf"; do
+        if [ -e "mods-available/$file" ]; then
+            ln -sfn "../mods-available/$file" mods-enabled/
+        fi
+    done
+}
+enable() {
+    if [ ! -e "$1-available/$2.conf" ]; then
+        echo "Apache has no $1 $2" >&2
+        return 1
+    fi
+    ln -sfn "../$1-available/$2.conf" "$1-enabled/"
+}"""
+
+
+class ApacheConfig:
+    """The Apache modules, confs and sites the modules want enabled.
+
+    Modules ask for what they need instead of running a2enmod and
+    friends, and the plan enables all of it with one command, checks
+    the config once with `apachectl configtest` and has Apache reloaded
+    once, see Bash.apply_apache().  A module can ask for its sites to be
+    the only ones, which disables every site the plan hasn't asked for.
+
+    APACHE.enable("mods", "ssl", "rewrite")
+    APACHE.enable("sites", "example.com", only=True)
+    APACHE.command()  # the shell command that enables them
+    """
+
+    KINDS = ("mods", "conf", "sites")
+
+    def __init__(self) -> None:
+        self.pending: dict[str, dict[str, None]] = {i: {} for i in self.KINDS}
+        # Every site asked for, including the ones already enabled
+        self.sites: dict[str, None] = {}
+        self.only_sites = False
+        self.lock = threading.Lock()
+
+    def enable(self, kind: str, *names: str, only: bool = False) -> None:
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown kind of Apache config: {kind}")
+        with self.lock:
+            for name in names:
+                name = name.removesuffix(".conf")
+                self.pending[kind][name] = None
+                if kind == "sites":
+                    self.sites[name] = None
+            self.only_sites = self.only_sites or only
+
+    def wanted(self) -> bool:
+        with self.lock:
+            return any(self.pending.values())
+
+    def command(self) -> str | None:
+        """The command that enables what's pending, None if nothing is."""
+        with self.lock:
+            pending = {kind: list(names) for kind, names in self.pending.items()}
+            sites = list(self.sites)
+            only_sites = self.only_sites
+            for names in self.pending.values():
+                names.clear()
+            self.only_sites = False
+        if not any(pending.values()):
+            return None
+        lines = [ENABLE]
+        if only_sites:
+            keep = " ".join(f"! -name '{i}.conf'" for i in sites)
+            lines.append(f"find sites-enabled -mindepth 1 {keep} -delete")
+        lines.extend(f"enable_mod {i}" for i in pending["mods"])
+        for kind in ("conf", "sites"):
+            lines.extend(f"enable {kind} {i}" for i in pending[kind])
+        body = "\n".join(lines)
+        return f"sudo bash -e <<'APACHE'\n{body}\nAPACHE"
+
+
+APACHE = ApacheConfig()
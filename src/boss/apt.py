@@ -0,0 +1,180 @@
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from .trace import TRACER
+
+DPKG_STATUS = Path("/var/lib/dpkg/status")
+APT_LISTS = Path("/var/lib/apt/lists")
+# Touched by apt's daily timer after a successful update
+UPDATE_STAMP = Path("/var/lib/apt/periodic/update-success-stamp")
+APT_SOURCES = Path("/etc/apt")
+ARCHIVES = Path("/var/cache/apt/archives")
+
+
+class DpkgStatus:
+    """A read-only index of the packages dpkg has installed.
+
+    The status file is parsed in-process instead of running dpkg-query
+    for every package.  It is parsed once and only parsed again if dpkg
+    has changed it since, eg. after an apt-get install.
+
+    status = DpkgStatus()
+    'apache2' in status.installed()
+    """
+
+    def __init__(self, path: Path = DPKG_STATUS) -> None:
+        self.path = path
+        self._stamp: tuple[int, int] | None = None
+        self._installed: frozenset[str] = frozenset()
+
+    def installed(self) -> frozenset[str]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return frozenset()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            self._installed = self._parse()
+            self._stamp = stamp
+        return self._installed
+
+    def missing(self, packages: list[str]) -> list[str]:
+        """Return the packages that are not installed, in the same order."""
+        installed = self.installed()
+        return [i for i in packages if i not in installed]
+
+    def _parse(self) -> frozenset[str]:
+        installed: set[str] = set()
+        stanza: dict[bytes, bytes] = {}
+        with self.path.open("rb") as f:
+            for line in f:
+                if line.strip():
+                    # Continuation lines (eg. Description) start with a space
+                    if not line[0:1].isspace():
+                        key, _, value = line.partition(b":")
+                        stanza[key] = value.strip()
+                    continue
+                self._add(installed, stanza)
+                stanza = {}
+        self._add(installed, stanza)
+        return frozenset(installed)
+
+    @staticmethod
+    def _add(installed: set[str], stanza: dict[bytes, bytes]) -> None:
+        # Status is "want flag status", eg. "install ok installed"
+        if not stanza.get(b"Status", b"").endswith(b" installed"):
+            return
+        package = stanza[b"Package"].decode()
+        installed.add(package)
+        arch = stanza.get(b"Architecture")
+        if arch:
+            installed.add(f"{package}:{arch.decode()}")
+
+
+class AptIndex:
+    """Decides when apt's package index needs to be refreshed.
+
+    The index is refreshed at most once per plan, unless a module adds a
+    new apt source after that.  A refresh is skipped entirely if the
+    lists were updated less than max_age seconds ago and no source has
+    changed since.
+    """
+
+    def __init__(self, lists: Path = APT_LISTS, sources: Path = APT_SOURCES) -> None:
+        self.lists = lists
+        self.sources = sources
+        self.refreshed = False
+        self.sources_changed = False
+        # Held for the whole check-and-update so it only runs once
+        self.lock = threading.Lock()
+
+    def needs_refresh(self, max_age: int) -> bool:
+        if self.sources_changed:
+            return True
+        if self.refreshed:
+            return False
+        updated = self.updated()
+        return updated < self.sources_updated() or time.time() - updated > max_age
+
+    def source_added(self) -> None:
+        """A module added an apt source, the next refresh can't be skipped."""
+        self.sources_changed = True
+
+    def mark_refreshed(self) -> None:
+        self.refreshed = True
+        self.sources_changed = False
+
+    def updated(self) -> float:
+        """When the lists were last updated, 0 if never."""
+        paths = [self.lists, self.lists / "partial", UPDATE_STAMP]
+        return max((i.stat().st_mtime for i in paths if i.exists()), default=0.0)
+
+    def sources_updated(self) -> float:
+        """When an apt source was last added, changed or removed."""
+        sources_d = self.sources / "sources.list.d"
+        paths = [self.sources / "sources.list", sources_d]
+        if sources_d.is_dir():
+            paths += list(sources_d.iterdir())
+        return max((i.stat().st_mtime for i in paths if i.exists()), default=0.0)
+
+
+class Prefetch:
+    """Download packages in the background while the module hooks run.
+
+    Each batch (one per module) is downloaded with `apt-get
+    --download-only` into apt's archive cache, so the real install only
+    has to unpack them.  A batch apt can't resolve, eg. one from a
+    source a hook hasn't added yet, only fails that batch; the real
+    install downloads whatever is missing.  sudo is run non-interactively
+    so the prefetch is skipped rather than prompting for a password.
+    """
+
+    def __init__(self, archives: Path = ARCHIVES) -> None:
+        self.archives = archives
+        self.thread: threading.Thread | None = None
+        self.fetched = 0
+        self.failed: list[list[str]] = []
+
+    def start(self, batches: list[list[str]]) -> None:
+        batches = [i for i in batches if i]
+        if self.thread or not batches:
+            return
+        self.thread = threading.Thread(target=self._download, args=(batches,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def wait(self) -> int:
+        """Wait for the downloads to finish and return the bytes fetched."""
+        if self.thread:
+            self.thread.join()
+        return self.fetched
+
+    def _download(self, batches: list[list[str]]) -> None:
+        sudo = ["sudo", "--non-interactive"] if os.geteuid() else []
+        cmd = sudo + ["apt-get", "--quiet", "--yes", "--download-only", "install"]
+        before = self.archive_size()
+        for batch in batches:
+            with TRACER.span("apt-get --download-only", "apt", packages=batch) as trace:
+                result = subprocess.run(
+                    cmd + batch,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    check=False,
+                )
+                trace["exit"] = result.returncode
+            if result.returncode:
+                self.failed.append(batch)
+        self.fetched = max(self.archive_size() - before, 0)
+
+    def archive_size(self) -> int:
+        if not self.archives.is_dir():
+            return 0
+        return sum(i.stat().st_size for i in self.archives.glob("*.deb"))
+
+
+DPKG = DpkgStatus()
+APT_INDEX = AptIndex()
+PREFETCH = Prefetch()
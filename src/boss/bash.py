@@ -1,13 +1,28 @@
 import os
 import sys
 import re
+import shutil
+from .apache import APACHE
+from .apt import APT_INDEX, DPKG, PREFETCH
 from .dist import Dist
+from .facts import facts
+from .download import DOWNLOADS
+from .events import EVENTS
+from .files import FileWrite, helper_command
+from .handlers import HANDLERS
+from .journal import JOURNAL, STATE_DIR
+from .script import SCRIPT
+from .trace import TRACER
 import datetime
-import subprocess
-from typing import NamedTuple
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import ClassVar, NamedTuple
 from dataclasses import dataclass
 from .errors import CommandError
-from .util import display_cmd, error, notify
+from .shell import executor
+from .util import display_cmd, error, notify, warn
 from enum import Enum, auto
 from pathlib import Path
 
@@ -19,6 +34,15 @@ class Args(NamedTuple):
     no_required: bool
     no_dependencies: bool
     generate_script: bool
+    no_session: bool
+    offline: bool
+    resume: bool
+    profile: str | None
+    output: str
+    jobs: int
+    remote: str | None
+    transport: str
+    yes: bool
     dist_version: float | None
     new_user_and_pass: tuple[str, str]  # ...?
     sql_file: str | None
@@ -27,11 +51,31 @@ class Args(NamedTuple):
     new_db_user_and_pass: tuple[str, str]
     new_system_user_and_pass: tuple[str, str]
     site_name_and_root: list[tuple[str, str, str]]
+    cert_key_type: str
+    one_cert: bool
     craft_credentials: tuple[str, str, str]
     host_ip: str | None
     netdata_user_pass: tuple[str, str]
 
 
+# Commands that take dpkg's lock (or debconf's) have to run one at a time
+# when modules run in parallel.  Only the programs themselves count, run
+# directly, with sudo or after a pipe, not eg. a path under /etc/apt.
+DPKG_COMMAND = re.compile(
+    r"(?:^|[;&|(\n]|\bsudo(?:\s+-\S+)*)\s*(?:\w+=\S*\s+)*(?:/usr/bin/)?"
+    r"(?:apt|apt-get|apt-key|apt-mark|add-apt-repository|dpkg|dpkg-reconfigure"
+    r"|debconf-set-selections)"
+    r"(?=[\s;&|)]|$)"
+)
+DPKG_LOCK = threading.Lock()
+# A single sed s command, which can report what it changed with its w
+# flag.  The pattern and replacement can only have escaped delimiters, so
+# an expression of several commands, eg. s/a/b/;s/c/d/, doesn't match.
+SED_SUBSTITUTE = re.compile(
+    r"^s([^\w\s\\])(?:(?!\1)[^\\]|\\.)*\1(?:(?!\1)[^\\]|\\.)*\1[gipImM0-9]*$"
+)
+
+
 class Snap(Enum):
     CLASSIC = auto()
     DEFAULT = auto()
@@ -40,64 +84,151 @@ class Snap(Enum):
 @dataclass
 class Settings:
     timezone: str = "America/Los_Angeles"
+    # Don't refresh apt's package index if it was updated more recently
+    # than this many seconds ago.
+    apt_lists_max_age: int = 60 * 60
+    # Install a snap's apt equivalent when the module lists one
+    prefer_debs: bool = True
+    # Import a --sql-file over at most this many connections, and no
+    # more than the CPUs
+    sql_import_connections: int = 8
+    # Seconds between the progress reports of a --sql-file import
+    sql_import_progress: float = 5.0
+    # Add the secondary indexes of tables with more SQL than this after
+    # their rows are in
+    sql_defer_indexes: int = 64 * 1024 * 1024
 
 
 class Bash:
-    APTUPDATED = False
     # info_messages: list[list[str]] = []
     info_messages: dict[str, list[tuple[str, str, str]]] = {}
     WWW_USER = "www-data"
+    # Run alone, after every module before it and before every module after it
+    serial = False
+    # Adds an apt source in pre_install, so the package index isn't final
+    # until the module has run.
+    adds_apt_sources = False
     title: str
-    requires: list[str]
+    # What the module gives and needs, the scheduler orders modules by them
+    provides: ClassVar[list[str]] = []
+    requires: ClassVar[list[str]] = []
 
     def __init__(self, args: Args, dry_run: bool = False) -> None:
         self.ok_code = 0
-        self.requires: list[str] = []
         self.apt_pkgs: list[str] = []
         self.snap_pkgs: list[tuple[str, Snap]] = []
-        self.provides: list[str] = []
+        # Apt packages to install instead of a snap, see prefer_debs()
+        self.snap_debs: dict[str, list[str]] = {}
+        # (url, destination) pairs, fetched early by the plan, see download()
+        self.downloads: list[tuple[str, str]] = []
+        # sed expressions by file waiting to be applied, see sed()
+        self.edits: dict[str, list[str]] = {}
+        # Files waiting to be written, see write_file()
+        self.writes: list[FileWrite] = []
         self.distro = Dist()
+        # CPU count, memory and architecture, eg. for tuning
+        self.facts = facts()
         self.dry_run = dry_run
         self.args = args
         self.scriptname = os.path.basename(__file__)
-        if args and not dry_run:
-            # action = args.subparser_name
-            self.log(self.__class__.__name__)
         self.now = datetime.datetime.now().strftime("%y-%m-%d-%X")
 
-    @staticmethod
-    def log(name: str) -> None:
-        """Logs a module name.
-
-        The method ensures that the file contains a record of unique module names.
-        If the log file does not exist, it creates one and records the provided
-        module name.
-        """
-        log_name = "~/boss-installed-modules"
-        mod = "{}\n".format(name)
-        try:
-            with open(os.path.expanduser(log_name), "r") as f:
-                installed_mods = f.readlines()
-        except FileNotFoundError:
-            installed_mods = []
+    @property
+    def local(self) -> bool:
+        """If the machine being set up is this one, so its files can be read.
 
-        normalized_mods: set[str] = set(installed_mods)
-        normalized_mods.add(mod)
+        A generated script runs on another machine, as do the commands
+        of a --remote run."""
+        return not (self.args.generate_script or self.args.remote)
 
-        with open(os.path.expanduser(log_name), "w") as f:
-            f.writelines(installed_mods)
+    def sed(self, sed_exp: str, config_file: str | Path) -> None:
+        """Edit config_file with sed_exp, along with the module's other edits.
 
-    def sed(self, sed_exp: str, config_file: str) -> None:
+        The edits are applied before the module's next command, or at
+        the end of its hook, all the edits to a file by one sed that
+        leaves one backup.  Files with the same edits share a sed."""
+        self.edits.setdefault(str(config_file), []).append(sed_exp)
+
+    def flush_edits(self) -> None:
+        """Apply the edits sed() has collected."""
+        edits, self.edits = self.edits, {}
+        files_by_edits: dict[tuple[str, ...], list[str]] = {}
+        for config_file, exps in edits.items():
+            files_by_edits.setdefault(tuple(exps), []).append(config_file)
+        for shared, files in files_by_edits.items():
+            self._sed(list(shared), files)
+
+    def _sed(self, exps: list[str], files: list[str]) -> None:
         new_ext = ".original-{}".format(self.now)
-        sed_cmd = f'sudo sed --in-place="{new_ext}" "{sed_exp}" "{config_file}"'
-        self.run(sed_cmd)
+        quoted_files = " ".join(f'"{i}"' for i in files)
+        # The w flag makes sed write each line an s command changed to a
+        # file, one per expression, so what matched can be reported.  The
+        # files are in the user's state dir, not /tmp, since root writes
+        # them, and their names don't change so --resume knows the command.
+        report = self.local and not self.dry_run
+        report_dir = STATE_DIR / "sed" / type(self).__name__ if report else None
+        if report_dir:
+            report_dir.mkdir(parents=True, exist_ok=True, mode=0o700)
+        matches = [
+            report_dir / str(i) if report_dir and SED_SUBSTITUTE.match(exp) else None
+            for i, exp in enumerate(exps)
+        ]
+        args = [f"{e}w {m}" if m else e for e, m in zip(exps, matches)]
+        if len(args) == 1:
+            expressions = f'"{args[0]}"'
+        else:
+            expressions = " ".join(f'-e "{i}"' for i in args)
+        try:
+            done = self.run(
+                f'sudo sed --in-place="{new_ext}" {expressions} {quoted_files}'
+            )
+            if done is None:
+                return
+            for exp, path in zip(exps, matches):
+                if path is None:
+                    continue
+                changed = len(path.read_bytes().splitlines())
+                EVENTS.emit("edit", files=files, expression=exp, changed=changed)
+                if not changed:
+                    warn(f"sed: {exp} didn't change {', '.join(files)}")
+        finally:
+            if report_dir:
+                shutil.rmtree(report_dir, ignore_errors=True)
+
+    def write_file(self, write: FileWrite) -> None:
+        """Write a file, along with the module's other writes.
+
+        The writes are made before the module's next command, or at the
+        end of its hook, by one privileged helper that replaces each file
+        atomically, see files.py.  Scripts and dry runs show the same
+        writes as tee commands."""
+        # An edit from before has to be applied first
+        if self.edits:
+            self.flush_edits()
+        self.writes.append(write)
+
+    def flush_writes(self) -> None:
+        """Make the writes write_file() has collected."""
+        writes, self.writes = self.writes, []
+        if not writes:
+            return
+        if self.args.dry_run or self.args.generate_script:
+            for write in writes:
+                self.run(write.shell(), wrap=False)
+            return
+        cmd, payload = helper_command(writes)
+        display = "\n".join(i.shell() for i in writes)
+        self.run(cmd, wrap=False, display=display, input=payload)
+
+    def flush_files(self) -> None:
+        """Make the pending writes then the pending edits."""
+        self.flush_writes()
+        self.flush_edits()
 
     def write_new_file(
         self, filename: str | Path, text: str, user: str | None = None
     ) -> None:
-        alt_user = f"-u {user}" if user else ""
-        cmd = f'''echo | sudo {alt_user} tee "{filename}" <<'EOF'\n{text}\nEOF'''
-        self.run(cmd, wrap=False)
+        self.write_file(FileWrite(str(filename), text, owner=user))
 
     def append_to_file(
         self,
@@ -108,29 +239,17 @@ class Bash:
         backup: bool = True,
         append: bool = True,
     ) -> None:
-        if backup:
-            new_ext = ".original-{}".format(self.now)
-            copy_cmd = 'sudo cp "{file}" "{file}{now}"'.format(
-                file=filename, now=new_ext
+        # remove leading spaces from the text using regex
+        text = re.sub(r"^\s+", "", text, flags=re.MULTILINE)
+        self.write_file(
+            FileWrite(
+                str(filename),
+                text,
+                append=append,
+                backup=".original-{}".format(self.now) if backup else "",
+                owner=self.WWW_USER if user == self.WWW_USER else None,
             )
-            self.run(copy_cmd)
-
-        www_user = ""
-        if user == self.WWW_USER:
-            www_user = "-u {}".format(self.WWW_USER)
-
-        append_flag = ""
-        if append is True:
-            append_flag = "-a"
-
-        sudo = "" if nosudo else "sudo"
-
-        add_cmd = (
-            f'echo | sudo {www_user} tee {append_flag} "{filename}" <<EOF\n{text}\nEOF'
         )
-        # remove leading spaces from add_cmd using regex
-        add_cmd = re.sub(r"^\s+", "", add_cmd, flags=re.MULTILINE)
-        self.run(add_cmd, wrap=False)
 
     def apt(self, progs: list[str]) -> None:
         self._apt(progs)
@@ -140,10 +259,12 @@ class Bash:
         self._snap(self.snap_pkgs)
 
     def is_apt_installed(self, package_name: str) -> bool:
-        """Check if a package is installed using apt."""
-        cmd = f"dpkg-query -Wf'${{db:Status-Status}}' {package_name} 2>/dev/null"
-        result = True if self.run(cmd, capture=True) else False
-        return result
+        """Check if a package is installed using dpkg's status file.
+
+        Nothing is considered installed on another machine."""
+        if not self.local:
+            return False
+        return package_name in DPKG.installed()
 
     def pre_install(self) -> None:
         """Stub to ensure that all modules have this method."""
@@ -154,75 +275,226 @@ class Bash:
         return
 
     def run(
-        self, cmd: str, wrap: bool = True, capture: bool = False, comment: str = ""
+        self,
+        cmd: str,
+        wrap: bool = True,
+        capture: bool = False,
+        comment: str = "",
+        display: str = "",
+        input: bytes | None = None,
     ) -> str | None:
-        if wrap:
-            pretty_cmd = " ".join(cmd.split())
-            display_cmd(
-                pretty_cmd, wrap=True, script=self.args.generate_script, comment=comment
-            )
+        """Run cmd, display is shown instead of it if it's hard to read.
+
+        input is sent to the command's stdin.  It isn't part of the
+        command that's journaled and traced, so it can hold secrets."""
+        # A command after a write or an edit might need the file
+        if self.writes or self.edits:
+            self.flush_files()
+        if input is None:
+            key = JOURNAL.command_key(cmd)
+        else:
+            key = JOURNAL.command_key(cmd + hashlib.sha256(input).hexdigest())
+        # Captured output is needed by the module so it's always run
+        skip = not capture and JOURNAL.skip(key, cmd=cmd)
+        if skip:
+            comment = "# Done in the previous run, skipped"
+        pretty_cmd = display or (" ".join(cmd.split()) if wrap else cmd)
+        if SCRIPT.enabled:
+            dpkg = bool(DPKG_COMMAND.search(cmd))
+            SCRIPT.command(pretty_cmd, wrap=wrap, comment=comment, dpkg=dpkg)
         else:
             display_cmd(
-                cmd, wrap=False, script=self.args.generate_script, comment=comment
+                pretty_cmd, wrap=wrap, script=self.args.generate_script, comment=comment
             )
 
-        result: str | bytes | int | None
-        if self.args.dry_run or self.args.generate_script:
+        if skip:
+            EVENTS.emit("command_skip", module=self.title, cmd=cmd)
+        elif self.args.dry_run:
+            EVENTS.emit("command", module=self.title, cmd=cmd, dry_run=True)
+        if skip or self.args.dry_run or self.args.generate_script:
             return None
-        if capture:
-            result = subprocess.check_output(cmd, shell=True, executable="/bin/bash")
-            sys.stdout.flush()
-        else:
-            result = subprocess.check_call(cmd, shell=True, executable="/bin/bash")
-            if result > 0:
-                raise CommandError(cmd)
-        return str(result)
+        shell = executor(session=not self.args.no_session)
+        lock = DPKG_LOCK if DPKG_COMMAND.search(cmd) else nullcontext()
+        name = cmd.split("\n")[0][:80]
+        span = TRACER.span(name, "command", module=self.title, cmd=cmd)
+        with lock, JOURNAL.command(cmd, key), span as trace:
+            if capture:
+                output = shell.run(cmd, capture=True, input=input)
+                assert isinstance(output, bytes)
+                trace["captured_bytes"] = len(output)
+                sys.stdout.flush()
+                result = str(output)
+            else:
+                status = shell.run(cmd, input=input)
+                if status:
+                    raise CommandError(cmd)
+                result = str(status)
+            trace["exit"] = 0
+        return result
 
     def curl(
         self, url: str, output: str, capture: bool = False
     ) -> str | int | bytes | None:
+        """Download url to output through the download cache.
+
+        The curl command is still shown, and used in generated scripts
+        and on remote machines."""
         cmd = "curl -sSL {url} --output {output}".format(url=url, output=output)
-        result = self.run(cmd, capture=capture)
-        return result
+        if capture or self.args.dry_run or not self.local:
+            return self.run(cmd, capture=capture)
+        self.download([(url, output)])
+        return None
+
+    def download(self, files: list[tuple[str, str]]) -> None:
+        """Download several (url, output) pairs at the same time.
+
+        Returns once every file is in place and matches its download.
+        Files listed in self.downloads have usually already been fetched
+        by the plan by the time this is called."""
+        cmds = ["curl -sSL {} --output {}".format(url, output) for url, output in files]
+        if self.args.dry_run or not self.local:
+            for cmd in cmds:
+                self.run(cmd)
+            return
+        for cmd in cmds:
+            display_cmd(cmd)
+        DOWNLOADS.fetch_all([url for url, _ in files])
+        for url, output in files:
+            DOWNLOADS.copy(url, os.path.expanduser(os.path.expandvars(output)))
 
     def restart_apache(self) -> None:
-        """Restart Apache using the appropriate command
-
-        Details about whether to use service or systemctl
-        https://askubuntu.com/a/903405"""
-
+        """Have Apache restarted once the plan gets to it, see restart()."""
         if self.distro == Dist.UBUNTU:
-            self.run("sudo service apache2 restart")
+            self.restart("apache2")
         else:
             error("restart_apache has unknown platform")
 
+    def restart(self, service: str) -> None:
+        """Have service restarted, once however many modules ask, see Handlers."""
+        self._notify(service, "restart")
+
+    def reload(self, service: str) -> None:
+        """Have service reload its config, unless it's going to be restarted."""
+        self._notify(service, "reload")
+
+    def _notify(self, service: str, action: str) -> None:
+        HANDLERS.notify(service, action)
+        # A resumed run that skips the hook asks for it again
+        JOURNAL.record("notify", service=service, action=action)
+
+    def enable_apache_mods(self, *mods: str) -> None:
+        """Have Apache modules enabled, with the plan's others, see apply_apache()."""
+        self._enable_apache("mods", list(mods))
+
+    def enable_apache_confs(self, *confs: str) -> None:
+        self._enable_apache("conf", list(confs))
+
+    def enable_apache_sites(self, *sites: str, only: bool = False) -> None:
+        """Have sites enabled, with only=True every other site is disabled."""
+        self._enable_apache("sites", list(sites), only)
+
+    def _enable_apache(self, kind: str, names: list[str], only: bool = False) -> None:
+        APACHE.enable(kind, *names, only=only)
+        # A resumed run that skips the hook asks for them again
+        JOURNAL.record("apache", kind=kind, names=names, only=only)
+
+    def apply_apache(self) -> None:
+        """Enable the Apache config the modules have asked for so far.
+
+        It's enabled in one go, then the config is checked and Apache is
+        reloaded with the other services."""
+        cmd = APACHE.command()
+        if cmd is None:
+            return
+        self.run(cmd, wrap=False)
+        self.run("sudo apachectl configtest")
+        self.reload("apache2")
+
+    def flush_services(self) -> None:
+        """Restart and reload the services that need it now instead of later.
+
+        Uses `service` rather than systemctl, it works either way, see
+        https://askubuntu.com/a/903405"""
+        for service, action in HANDLERS.take():
+            self.run(f"sudo service {service} {action}")
+
     def _apt(self, packages_list: list[str]) -> None:
+        if self.local:
+            packages_list = DPKG.missing(packages_list)
         if not packages_list:
             return
         dry = "--dry-run" if self.dry_run else ""
         packages = " ".join(packages_list)
-        if not Bash.APTUPDATED:
-            self.run("sudo apt-get --quiet update")
-            # self.run('sudo apt-get --quiet --yes upgrade')   # not really necessary
-            Bash.APTUPDATED = True
+        PREFETCH.wait()
+        self.apt_update()
         self.run(
             "export DEBIAN_FRONTEND=noninteractive; sudo apt-get {dry} --yes --quiet install {packages}".format(
                 dry=dry, packages=packages
             )
         )
 
+    def apt_update(self) -> None:
+        """Refresh apt's package index if it's stale, see AptIndex."""
+        # Don't change the lists while apt is reading them for a download
+        PREFETCH.wait()
+        with APT_INDEX.lock:
+            if not self.local:
+                # There's no knowing how fresh another machine's index is
+                refresh = not APT_INDEX.refreshed or APT_INDEX.sources_changed
+            else:
+                refresh = APT_INDEX.needs_refresh(Settings.apt_lists_max_age)
+            if refresh:
+                self.run("sudo apt-get --quiet update")
+                APT_INDEX.mark_refreshed()
+
     def _snap(self, packages: list[tuple[str, Snap]]) -> None:
         try:
-            for package, snap_mode in packages:
-                mode = "--classic" if snap_mode == Snap.CLASSIC else ""
-                self.run(f"sudo snap install {mode} {package}")
+            if self.local:
+                packages = [i for i in packages if not self.is_snap_installed(i[0])]
+            default = [name for name, mode in packages if mode == Snap.DEFAULT]
+            classic = [name for name, mode in packages if mode == Snap.CLASSIC]
         except ValueError as e:
             notify(f"Snaps: {packages}")
             error(f"Snap package not defined correctly: {e}")
+            return
+        if not packages:
+            return
+
+        # snapd can only install one snap at a time with --classic, so
+        # the default ones go in one command and the classic ones run in
+        # parallel.
+        commands = [f"sudo snap install --classic {i}" for i in classic]
+        if default:
+            commands.insert(0, f"sudo snap install {' '.join(default)}")
+        # On a new machine snapd isn't usable until it has been seeded
+        self.run("sudo snap wait system seed.loaded")
+        if self.args.dry_run or self.args.generate_script or len(commands) == 1:
+            for cmd in commands:
+                self.run(cmd)
+        else:
+            with ThreadPoolExecutor(max_workers=len(commands)) as pool:
+                list(pool.map(self.run, commands))
+
+    def prefer_debs(self) -> None:
+        """Replace snaps with their apt equivalents from snap_debs.
+
+        Installing the debs means snapd doesn't need to be seeded at all."""
+        if not Settings.prefer_debs:
+            return
+        for package, mode in list(self.snap_pkgs):
+            debs = self.snap_debs.get(package)
+            if debs:
+                self.snap_pkgs.remove((package, mode))
+                self.apt_pkgs += [i for i in debs if i not in self.apt_pkgs]
+
+    @staticmethod
+    def is_snap_installed(package_name: str) -> bool:
+        return Path("/snap", package_name, "current").exists()
 
     def info(self, title: str, msg: str) -> None:
         child_title = self.title
         row = ("├─", title, msg)
+        EVENTS.emit("info", module=child_title, title=title, value=msg)
         try:
             self.info_messages[child_title].append(row)
         except KeyError:
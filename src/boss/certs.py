@@ -0,0 +1,89 @@
+# The local CA that signs the site certs.  Its cert is in the system's
+# trusted certs, copy it to a browser to trust the sites.
+CA_KEY = "/etc/ssl/private/boss-local-ca.key"
+CA_CERT = "/usr/local/share/ca-certificates/boss-local-ca.crt"
+# Days the CA and the site certs are good for.  Browsers don't accept
+# site certs good for more than 825 days.
+CA_DAYS = 10950
+CERT_DAYS = 825
+# A cert that expires within this many seconds is replaced
+RENEW_BEFORE = 30 * 24 * 60 * 60
+
+KEY_TYPES = {
+    "ecdsa": ("EC -pkeyopt ec_paramgen_curve:P-256", "id-ecPublicKey"),
+    "rsa": ("RSA -pkeyopt rsa_keygen_bits:2048", "rsaEncryption"),
+}
+
+# Make the CA if there isn't one, then `cert NAME SAN...` makes a cert
+# signed by it unless NAME.crt is already one that's good for a while,
+# has the SANs and the key type wanted.
+ISSUE = r"""set -o pipefail
+umask 077
+ca_key={ca_key}
+ca_crt={ca_cert}
+new_key() {{
+    openssl genpkey -algorithm {algorithm} -out "$1" 2>/dev/null
+}}
+if [ ! -s "$ca_key" ] || [ ! -s "$ca_crt" ]; then
+    new_key "$ca_key"
+    openssl req -new -x509 -key "$ca_key" -days {ca_days} \
+        -subj "/O=boss/CN=boss local CA $(hostname)" -out "$ca_crt"
+    chmod 644 "$ca_crt"
+    update-ca-certificates >/dev/null
+fi
+current() {{
+    local crt=$1 key=$2 text name
+    shift 2
+    [ -s "$crt" ] && [ -s "$key" ] || return 1
+    openssl verify -CAfile "$ca_crt" "$crt" >/dev/null 2>&1 || return 1
+    openssl x509 -checkend {renew_before} -noout -in "$crt" >/dev/null || return 1
+    [ "$(openssl pkey -pubout -in "$key")" = \
+        "$(openssl x509 -pubkey -noout -in "$crt")" ] || return 1
+    text=$(openssl x509 -text -noout -in "$crt")
+    grep -q "Public Key Algorithm: {public_key}" <<< "$text" || return 1
+    for name in "$@"; do
+        grep -o 'DNS:[^,[:space:]]*' <<< "$text" | grep -qxF "DNS:$name" || return 1
+    done
+}}
+cert() {{
+    local name=$1 crt="/etc/ssl/certs/$1.crt" key="/etc/ssl/private/$1.key" sans
+    shift
+    if current "$crt" "$key" "$@"; then
+        echo "$crt is current, kept"
+        return
+    fi
+    sans=$(printf 'DNS:%s,' "$@")
+    new_key "$key.new"
+    openssl req -new -key "$key.new" -subj "/CN=$name" |
+        openssl x509 -req -CA "$ca_crt" -CAkey "$ca_key" -days {cert_days} \
+            -set_serial "0x$(openssl rand -hex 16)" -out "$crt.new" \
+            -extfile <(printf '%s\n' "subjectAltName=${{sans%,}}" \
+                basicConstraints=CA:FALSE extendedKeyUsage=serverAuth)
+    chmod 644 "$crt.new"
+    mv "$key.new" "$key"
+    mv "$crt.new" "$crt"
+}}"""
+
+
+def issue_command(certs: dict[str, list[str]], key_type: str = "ecdsa") -> str:
+    """The command that makes the certs that aren't current.
+
+    certs maps each cert's name to the names it's for, eg.
+    {"example.com": ["example.com", "www.example.com"]}, the cert and
+    key are /etc/ssl/certs/NAME.crt and /etc/ssl/private/NAME.key."""
+    algorithm, public_key = KEY_TYPES[key_type]
+    lines = [
+        ISSUE.format(
+            ca_key=CA_KEY,
+            ca_cert=CA_CERT,
+            algorithm=algorithm,
+            ca_days=CA_DAYS,
+            renew_before=RENEW_BEFORE,
+            public_key=public_key,
+            cert_days=CERT_DAYS,
+        )
+    ]
+    for name, sans in certs.items():
+        lines.append(" ".join(["cert", name, *sans]))
+    body = "\n".join(lines)
+    return f"sudo bash -e <<'CERTS'\n{body}\nCERTS"
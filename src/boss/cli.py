@@ -2,73 +2,23 @@
 
 import sys
 import re
-import subprocess
-import socket
-from pprint import pprint as pp  # noqa
 import click
 from click.core import Parameter, Context
-import importlib.metadata
 from typing import Any
 
-from .errors import DependencyError, PlatformError, SecurityError, ModuleRequestError
-from .util import error, title
-from .bash import Args
-from .mods.aptproxy import AptProxy
-from .mods.bashrc import Bashrc
-from .mods.cert import SelfCert
-from .mods.cert import LetsEncryptCert
-from .mods.craft import Craft
-from .mods.databases import Mysql
-from .mods.databases import PhpMyAdmin
-from .mods.databases import Adminer
-from .mods.last import Last
-from .mods.fakesmtp import FakeSMTP  # noqa: F401
-from .mods.first import First
-from .mods.lamp import Lamp  # noqa: F401
-from .mods.netdata import Netdata
-from .mods.newuser import NewUserAsRoot
-from .mods.newuser import Personalize
-from .mods.phpbin import PhpBin
-from .mods.phpbin import Xdebug
-from .mods.phpbin import PhpInfo
-from .mods.phpbin import Composer
-from .mods.virtualhost import VirtualHost
-from .mods.webmin import Webmin
-from .mods.webservers import Apache2
-from .mods.webservers import Nginx
-
-
-# DIST_VERSION = None
-__version__ = importlib.metadata.version("boss")
-
-DIST_VERSION: float | None = None
-
-# All the mods available in the order they should be run
-MODS = (
-    AptProxy,
-    First,  # required
-    NewUserAsRoot,
-    Personalize,
-    LetsEncryptCert,
-    SelfCert,
-    # Lamp,
-    Apache2,
-    Nginx,
-    PhpBin,
-    Mysql,
-    Composer,
-    Xdebug,
-    PhpMyAdmin,
-    Adminer,
-    VirtualHost,
-    PhpInfo,
-    Craft,
-    # FakeSMTP,
-    Netdata,
-    Webmin,
-    Bashrc,
-    Last,  # required
+from .errors import (
+    CommandError,
+    DependencyError,
+    DownloadError,
+    PlatformError,
+    SecurityError,
+    ModuleRequestError,
 )
+from .util import error
+from .registry import MODS, Mod, get
+
+# The module classes, and everything they need, are only imported once
+# the wanted modules are known so --help and --version start quickly.
 
 
 def is_server(server: str) -> bool:
@@ -84,6 +34,8 @@ def is_email(email: str) -> bool:
 
 
 def is_ipaddress(ip: str) -> bool:
+    import socket
+
     try:
         socket.inet_pton(socket.AF_INET, ip)
         return True
@@ -91,7 +43,7 @@ def is_ipaddress(ip: str) -> bool:
         return False
 
 
-def get_matching_modules(wanted_mods: list[str]) -> list[Any]:
+def get_matching_modules(wanted_mods: list[str]) -> list[Mod]:
     """Return a list of modules that match the requested module names.
 
     Try and match partial names too, but if there are multiple matches
@@ -99,13 +51,13 @@ def get_matching_modules(wanted_mods: list[str]) -> list[Any]:
 
     Sort the list of modules by their order in MODS and remove duplicates.
     """
-    matching_mods: list[Any] = []
+    matching_mods: list[Mod] = []
     for wanted in wanted_mods:
         wanted = wanted.lower()
         error_matches: list[str] = []
         matched_count = 0
         for mod in MODS:
-            module_name = mod.__name__.lower()
+            module_name = mod.name.lower()
             if module_name == wanted:
                 matching_mods.append(mod)
                 continue
@@ -126,7 +78,7 @@ def get_matching_modules(wanted_mods: list[str]) -> list[Any]:
 
     # remove duplicates from the list
     seen = set()
-    deduped_mods: list[Any] = []
+    deduped_mods: list[Mod] = []
     for x in matching_mods:
         if x not in seen:
             deduped_mods.append(x)
@@ -247,16 +199,6 @@ class IpAddress(click.ParamType):
 IP_ADDRESS = IpAddress()
 
 
-def deps(*dependencies: str) -> bool:
-    # remove the first three arguments and any options so only
-    # the wanted modules are left
-    cmd_mods = [i for i in sys.argv if not i.startswith("-")][3:]
-    for i in dependencies:
-        if i in cmd_mods:
-            return True
-    return False
-
-
 # --------------------------------- UI ---------------------------------
 
 CONTEXT_SETTINGS = {
@@ -267,7 +209,21 @@ CONTEXT_SETTINGS = {
 }
 
 
-@click.command(no_args_is_help=True, context_settings=CONTEXT_SETTINGS)
+class BossCommand(click.Command):
+    """The boss command, and `boss fleet` when that's the first argument."""
+
+    def main(self, args: Any = None, *rest: Any, **kwargs: Any) -> Any:
+        if args is None:
+            args = sys.argv[1:]
+        if args and args[0] == "fleet":
+            from .fleet import fleet
+
+            kwargs["prog_name"] = f"{kwargs.get('prog_name') or 'boss'} fleet"
+            return fleet.main(args[1:], *rest, **kwargs)
+        return super().main(args, *rest, **kwargs)
+
+
+@click.command(cls=BossCommand, no_args_is_help=True, context_settings=CONTEXT_SETTINGS)
 @click.argument("servername", type=SERVER)
 @click.argument("modules", nargs=-1, required=True)
 @click.option(
@@ -284,6 +240,59 @@ CONTEXT_SETTINGS = {
     is_flag=True,
     help="Output suitable for a bash script instead of running them",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Run up to JOBS modules that don't depend on each other at the same time.",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Only use previously downloaded files from the download cache.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip the steps the previous run completed with the same options.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    metavar="FILE",
+    help="Write a trace of how long each hook and command took to FILE, "
+    "for chrome://tracing or https://ui.perfetto.dev",
+)
+@click.option(
+    "--output",
+    type=click.Choice(["text", "jsonl"]),
+    default="text",
+    show_default=True,
+    help="jsonl writes an event per line to stdout for other programs, "
+    "everything else goes to stderr.",
+)
+@click.option(
+    "--remote",
+    metavar="HOST",
+    help="Run the commands on HOST over ssh instead of on this machine, "
+    "sudo has to work there without a password.",
+)
+@click.option(
+    "--transport",
+    type=click.Choice(["ssh", "local"]),
+    default="ssh",
+    show_default=True,
+    help="How --remote commands are run, local runs them on this machine "
+    "as a stand-in for the host.",
+)
+@click.option("-y", "--yes", is_flag=True, help="Don't ask before installing.")
+@click.option(
+    "--no-session",
+    is_flag=True,
+    help="Run each command in a new shell instead of one long-lived shell.",
+)
 @click.option(
     "--dist-version",
     type=float,
@@ -303,13 +312,12 @@ CONTEXT_SETTINGS = {
     "--sql-file",
     type=click.Path(exists=True, dir_okay=False),
     metavar="SQLFILE",
-    help="sql file to be run during install",
+    help="sql file to be run during install, can be compressed (.gz, .xz or .zst)",
 )
 @click.option(
     "-N",
     "--db-name",
     metavar="DB-NAME",
-    required=deps("mysql", "lamp", "craft"),
     help="the name the schema to create",
 )
 @click.option(
@@ -317,7 +325,6 @@ CONTEXT_SETTINGS = {
     "--db-root-pass",
     default="password",
     metavar="PASSWORD",
-    required=deps("mysql", "lamp", "phpmyadmin"),
     help="password for mysql root user, required for the mysql module",
 )
 @click.option(
@@ -325,7 +332,6 @@ CONTEXT_SETTINGS = {
     "--new-db-user-and-pass",
     type=USER_PASS,
     metavar="USERNAME,PASSWORD",
-    required=deps("craft"),
     help="a new db user's new username and password (seperated by a comma)",
 )
 # new user
@@ -334,7 +340,6 @@ CONTEXT_SETTINGS = {
     "--new-system-user-and-pass",
     type=USER_PASS,
     metavar="USERNAME,PASSWORD",
-    required=deps("newuser"),
     help="a new system user's new username and password (seperated by a comma)",
 )
 # virtualhost
@@ -343,11 +348,23 @@ CONTEXT_SETTINGS = {
     "--site-name-and-root",
     type=SITE_DOCROOT,
     metavar="SITENAME,DOCUMENTROOT[:...]",
-    required=deps("virtualhost", "craft"),
     help="""SITENAME, DOCUMENTROOT and CREATEDIR seperated by a comma (doc root will be put in /var/www).
                 CREATEDIR is an optional y/n that indicates if to create the dir or not (default:n).
                 Multiple sites can be specified by seperating them with a ":", eg: -s site1,root1,y:site2,root2""",
 )
+# cert
+@click.option(
+    "--cert-key-type",
+    type=click.Choice(["ecdsa", "rsa"]),
+    default="ecdsa",
+    show_default=True,
+    help="the kind of key the selfcert module's certs have",
+)
+@click.option(
+    "--one-cert",
+    is_flag=True,
+    help="make one cert for SERVERNAME and every --site-name-and-root site",
+)
 # craft
 @click.option(
     "-c",
@@ -361,7 +378,6 @@ CONTEXT_SETTINGS = {
     "-i",
     "--host-ip",
     type=IP_ADDRESS,
-    required=deps("aptproxy"),
     help="Host ip to be used in aptproxy config",
 )
 # netdata
@@ -371,29 +387,65 @@ CONTEXT_SETTINGS = {
     metavar="USERNAME,USERPASS",
     help="a new user's name and password (seperated by a comma)",
 )
-@click.version_option(version=__version__)
+@click.version_option(package_name="boss")
 def boss(**all_args: Any) -> None:
     """👔 Install various applications and miscellany to set up a server.
 
     MODULES is the list of modules, see `boss list` for available modules.
     SERVERNAME is used to set up the self-signed certificate and virtual host.
+
+    To set up several hosts at once, see `boss fleet --help`.
     """
 
+    import subprocess
+    from . import facts, shell
+    from .bash import Args
+    from .download import DOWNLOADS
+    from .events import EVENTS
+    from .plan import Plan
+
     # convert the args dict to a namedtuple
     args = Args(**all_args)
 
+    DOWNLOADS.offline = args.offline
+
+    if args.output == "jsonl":
+        if args.generate_script:
+            error("--output jsonl can't be used with --generate-script")
+        EVENTS.open()
+
+    if args.remote:
+        if args.generate_script:
+            error("--remote can't be used with --generate-script")
+        if args.sql_file:
+            # The import reads the file here and runs mysql there
+            error("--sql-file can't be used with --remote")
+        shell.connect(args.remote, args.transport)
+        try:
+            run = shell.executor().run
+            facts.override(**facts.remote(lambda cmd: run(cmd, capture=True)))
+        except (subprocess.CalledProcessError, CommandError, ValueError) as e:
+            error(f"Couldn't find out what {args.remote} runs: {e}")
+
     if args.dist_version:
-        global DIST_VERSION
-        DIST_VERSION = args.dist_version
+        facts.override(version=args.dist_version)
 
     wanted_mods = [i.lower() for i in args.modules]
 
-    wanted: list[Any] = []
+    wanted: list[Mod] = []
     try:
         wanted = get_matching_modules(wanted_mods)
     except ModuleRequestError as e:
         error(str(e))
 
+    # check the options the requested modules can't do without
+    ctx = click.get_current_context()
+    for param in ctx.command.params:
+        needed = any(param.name in i.options for i in wanted)
+        if needed and all_args.get(param.name or "") is None:
+            raise click.MissingParameter(ctx=ctx, param=param)
+
+    AptProxy, First, Last = get("AptProxy"), get("First"), get("Last")
     if not args.no_required:
         # AptProxy is a special case, it should always be first
         if AptProxy in wanted:
@@ -427,27 +479,23 @@ def boss(**all_args: Any) -> None:
         )
         click.echo("\n".join(script_header))
     else:
-        if not args.dry_run:
-            print("Installing:", ", ".join([i.__name__ for i in wanted]))
+        if not args.dry_run and not args.yes:
+            print("Installing:", ", ".join([i.name for i in wanted]))
             if not click.confirm("Continue?", default=True, abort=True):
                 sys.exit()
 
-    for App in wanted:
-        module_name = App.title
-        title(module_name, script=args.generate_script)
-        try:
-            app = App(dry_run=args.dry_run, args=args)
-            app.pre_install()
-            app.install()
-            app.post_install()
-            app.log(module_name)
-        except subprocess.CalledProcessError as e:
-            error(str(e))
-        except DependencyError as e:
-            error(str(e))
-        except PlatformError as e:
-            error(str(e))
-        except SecurityError as e:
-            error(str(e))
-        except FileNotFoundError as e:
-            error(e.args[0])
+    try:
+        plan = Plan([i.load() for i in wanted], args)
+        plan.run()
+    except subprocess.CalledProcessError as e:
+        error(str(e))
+    except DependencyError as e:
+        error(str(e))
+    except PlatformError as e:
+        error(str(e))
+    except SecurityError as e:
+        error(str(e))
+    except DownloadError as e:
+        error(str(e))
+    except FileNotFoundError as e:
+        error(e.args[0])
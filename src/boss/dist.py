@@ -1,7 +1,6 @@
 # run-shell-command :: ../build.bash
 
-import distro
-from .util import error
+from .facts import Version, facts
 
 
 class Dist:
@@ -11,6 +10,9 @@ class Dist:
     d == Dist.UBUNTU
     d == (Dist.UBUNTU, Dist.V16_10)
     d > (Dist.UBUNTU, Dist.V16_10)
+
+    The name and version come from the process wide facts, see facts.py,
+    so creating one is cheap.
     """
 
     UBUNTU = "Ubuntu"
@@ -20,20 +22,12 @@ class Dist:
     V20_04 = 20.04  # Focal Fossa
     V22_04 = 22.04  # Jammy Jellyfish
     V24_04 = 24.04  # Oracular Oriole
-    version: float
+    version: Version
 
     def __init__(self) -> None:
-        self.name = distro.name()
-
-        try:
-            from .cli import DIST_VERSION
-        except ImportError:
-            error("Could not import DIST_VERSION from cli module.")
-
-        if DIST_VERSION:
-            self.version = DIST_VERSION
-        else:
-            self.version = float(distro.version())
+        current = facts()
+        self.name = current.name
+        self.version = current.version
 
     def __str__(self) -> str:
         return "{name} {version}".format(**self.__dict__)
@@ -44,22 +38,22 @@ class Dist:
         d = Distro()
         d == Distro.UBUNTU
         d == (Distro.UBUNTU, Distro.V16_04)"""
-        if len(other) == 2:
-            return self.name == other[0] and float(self.version) == float(other[1])
+        if isinstance(other, tuple) and len(other) == 2:
+            return self.name == other[0] and self.version == Version.parse(other[1])
         else:
             return self.name == other
 
     def __ne__(self, other):
-        return self.name != other[0] or self.version != float(other[1])
+        return not self == other
 
     def __lt__(self, other):
-        return self.name == other[0] and self.version < float(other[1])
+        return self.name == other[0] and self.version < Version.parse(other[1])
 
     def __le__(self, other):
-        return self.name == other[0] and self.version <= float(other[1])
+        return self.name == other[0] and self.version <= Version.parse(other[1])
 
     def __gt__(self, other):
-        return self.name == other[0] and self.version > float(other[1])
+        return self.name == other[0] and self.version > Version.parse(other[1])
 
     def __ge__(self, other):
-        return self.name == other[0] and self.version >= float(other[1])
+        return self.name == other[0] and self.version >= Version.parse(other[1])
@@ -0,0 +1,301 @@
+import hashlib
+import http.client
+import json
+import os
+import re
+import shutil
+import threading
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+from .errors import DownloadError
+from .trace import TRACER
+from .util import warn
+
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser() / "boss"
+CHUNK_SIZE = 64 * 1024
+# Downloads that run at the same time
+DOWNLOAD_JOBS = 6
+MAX_REDIRECTS = 5
+TIMEOUT = 30
+# A 206 response's range, bytes FIRST-LAST/SIZE where SIZE can be *
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class Connections:
+    """Keep-alive HTTP connections, one per host for each thread.
+
+    Fetching several files from the same host (eg. raw.githubusercontent.com)
+    reuses the TCP and TLS connection instead of setting up a new one
+    for each file.  Redirects are followed and the environment's proxy
+    settings are honoured, like urllib does.
+    """
+
+    def __init__(self) -> None:
+        self.local = threading.local()
+
+    def request(self, url: str, headers: dict[str, str]) -> http.client.HTTPResponse:
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._request(url, headers)
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                url = urljoin(url, location)
+                continue
+            return response
+        raise DownloadError(f"Too many redirects: {url}")
+
+    def _request(self, url: str, headers: dict[str, str]) -> http.client.HTTPResponse:
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        proxy = urllib.request.getproxies().get(parts.scheme)
+        if proxy and urllib.request.proxy_bypass(parts.hostname or ""):
+            proxy = None
+        if proxy and parts.scheme == "http":
+            # A plain http proxy takes the whole url
+            path = url
+        headers = {"Host": parts.netloc, "User-Agent": "boss", **headers}
+
+        # A kept-alive connection may have been closed by the server since,
+        # so a failure on a reused connection is retried on a new one.
+        for retry in (True, False):
+            conn, reused = self._connection(parts.scheme, parts.netloc, proxy)
+            try:
+                conn.request("GET", path, headers=headers)
+                return conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._connections().pop((parts.scheme, parts.netloc), None)
+                if not (retry and reused):
+                    raise
+        raise AssertionError("unreachable")
+
+    def _connections(self) -> dict[tuple[str, str], http.client.HTTPConnection]:
+        """This thread's connections by scheme and host."""
+        conns: dict[tuple[str, str], http.client.HTTPConnection] | None = getattr(
+            self.local, "conns", None
+        )
+        if conns is None:
+            conns = self.local.conns = {}
+        return conns
+
+    def _connection(
+        self, scheme: str, netloc: str, proxy: str | None
+    ) -> tuple[http.client.HTTPConnection, bool]:
+        conns = self._connections()
+        conn = conns.get((scheme, netloc))
+        if conn:
+            return conn, True
+        if scheme not in ("http", "https"):
+            raise DownloadError(f"Unsupported url scheme: {scheme}")
+        Connection = (
+            http.client.HTTPSConnection
+            if scheme == "https"
+            else http.client.HTTPConnection
+        )
+        if proxy:
+            conn = Connection(urlsplit(proxy).netloc, timeout=TIMEOUT)
+            if scheme == "https":
+                conn.set_tunnel(netloc)
+        else:
+            conn = Connection(netloc, timeout=TIMEOUT)
+        conns[(scheme, netloc)] = conn
+        return conn, False
+
+
+class DownloadCache:
+    """A local cache of downloaded files, keyed by URL.
+
+    Files are stored under their sha256 in objects/ and index.json maps
+    each URL to its hash, ETag and Last-Modified.  A cached URL is
+    revalidated with a conditional request so an unchanged file isn't
+    downloaded again, and only once per run.  An interrupted download is
+    resumed with a Range request.  When offline, or if the server can't
+    be reached, the cached copy is used as is.
+
+    Downloads run on a pool of `jobs` threads, so a batch of urls is
+    fetched at the same time, and a url that is already being fetched
+    (eg. started early by the plan) is waited for rather than fetched
+    twice.
+
+    cache = DownloadCache()
+    cache.start(["https://getcomposer.org/installer"])  # in the background
+    path = cache.fetch("https://getcomposer.org/installer")
+    cache.digest("https://getcomposer.org/installer", "sha384")
+    """
+
+    def __init__(
+        self,
+        root: Path = CACHE_DIR / "downloads",
+        offline: bool = False,
+        jobs: int = DOWNLOAD_JOBS,
+    ) -> None:
+        self.root = root
+        self.offline = offline
+        self.jobs = jobs
+        self.lock = threading.Lock()
+        self.connections = Connections()
+        self.futures: dict[str, Future[Path]] = {}
+        self.pool: ThreadPoolExecutor | None = None
+        self._index: dict[str, dict[str, str]] | None = None
+
+    def start(self, urls: list[str]) -> dict[str, Future[Path]]:
+        """Start fetching urls in the background, unless they already are."""
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(
+                    max_workers=self.jobs, thread_name_prefix="download"
+                )
+            for url in urls:
+                if url not in self.futures:
+                    self.futures[url] = self.pool.submit(self._fetch, url)
+            return {url: self.futures[url] for url in urls}
+
+    def fetch_all(self, urls: list[str]) -> dict[str, Path]:
+        """Return the paths of the cached copies of urls, fetched at the same time."""
+        futures = self.start(urls)
+        return {url: future.result() for url, future in futures.items()}
+
+    def fetch(self, url: str) -> Path:
+        """Return the path of the cached copy of url, downloading it if needed."""
+        return self.fetch_all([url])[url]
+
+    def copy(self, url: str, dest: str | Path) -> None:
+        """Copy url's cached copy to dest and check it arrived intact."""
+        path = self.fetch(url)
+        shutil.copyfile(path, dest)
+        with open(dest, "rb") as f:
+            if hashlib.file_digest(f, "sha256").hexdigest() != path.name:
+                raise DownloadError(f"{dest} does not match the download of {url}")
+
+    def digest(self, url: str, algorithm: str = "sha256") -> str:
+        """The hex digest of url's content, eg. to check a published signature."""
+        with self.fetch(url).open("rb") as f:
+            return hashlib.file_digest(f, algorithm).hexdigest()
+
+    def index(self) -> dict[str, dict[str, str]]:
+        with self.lock:
+            index = self._index
+            if index is None:
+                try:
+                    index = json.loads((self.root / "index.json").read_text())
+                except (FileNotFoundError, ValueError):
+                    index = {}
+                self._index = index
+            return index
+
+    def _fetch(self, url: str) -> Path:
+        entry = self.index().get(url)
+        cached = self.root / "objects" / entry["sha256"] if entry else None
+        if cached and not cached.exists():
+            cached = entry = None
+
+        if cached and self.offline:
+            return cached
+        if self.offline:
+            raise DownloadError(f"Not in the download cache and offline: {url}")
+
+        try:
+            with TRACER.span(url, "download"):
+                return self._download(url, entry)
+        except (DownloadError, http.client.HTTPException, OSError) as e:
+            if not cached:
+                raise DownloadError(f"Could not download {url}: {e}")
+            warn(f"Using the cached copy of {url}, the download failed: {e}")
+            return cached
+
+    def _download(self, url: str, entry: dict[str, str] | None) -> Path:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        partial = self.root / "partial" / key
+        partial.parent.mkdir(parents=True, exist_ok=True)
+        # The validators of the partial download, to resume it safely
+        partial_meta = partial.with_suffix(".json")
+
+        headers: dict[str, str] = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        elif partial.exists() and partial_meta.exists():
+            validator = json.loads(partial_meta.read_text()).get("validator")
+            if validator:
+                headers["Range"] = f"bytes={partial.stat().st_size}-"
+                headers["If-Range"] = validator
+
+        response = self.connections.request(url, headers)
+        if response.status == 304 and entry:
+            response.read()
+            return self.root / "objects" / entry["sha256"]
+        # The partial is already the whole file, or it's bigger than the
+        # file now is, and it wasn't moved into place.  It's downloaded
+        # again from the start.
+        if response.status == 416 and "Range" in headers:
+            response.read()
+            partial.unlink(missing_ok=True)
+            partial_meta.unlink(missing_ok=True)
+            return self._download(url, entry)
+        if response.status not in (200, 206):
+            response.read()
+            raise DownloadError(f"HTTP {response.status} {response.reason}")
+
+        # The size the whole file should be, to tell if it was cut short
+        size: int | None = None
+        if response.status == 206:
+            content_range = response.getheader("Content-Range", "")
+            match = CONTENT_RANGE.fullmatch(content_range)
+            if "Range" not in headers or not match:
+                response.read()
+                raise DownloadError(f"Unexpected Content-Range: {content_range}")
+            if int(match[1]) != partial.stat().st_size:
+                # Not the rest of the partial, start again
+                response.read()
+                partial.unlink()
+                partial_meta.unlink(missing_ok=True)
+                return self._download(url, entry)
+            size = int(match[2]) + 1 if match[3] == "*" else int(match[3])
+        elif response.getheader("Content-Length"):
+            size = int(response.getheader("Content-Length", ""))
+
+        etag = response.getheader("ETag", "")
+        last_modified = response.getheader("Last-Modified", "")
+        partial_meta.write_text(json.dumps({"validator": etag or last_modified}))
+        sha256 = hashlib.sha256()
+        mode = "wb"
+        if response.status == 206:
+            mode = "ab"
+            with partial.open("rb") as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    sha256.update(chunk)
+        with partial.open(mode) as f:
+            while chunk := response.read(CHUNK_SIZE):
+                sha256.update(chunk)
+                f.write(chunk)
+        # The partial is kept, the next run carries on from where it ends
+        received = partial.stat().st_size
+        if size is not None and received != size:
+            raise DownloadError(f"Got {received} of {size} bytes")
+
+        digest = sha256.hexdigest()
+        path = self.root / "objects" / digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial.replace(path)
+        partial_meta.unlink()
+        entry = {"sha256": digest, "etag": etag, "last_modified": last_modified}
+        self._save(url, entry)
+        return path
+
+    def _save(self, url: str, entry: dict[str, str]) -> None:
+        index = self.index()
+        with self.lock:
+            index[url] = entry
+            tmp = self.root / "index.json.tmp"
+            tmp.write_text(json.dumps(index, indent=2))
+            tmp.replace(self.root / "index.json")
+
+
+DOWNLOADS = DownloadCache()
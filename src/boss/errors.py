@@ -16,3 +16,11 @@ class CommandError(Exception):
 
 class ModuleRequestError(Exception):
     """Raised when the cli wanted module has more than one match."""
+
+
+class DownloadError(Exception):
+    """Raised when a file can't be downloaded or found in the download cache."""
+
+
+class InventoryError(Exception):
+    """Raised when a fleet inventory can't be read."""
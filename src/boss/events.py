@@ -0,0 +1,78 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, TextIO
+
+from .trace import TRACER
+
+BUFFER_SIZE = 64 * 1024
+
+
+class EventWriter:
+    """Write what a run does as JSON lines, for --output jsonl.
+
+    Each line is one event: the start and finish of each module hook,
+    command, download and apt prefetch (from the tracer), each info()
+    record, notices, warnings and errors.  Finish events carry the
+    duration, and commands their exit status and output size.
+
+    The events are written to stdout through a large buffer that is
+    flushed after each module hook.  Everything else that would write to
+    stdout, including the commands, is sent to stderr instead so the
+    stream stays parseable.
+
+    EVENTS.open()
+    EVENTS.emit("info", module="Apache2", title="URL", value="http://...")
+    EVENTS.close()
+    """
+
+    def __init__(self) -> None:
+        self.stream: TextIO | None = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.stream is not None
+
+    def open(self) -> None:
+        if self.stream:
+            return
+        sys.stdout.flush()
+        # Keep the real stdout for the events and point fd 1 at stderr
+        # for everything else, including child processes.
+        fd = os.dup(sys.stdout.fileno())
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        self.stream = open(fd, "w", buffering=BUFFER_SIZE, encoding="utf-8")
+        TRACER.listeners.append(self.span)
+        atexit.register(self.close)
+
+    def emit(self, event: str, **fields: Any) -> None:
+        if self.stream is None:
+            return
+        record = {"time": round(time.time(), 3), "event": event, **fields}
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            self.stream.write(line)
+
+    def span(self, event: str, fields: dict[str, Any]) -> None:
+        self.emit(event, **fields)
+        if event == "module_finish":
+            self.flush()
+
+    def flush(self) -> None:
+        if self.stream:
+            with self.lock:
+                self.stream.flush()
+
+    def close(self) -> None:
+        if self.stream is None:
+            return
+        with self.lock:
+            self.stream.close()
+            self.stream = None
+
+
+EVENTS = EventWriter()
@@ -0,0 +1,159 @@
+import dataclasses
+import os
+import platform
+import threading
+from collections.abc import Callable
+from functools import total_ordering
+from pathlib import Path
+from typing import Any
+
+MEMINFO = Path("/proc/meminfo")
+# Prints the facts of another machine, one per line, see remote()
+PROBE = (
+    '. /etc/os-release; echo "$NAME"; echo "$VERSION_ID"; echo "$VERSION_CODENAME"; '
+    "dpkg --print-architecture; nproc; awk '/^MemTotal:/ {print $2}' /proc/meminfo"
+)
+# dpkg's names for the machine types Ubuntu runs on
+ARCHITECTURES = {
+    "x86_64": "amd64",
+    "aarch64": "arm64",
+    "armv7l": "armhf",
+    "i686": "i386",
+    "ppc64le": "ppc64el",
+    "s390x": "s390x",
+    "riscv64": "riscv64",
+}
+
+
+@total_ordering
+@dataclasses.dataclass(frozen=True)
+class Version:
+    """A distro version that compares by its parts, not as a float.
+
+    Version.parse("20.10") > Version.parse("20.04")
+    Version.parse(24.04) == (24, 4)
+    """
+
+    major: int
+    minor: int = 0
+
+    @classmethod
+    def parse(cls, version: "str | float | Version") -> "Version":
+        if isinstance(version, Version):
+            return version
+        if isinstance(version, float):
+            # 20.10 would be 20.1 as a str
+            version = f"{version:.2f}"
+        major, _, minor = str(version).partition(".")
+        return cls(int(major), int(minor.split(".")[0] or 0))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, tuple):
+            return (self.major, self.minor) == other
+        if isinstance(other, (Version, str, float)):
+            other = Version.parse(other)
+            return (self.major, self.minor) == (other.major, other.minor)
+        return NotImplemented
+
+    def __lt__(self, other: "str | float | Version") -> bool:
+        other = Version.parse(other)
+        return (self.major, self.minor) < (other.major, other.minor)
+
+    def __hash__(self) -> int:
+        return hash((self.major, self.minor))
+
+    def __str__(self) -> str:
+        return f"{self.major}.{self.minor:02}"
+
+
+@dataclasses.dataclass(frozen=True)
+class Facts:
+    """What boss knows about the machine it's running on.
+
+    Detected once per process, see facts().  Modules can use these to
+    tune what they install without running any commands.
+    """
+
+    name: str
+    version: Version
+    codename: str
+    # dpkg's architecture, eg. amd64
+    architecture: str
+    cpus: int
+    # Total memory in bytes
+    memory: int
+
+    @classmethod
+    def detect(cls) -> "Facts":
+        import distro
+
+        return cls(
+            name=distro.name(),
+            version=Version.parse(distro.version() or "0"),
+            codename=distro.codename(),
+            architecture=ARCHITECTURES.get(platform.machine(), platform.machine()),
+            cpus=cpus(),
+            memory=memory(),
+        )
+
+
+def remote(run: Callable[[str], Any]) -> dict[str, Any]:
+    """The facts of the machine commands are run on, for override().
+
+    run is used to run PROBE and return its output, eg. Remote.run with
+    capture."""
+    output = run(PROBE)
+    if isinstance(output, bytes):
+        output = output.decode()
+    name, version, codename, architecture, count, memtotal = output.splitlines()
+    return {
+        "name": name,
+        "version": version or "0",
+        "codename": codename,
+        "architecture": architecture,
+        "cpus": int(count),
+        "memory": int(memtotal) * 1024,
+    }
+
+
+def cpus() -> int:
+    """The CPUs this process may run on, which can be less than the machine has."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def memory() -> int:
+    try:
+        for line in MEMINFO.read_text().splitlines():
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+_facts: Facts | None = None
+_overrides: dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def facts() -> Facts:
+    """The machine's facts, detected the first time they're needed."""
+    global _facts
+    with _lock:
+        if _facts is None:
+            _facts = dataclasses.replace(Facts.detect(), **_overrides)
+        return _facts
+
+
+def override(**changes: Any) -> None:
+    """Use these facts instead of the detected ones, eg. override(version=20.04)."""
+    global _facts
+    if "version" in changes:
+        changes["version"] = Version.parse(changes["version"])
+    with _lock:
+        _overrides.update(changes)
+        if _facts is not None:
+            _facts = dataclasses.replace(_facts, **changes)
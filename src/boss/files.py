@@ -0,0 +1,120 @@
+import base64
+import json
+import shlex
+from dataclasses import dataclass
+
+# Runs as root with python3 on the machine being set up.  The writes are
+# JSON on stdin, so the files' contents are never on a command line, and
+# the arguments are their paths, which the calling shell has already
+# expanded, eg. $HOME.
+HELPER = r"""
+import base64, json, os, pwd, shutil, sys, tempfile
+writes = json.load(sys.stdin)
+for write, path in zip(writes, sys.argv[1:]):
+    path = os.path.realpath(path)
+    try:
+        old = os.stat(path)
+    except FileNotFoundError:
+        old = None
+    data = base64.b64decode(write["data"])
+    if write["append"] and old:
+        with open(path, "rb") as f:
+            data = f.read() + data
+    if write["backup"] and old:
+        shutil.copy2(path, path + write["backup"])
+        os.chown(path + write["backup"], old.st_uid, old.st_gid)
+    if write["owner"]:
+        user = pwd.getpwnam(write["owner"])
+        uid, gid = user.pw_uid, user.pw_gid
+    elif old:
+        uid, gid = old.st_uid, old.st_gid
+    else:
+        uid, gid = os.getuid(), os.getgid()
+    mode = write["mode"]
+    if mode is None:
+        mode = old.st_mode & 0o7777 if old else 0o644
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".boss-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fchown(f.fileno(), uid, gid)
+            os.fchmod(f.fileno(), mode)
+            os.fsync(f.fileno())
+        os.rename(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    dir_fd = os.open(directory, os.O_DIRECTORY)
+    os.fsync(dir_fd)
+    os.close(dir_fd)
+"""
+
+
+@dataclass
+class FileWrite:
+    """A file to write, or append to, as a whole.
+
+    The new content is written to a temporary file next to the file,
+    synced and renamed over it, so the file is never seen half written.
+    A file that's replaced keeps its owner and mode unless they're given.
+    """
+
+    path: str
+    text: str
+    append: bool = False
+    # Extension for a copy of the file as it was, eg. ".original-<time>"
+    backup: str = ""
+    # User to own the file, with their group
+    owner: str | None = None
+    mode: int | None = None
+
+    def shell(self) -> str:
+        """The same write as shell commands, for scripts and dry runs."""
+        commands = []
+        if self.backup:
+            commands.append(
+                f'if [[ -e "{self.path}" ]]; then '
+                f'sudo cp -p "{self.path}" "{self.path}{self.backup}"; fi'
+            )
+        user = f"-u {self.owner} " if self.owner else ""
+        # Set the mode before the text is in the file
+        if self.mode is not None:
+            commands.append(f'sudo {user}touch "{self.path}"')
+            commands.append(f'sudo chmod {self.mode:o} "{self.path}"')
+        flag = "-a " if self.append else ""
+        end = delimiter(self.text)
+        commands.append(
+            f"sudo {user}tee {flag}\"{self.path}\" >/dev/null <<'{end}'\n"
+            f"{self.text}\n{end}"
+        )
+        return "\n".join(commands)
+
+    def payload(self) -> dict[str, object]:
+        # A heredoc ends the text with a newline, so the shell form and
+        # the helper write the same thing.
+        data = (self.text + "\n").encode()
+        return {
+            "data": base64.b64encode(data).decode(),
+            "append": self.append,
+            "backup": self.backup,
+            "owner": self.owner,
+            "mode": self.mode,
+        }
+
+
+def delimiter(text: str) -> str:
+    """A heredoc delimiter that isn't a line of text."""
+    lines = set(text.splitlines())
+    end = "EOF"
+    while end in lines:
+        end += "_"
+    return end
+
+
+def helper_command(writes: list[FileWrite]) -> tuple[str, bytes]:
+    """One command that makes all the writes, and the input it needs."""
+    paths = " ".join(f'"{i.path}"' for i in writes)
+    payload = json.dumps([i.payload() for i in writes]).encode()
+    return f"sudo python3 -c {shlex.quote(HELPER)} {paths}", payload
@@ -0,0 +1,300 @@
+import json
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import click
+
+from .errors import InventoryError
+from .journal import STATE_DIR
+from .util import error
+
+LOG_DIR = STATE_DIR / "fleet"
+
+
+@dataclass
+class Host:
+    """A host from the inventory and how its run is going."""
+
+    # What ssh connects to, eg. deploy@web1.example.com
+    address: str
+    servername: str
+    # waiting, running, done, failed or skipped
+    status: str = "waiting"
+    module: str = ""
+    commands: int = 0
+    message: str = ""
+    seconds: float = 0.0
+
+
+def read_inventory(lines: Iterable[str]) -> list[Host]:
+    """Read an inventory, one `ADDRESS [SERVERNAME]` per line.
+
+    The servername defaults to the address without the user, eg.
+    deploy@web1.example.com is web1.example.com.  Blank lines and
+    anything after a # are ignored.
+    """
+    hosts: list[Host] = []
+    for number, line in enumerate(lines, 1):
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) > 2:
+            raise InventoryError(f"Line {number} should be ADDRESS [SERVERNAME]")
+        address = fields[0]
+        servername = fields[1] if len(fields) > 1 else address.split("@")[-1]
+        if any(i.address == address for i in hosts):
+            raise InventoryError(f"{address} is in the inventory twice")
+        hosts.append(Host(address, servername))
+    if not hosts:
+        raise InventoryError("The inventory has no hosts")
+    return hosts
+
+
+class Fleet:
+    """Set up several hosts at the same time, each with its own boss process.
+
+    Each host gets a `boss SERVERNAME ARGS --remote ADDRESS --output
+    jsonl` process, so each has its own plan, journal and ssh connection
+    and the hosts can't get in each other's way.  Their events are read
+    to show how each host is doing, and the output of their commands is
+    logged to LOG_DIR/ADDRESS.log.
+
+    Up to `parallel` hosts run at once.  With a batch size the hosts are
+    set up that many at a time and a batch only starts once every host
+    of the one before it succeeded.  With fail_fast no more hosts are
+    started after one fails, the ones running are left to finish.
+
+    fleet = Fleet(hosts, ["apache2", "-d"], parallel=4)
+    ok = fleet.run()
+    """
+
+    def __init__(
+        self,
+        hosts: list[Host],
+        boss_args: list[str],
+        transport: str = "ssh",
+        parallel: int = 4,
+        batch: int = 0,
+        fail_fast: bool = False,
+        log_dir: Path = LOG_DIR,
+    ) -> None:
+        self.hosts = hosts
+        self.boss_args = boss_args
+        self.transport = transport
+        self.parallel = parallel
+        self.batch = batch or len(hosts)
+        self.fail_fast = fail_fast
+        self.log_dir = log_dir
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.width = max(len(i.address) for i in hosts)
+
+    def run(self) -> bool:
+        """Set up every host, True if they all succeeded."""
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        size = self.batch
+        batches = [self.hosts[i : i + size] for i in range(0, len(self.hosts), size)]
+        with ThreadPoolExecutor(max_workers=min(self.parallel, self.batch)) as pool:
+            for batch in batches:
+                list(pool.map(self.provision, batch))
+                if any(i.status == "failed" for i in batch):
+                    self.stopped = True
+        return all(i.status == "done" for i in self.hosts)
+
+    def command(self, host: Host) -> list[str]:
+        return [
+            sys.executable,
+            "-m",
+            "boss",
+            host.servername,
+            *self.boss_args,
+            "--remote",
+            host.address,
+            "--transport",
+            self.transport,
+            "--output",
+            "jsonl",
+            "--yes",
+        ]
+
+    def log(self, host: Host) -> Path:
+        return self.log_dir / f"{host.address}.log"
+
+    def provision(self, host: Host) -> None:
+        if self.stopped:
+            host.status = "skipped"
+            return
+        host.status = "running"
+        start = time.perf_counter()
+        with open(self.log(host), "w") as log:
+            process = subprocess.Popen(
+                self.command(host),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=log,
+                text=True,
+            )
+            assert process.stdout
+            for line in process.stdout:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                self.event(host, event)
+            process.stdout.close()
+            status = process.wait()
+        host.seconds = time.perf_counter() - start
+        if status:
+            host.status = "failed"
+            host.message = host.message or f"exit status {status}"
+            self.show(host, f"failed, see {self.log(host)}", fg="red")
+            if self.fail_fast:
+                self.stopped = True
+        else:
+            host.status = "done"
+            self.show(host, f"done in {host.seconds:.0f}s", fg="green")
+
+    def event(self, host: Host, event: dict[str, Any]) -> None:
+        """Update host's progress from one of its boss process's events."""
+        kind = event.get("event")
+        if kind == "module_start":
+            host.module = event["name"]
+            self.show(host, f"{host.module} {event['hook']}")
+        elif kind in ("command", "command_finish"):
+            host.commands += 1
+            if event.get("exit"):
+                self.show(host, f"failed: {event['cmd']}", fg="red")
+        elif kind == "warning":
+            self.show(host, event["message"], fg="yellow")
+        elif kind == "error":
+            host.message = event["message"]
+            self.show(host, event["message"], fg="red")
+
+    def show(self, host: Host, msg: str, fg: str | None = None) -> None:
+        with self.lock:
+            click.echo(
+                click.style(f"{host.address:{self.width}} ", bold=True)
+                + click.style(msg, fg=fg)
+            )
+
+    def summary(self) -> None:
+        colors = {"done": "green", "failed": "red", "skipped": "yellow"}
+        click.echo()
+        for host in self.hosts:
+            detail = f" {host.commands:4} commands {host.seconds:6.0f}s"
+            if host.status == "failed":
+                where = f"{host.module}: " if host.module else ""
+                detail += f"  {where}{host.message}"
+            if host.status == "skipped":
+                detail = ""
+            click.echo(
+                click.style(f"{host.address:{self.width}} ", bold=True)
+                + click.style(f"{host.status:7}", fg=colors.get(host.status))
+                + detail
+            )
+
+
+@click.command(
+    context_settings={
+        "help_option_names": ["-h", "--help"],
+        "ignore_unknown_options": True,
+        "allow_interspersed_args": False,
+    },
+    no_args_is_help=True,
+)
+@click.argument("inventory", type=click.File())
+@click.argument("boss_args", nargs=-1, type=click.UNPROCESSED, required=True)
+@click.option(
+    "-p",
+    "--parallel",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="How many hosts to set up at the same time.",
+)
+@click.option(
+    "-b",
+    "--batch",
+    type=click.IntRange(min=1),
+    help="Set the hosts up BATCH at a time, "
+    "a batch only starts if every host of the one before it succeeded.",
+)
+@click.option(
+    "--fail-fast",
+    is_flag=True,
+    help="Don't start any more hosts after one fails.",
+)
+@click.option(
+    "--transport",
+    type=click.Choice(["ssh", "local"]),
+    default="ssh",
+    show_default=True,
+    help="local runs every host's commands on this machine, for testing.",
+)
+@click.option(
+    "--log-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=LOG_DIR,
+    show_default=True,
+    help="Where each host's command output is logged.",
+)
+@click.option("-y", "--yes", is_flag=True, help="Don't ask before starting.")
+def fleet(
+    inventory: Any,
+    boss_args: tuple[str, ...],
+    parallel: int,
+    batch: int | None,
+    fail_fast: bool,
+    transport: str,
+    log_dir: Path,
+    yes: bool,
+) -> None:
+    """Set up every host in INVENTORY with the same modules and options.
+
+    INVENTORY has a host per line, its ssh address and optionally its
+    servername, eg. `deploy@web1.example.com web1.local`.  The servername
+    defaults to the address without the user.
+
+    BOSS_ARGS are the modules and options for boss, as they would be
+    given to `boss SERVERNAME`.  The fleet's own options go before
+    INVENTORY, eg:
+
+    boss fleet --parallel 8 hosts.txt apache2 phpbin mysql -P secret
+
+    boss doesn't have to be installed on the hosts, each command is run
+    over one multiplexed ssh connection per host.  The ssh user needs
+    sudo without a password.
+    """
+    try:
+        hosts = read_inventory(inventory)
+    except InventoryError as e:
+        error(str(e))
+        return
+
+    dry_run = "-d" in boss_args or "--dry-run" in boss_args
+    if not yes and not dry_run:
+        click.echo(f"Setting up {len(hosts)} hosts: {', '.join(boss_args)}")
+        for host in hosts:
+            click.echo(f"  {host.address} ({host.servername})")
+        click.confirm("Continue?", default=True, abort=True)
+
+    fleet = Fleet(
+        hosts,
+        list(boss_args),
+        transport=transport,
+        parallel=parallel,
+        batch=batch or 0,
+        fail_fast=fail_fast,
+        log_dir=log_dir,
+    )
+    ok = fleet.run()
+    fleet.summary()
+    if not ok:
+        sys.exit(1)
@@ -0,0 +1,60 @@
+import threading
+from collections import Counter
+
+# A later action does everything an earlier one does
+ACTIONS = ("reload", "restart")
+
+
+class Handlers:
+    """Service restarts and reloads the modules asked for, run once each.
+
+    Modules notify that a service needs restarting instead of restarting
+    it themselves, so a plan where three modules change Apache's config
+    restarts it once.  The plan runs the pending actions before each
+    serial module (eg. Last) and once more at the end, and a module that
+    needs a service restarted before it can carry on can run them
+    itself, see Bash.flush_services().
+
+    A restart covers a reload, so a service that asked for both is only
+    restarted.
+
+    HANDLERS.notify("apache2", "reload")
+    HANDLERS.notify("apache2", "restart")
+    HANDLERS.take()  # [("apache2", "restart")]
+    HANDLERS.avoided()  # 1
+    """
+
+    def __init__(self) -> None:
+        self.pending: dict[str, str] = {}
+        self.requested: Counter[str] = Counter()
+        self.performed: Counter[str] = Counter()
+        self.flushes = 0
+        self.lock = threading.Lock()
+
+    def notify(self, service: str, action: str = "restart") -> None:
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown service action: {action}")
+        with self.lock:
+            self.requested[service] += 1
+            current = self.pending.get(service)
+            if current is None or ACTIONS.index(action) > ACTIONS.index(current):
+                self.pending[service] = action
+
+    def take(self) -> list[tuple[str, str]]:
+        """The pending (service, action) pairs, which are then no longer pending."""
+        with self.lock:
+            actions = list(self.pending.items())
+            self.pending.clear()
+            self.performed.update(service for service, _ in actions)
+            self.flushes += 1
+        return actions
+
+    def avoided(self, service: str | None = None) -> int:
+        """How many requested actions were combined with another one."""
+        with self.lock:
+            if service is not None:
+                return self.requested[service] - self.performed[service]
+            return sum(self.requested.values()) - sum(self.performed.values())
+
+
+HANDLERS = Handlers()
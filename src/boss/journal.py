@@ -0,0 +1,223 @@
+import datetime
+import hashlib
+import json
+import os
+import secrets
+import subprocess
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+STATE_HOME = os.environ.get("XDG_STATE_HOME", "~/.local/state")
+STATE_DIR = Path(STATE_HOME).expanduser() / "boss"
+# Options that change how a plan is run but not what it does
+RUN_OPTIONS = {
+    "modules",
+    "dry_run",
+    "no_required",
+    "no_dependencies",
+    "generate_script",
+    "no_session",
+    "offline",
+    "resume",
+    "jobs",
+    "profile",
+    "output",
+    "transport",
+    "yes",
+}
+
+
+class Journal:
+    """An append-only record of what each run did, one JSON object per line.
+
+    Every run, module hook and command gets a start and a finish event
+    with its exit status.  Hooks and commands are identified by a hash
+    of their inputs: the module, the options it was run with and, for a
+    command, the command and its position in the hook.  With resume,
+    the steps that finished successfully in the previous run with the
+    same inputs are skipped, and recorded as done again so a run after
+    that can skip them too.  Commands whose output is captured are
+    always run, the module needs their output.
+
+    What a hook asks the plan to do later, eg. enable an Apache site, is
+    recorded with it, see record(), so a run that skips the hook can ask
+    for it again, see effects().
+
+    The journal is only written by real runs.  A dry run shows what
+    resume would skip and a generated script never skips anything.  It
+    can hold passwords that were part of a command, so it's only
+    readable by the user.
+
+    journal = Journal()
+    journal.open(args, ["First", "Apache2", "Last"])
+    with journal.module(app, "post_install", key):
+        with journal.command(cmd, journal.command_key(cmd)):
+            ...
+    journal.close(0)
+    """
+
+    def __init__(self, path: Path = STATE_DIR / "journal.jsonl") -> None:
+        self.path = path
+        self.run_id = ""
+        self.fd: int | None = None
+        # The keys of the steps the previous run completed, with their effects
+        self.completed: dict[str, list[dict[str, Any]]] = {}
+        self.options: dict[str, Any] = {}
+        self.local = threading.local()
+
+    def open(self, args: Any, apps: list[str]) -> None:
+        self.options = {k: v for k, v in args._asdict().items() if k not in RUN_OPTIONS}
+        if args.generate_script:
+            return
+        if args.remote:
+            # Hosts set up at the same time by `boss fleet` are resumed
+            # separately.
+            self.path = self.path.parent / "hosts" / f"{args.remote}.jsonl"
+        if args.resume:
+            self.completed = self.previous_run()
+        if args.dry_run:
+            return
+        self.run_id = secrets.token_hex(8)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self.write(
+            "run_start",
+            servername=args.servername,
+            modules=apps,
+            resume=args.resume,
+        )
+
+    def close(self, status: int) -> None:
+        if self.fd is None:
+            return
+        self.write("run_finish", status=status)
+        os.close(self.fd)
+        self.fd = None
+
+    def previous_run(self) -> dict[str, list[dict[str, Any]]]:
+        """The keys of the steps the last real run completed, with their effects."""
+        runs: dict[str, dict[str, list[dict[str, Any]]]] = {}
+        last = ""
+        try:
+            with self.path.open() as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    run = event.get("run", "")
+                    if event.get("event") == "run_start":
+                        runs[run] = {}
+                        last = run
+                    elif event.get("event") in ("module_finish", "command_finish"):
+                        if event.get("status") == 0 and run in runs:
+                            runs[run][event["key"]] = event.get("effects", [])
+                    elif event.get("event") == "skip" and run in runs:
+                        runs[run][event["key"]] = event.get("effects", [])
+        except FileNotFoundError:
+            return {}
+        return runs.get(last, {})
+
+    def module_key(self, app: Any, hook: str) -> str:
+        return digest(
+            type(app).__name__,
+            hook,
+            self.options,
+            str(app.distro),
+            app.apt_pkgs,
+            app.snap_pkgs,
+        )
+
+    def command_key(self, cmd: str) -> str | None:
+        """The key of the next command of the current module, None outside one."""
+        step = getattr(self.local, "step", None)
+        if step is None:
+            return None
+        step["commands"] += 1
+        return digest(step["key"], step["commands"], cmd)
+
+    def skip(self, key: str | None, **fields: Any) -> bool:
+        """Whether the step was already done, recording it as done again if so."""
+        if key is None or key not in self.completed:
+            return False
+        effects = self.completed[key]
+        if effects:
+            fields["effects"] = effects
+        self.write("skip", key=key, **fields)
+        return True
+
+    def effects(self, key: str) -> list[dict[str, Any]]:
+        """What a step the previous run completed asked for, see record()."""
+        return self.completed.get(key, [])
+
+    def record(self, effect: str, **fields: Any) -> None:
+        """Record something the current module asked the plan to do later."""
+        step = getattr(self.local, "step", None)
+        if step is not None:
+            step["effects"].append({"effect": effect, **fields})
+
+    @contextmanager
+    def module(self, app: Any, hook: str, key: str) -> Iterator[None]:
+        fields = {"module": type(app).__name__, "hook": hook, "key": key}
+        effects: list[dict[str, Any]] = []
+        self.local.step = {"key": key, "commands": 0, "effects": effects}
+        self.write("module_start", **fields)
+        start = time.monotonic()
+        status = 1
+        try:
+            yield
+            status = 0
+        finally:
+            self.local.step = None
+            self.write(
+                "module_finish",
+                status=status,
+                seconds=round(time.monotonic() - start, 3),
+                effects=effects,
+                **fields,
+            )
+
+    @contextmanager
+    def command(self, cmd: str, key: str | None) -> Iterator[None]:
+        step = getattr(self.local, "step", None)
+        module = step and step["key"]
+        self.write("command_start", cmd=cmd, key=key, module_key=module)
+        start = time.monotonic()
+        status = 1
+        try:
+            yield
+            status = 0
+        except subprocess.CalledProcessError as e:
+            status = e.returncode
+            raise
+        finally:
+            self.write(
+                "command_finish",
+                key=key,
+                status=status,
+                seconds=round(time.monotonic() - start, 3),
+            )
+
+    def write(self, event: str, **fields: Any) -> None:
+        if self.fd is None:
+            return
+        record = {
+            "time": datetime.datetime.now().isoformat(),
+            "run": self.run_id,
+            "event": event,
+            **fields,
+        }
+        # One write per line so lines from parallel modules don't interleave
+        os.write(self.fd, (json.dumps(record, default=str) + "\n").encode())
+
+
+def digest(*inputs: Any) -> str:
+    text = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+JOURNAL = Journal()
@@ -21,13 +21,15 @@ class AptProxy(Bash):
     conf_file = "/etc/apt/apt.conf.d/00aptproxy"
 
     provides = ["aptproxy"]
-    requires: list[str] = []
+    requires = []
     title = "Apt Proxy"
+    serial = True
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
 
-    def post_install(self) -> None:
+    def pre_install(self) -> None:
+        # Configure the proxy before any packages are installed
         host_ip = self.args.host_ip
         proxy_setting = f"""'Acquire::http::Proxy "http://{host_ip}:3142";'"""
         cmd = f"echo {proxy_setting} | sudo tee {self.conf_file}"
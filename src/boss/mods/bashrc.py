@@ -21,16 +21,16 @@ class Bashrc(Bash):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.apt_pkgs = ['emacs-nox']
-
-    def install_bashrc(self):
-        self.run('if [[ ! -d $HOME/bin ]]; then mkdir $HOME/bin; fi')
         gh_files = {
             'bashrc': 'https://raw.githubusercontent.com/8cylinder/bin/master/bashrc',
             'bashrc_prompt.py': 'https://raw.githubusercontent.com/8cylinder/bin/master/bashrc_prompt.py',
             'bashrc_prompt.themes': 'https://raw.githubusercontent.com/8cylinder/bin/master/bashrc_prompt.themes',
         }
-        for ghname, ghurl in gh_files.items():
-            self.curl(ghurl, '$HOME/bin/' + ghname)
+        self.downloads = [(ghurl, '$HOME/bin/' + ghname) for ghname, ghurl in gh_files.items()]
+
+    def install_bashrc(self):
+        self.run('if [[ ! -d $HOME/bin ]]; then mkdir $HOME/bin; fi')
+        self.download(self.downloads)
 
         # if .bashrc is not a link, back it up
         self.run('if [[ ! -L $HOME/.bashrc ]]; then mv $HOME/.bashrc $HOME/.bashrc.original; fi')
@@ -2,7 +2,8 @@
 
 import os
 
-from ..bash import Bash, Snap
+from ..bash import Args, Bash, Snap
+from ..certs import CA_CERT, issue_command
 from ..dist import Dist
 from ..errors import PlatformError
 from typing import Any
@@ -17,7 +18,7 @@ class LetsEncryptCert(Bash):
     """
 
     provides = ["cert"]
-    requires: list[str] = []
+    requires = []
     title = "Let's Encrypt cert"
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
@@ -26,11 +27,16 @@ class LetsEncryptCert(Bash):
             self.snap_pkgs = [
                 ("certbot", Snap.CLASSIC),
             ]
+            self.snap_debs = {
+                "certbot": ["certbot", "python3-certbot-apache"],
+            }
         else:
             raise PlatformError("Certbot install for non Ubuntu 20.04 not implemented")
 
     def post_install(self) -> None:
-        self.run("sudo ln -s /snap/bin/certbot /usr/bin/certbot")
+        # The certbot deb is already in /usr/bin
+        if any(name == "certbot" for name, _ in self.snap_pkgs):
+            self.run("sudo ln -s /snap/bin/certbot /usr/bin/certbot")
 
         # command to get a certificate and have Certbot edit the apache configuration
         # automatically to serve it, turning on HTTPS access in a single step.
@@ -40,55 +46,64 @@ class LetsEncryptCert(Bash):
         self.run("sudo certbot renew --dry-run")
 
 
+def cert_names(cert_basename: str) -> tuple[str, str, str, str]:
+    """The cert and key in the home dir and where they're installed."""
+    crt = "{}.crt".format(cert_basename)
+    key = "{}.key".format(cert_basename)
+
+    home_crt = os.path.join(os.path.expanduser("~"), crt)
+    home_key = os.path.join(os.path.expanduser("~"), key)
+
+    cert_loc = "/etc/ssl"
+    real_crt = os.path.join(cert_loc, "certs", crt)
+    real_key = os.path.join(cert_loc, "private", key)
+
+    return home_crt, home_key, real_crt, real_key
+
+
+def site_cert(args: Args, site_name: str) -> str:
+    """The name of the cert SelfCert makes for a site."""
+    return args.servername if args.one_cert else site_name
+
+
 class SelfCert(Bash):
-    """A self-signed cert good for 30 years
+    """Certs signed by a local CA, for the servername and each site
 
-    Its name is the servername, SERVERNAME.crt and SERVERNAME.key.
-    They are installed in /etc/ssl."""
+    The CA is made the first time and kept, and its cert is added to the
+    system's trusted certs.  SERVERNAME.crt is for the servername and
+    each --site-name-and-root site gets a SITENAME.crt, or with
+    --one-cert SERVERNAME.crt is for all of them.  The keys are ECDSA
+    P-256, or RSA with --cert-key-type rsa.  A cert that's good for a
+    while yet is kept.  They are installed in /etc/ssl."""
 
     provides = ["cert"]
-    requires: list[str] = []
+    requires = []
     title = "Self signed cert"
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
 
     def cert_names(self, cert_basename: str) -> tuple[str, str, str, str]:
-        crt = "{}.crt".format(cert_basename)
-        key = "{}.key".format(cert_basename)
-
-        home_crt = os.path.join(os.path.expanduser("~"), crt)
-        home_key = os.path.join(os.path.expanduser("~"), key)
-
-        cert_loc = "/etc/ssl"
-        real_crt = os.path.join(cert_loc, "certs", crt)
-        real_key = os.path.join(cert_loc, "private", key)
+        home_crt, home_key, real_crt, real_key = cert_names(cert_basename)
 
         self.info("cert", f"{real_crt}")
         self.info("key", f"{real_key}")
 
         return home_crt, home_key, real_crt, real_key
 
+    def certs(self) -> dict[str, list[str]]:
+        """Each cert's name and the names it's for."""
+        servername = self.args.servername
+        certs = {servername: [servername]}
+        for site in self.args.site_name_and_root or []:
+            name = site_cert(self.args, site[0])
+            if site[0] not in certs.setdefault(name, []):
+                certs[name].append(site[0])
+        return certs
+
     def pre_install(self) -> None:
-        cert_basename = self.args.servername
-        self.run(f"""sudo openssl \
-            req \
-            -new \
-            -newkey rsa:4096 \
-            -days 10950 \
-            -nodes \
-            -x509 \
-            -subj "/C=US/ST=Denial/L=Springfield/O=Dis/CN={self.args.servername}" \
-            -keyout {cert_basename}.key \
-            -out {cert_basename}.crt &>/dev/null
-        """)
-        self.run(
-            "sudo cp {cert_basename}.crt /etc/ssl/certs/{cert_basename}.crt".format(
-                cert_basename=cert_basename
-            )
-        )
-        self.run(
-            "sudo cp {cert_basename}.key /etc/ssl/private/{cert_basename}.key".format(
-                cert_basename=cert_basename
-            )
-        )
+        certs = self.certs()
+        self.run(issue_command(certs, self.args.cert_key_type), wrap=False)
+        for name in certs:
+            self.cert_names(name)
+        self.info("CA", CA_CERT)
@@ -93,8 +93,7 @@ class Craft(Bash):
         site_name = self.args.site_name_and_root[0][0]
         self.edit_conf(site_name, html_dir)
 
-        self.run("sudo a2enmod rewrite")
-        self.restart_apache()
+        self.enable_apache_mods("rewrite")
 
         self.info("Craft admin", f"https://{self.args.servername}/admin")
 
@@ -144,7 +143,7 @@ class Craft(Bash):
     def configure_dirs(self, html_dir: str) -> None:
         # setup the dirs
         # craft_dir = self.craft_dir
-        if not os.path.exists(html_dir) and not self.args.dry_run:
+        if self.local and not os.path.exists(html_dir) and not self.args.dry_run:
             raise DependencyError(
                 f'Site root "{html_dir}" does not exist, include "virtualhost" '
                 + "in your command line arguments to create it."
@@ -1,9 +1,19 @@
 # run-shell-command :: ../../build.bash
 
-from ..bash import Bash
+import os
+import shlex
+import subprocess
+
+import click
+
+from ..bash import Bash, Settings
 from ..dist import Dist
-from ..util import error
-from ..errors import PlatformError
+from ..files import FileWrite, delimiter
+from ..journal import JOURNAL
+from ..events import EVENTS
+from ..sqlimport import ImportStats, SqlImport, decompress_command
+from ..util import display_cmd, error, pretty_size
+from ..errors import CommandError, PlatformError
 from typing import Any
 
 
@@ -19,12 +29,15 @@ class Mysql(Bash):
     """
 
     provides = ["mysql"]
-    requires: list[str] = []
+    requires = []
     title = "MySQL"
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
         self.apt_pkgs = ["mysql-server"]
+        # For a compressed --sql-file
+        if self.args.sql_file and self.args.sql_file.endswith(".zst"):
+            self.apt_pkgs.append("zstd")
 
     def configure_root_password(self) -> None:
         root_pass = self.args.db_root_pass
@@ -39,95 +52,223 @@ class Mysql(Bash):
             )
         )
 
-    def setup_user(self, db_user: str, db_pass: str, root_pass: str) -> None:
-        # only for MySQL 5.7.8 and up?
-        sql = """
-        DROP USER IF EXISTS '{db_user}'@'localhost';
-          CREATE USER '{db_user}'@'localhost'
-            IDENTIFIED BY '{db_pass}';
-          GRANT ALL PRIVILEGES ON * . * TO '{db_user}'@'localhost';
-          FLUSH PRIVILEGES;
-        """.format(db_user=db_user, db_pass=db_pass)
-        self.run(
-            "mysql -uroot -p{root_pass} <<EOF\n{sql}\nEOF".format(
-                root_pass=root_pass, sql=sql
-            ),
-            wrap=False,
-        )
+    def import_sql(self, db: "MysqlSession", sql_file: str) -> None:
+        """Import sql_file a table per connection, see SqlImport.
 
-    def create_schema(self, db_name: str, root_pass: str) -> None:
-        sql = " ".join(
-            f"""
-          DROP DATABASE IF EXISTS {db_name};
-          CREATE DATABASE IF NOT EXISTS {db_name};
-        """.split()
+        A script or another machine gets the plain mysql command, the
+        file is only on this one."""
+        decompress = decompress_command(sql_file)
+        if decompress:
+            cmd = f"{decompress} | {db.client}"
+        else:
+            cmd = f"{db.client} < {sql_file}"
+        if self.args.dry_run or not self.local:
+            self.run(cmd)
+            return
+        key = JOURNAL.command_key(cmd)
+        if JOURNAL.skip(key, cmd=cmd):
+            display_cmd(cmd, comment="# Done in the previous run, skipped")
+            return
+        connections = min(self.facts.cpus, Settings.sql_import_connections)
+        display_cmd(f"{cmd}  # up to {connections} tables at a time")
+        engine = SqlImport(
+            db.argv(),
+            connections,
+            defer_indexes=Settings.sql_defer_indexes,
+            module=self.title,
+            progress=self.import_progress,
+            interval=Settings.sql_import_progress,
         )
-        self.run(
-            "mysql -uroot -p{root_pass} <<EOF\n{sql}\nEOF".format(
-                root_pass=root_pass, sql=sql
-            ),
-            wrap=False,
+        with JOURNAL.command(cmd, key):
+            stats = engine.run(sql_file)
+        self.info(
+            "SQL import",
+            f"{stats.tables} tables, {pretty_size(stats.size)} "
+            f"in {stats.seconds:.0f}s, {pretty_size(stats.rate)}/s, "
+            f"{stats.statement_rate:,.0f} statements/s",
         )
 
-    def import_sql(self, root_pass: str, sql_file: str) -> None:
-        self.run(
-            "mysql -uroot -p{root_pass} < {sql_file}".format(
-                root_pass=root_pass, sql_file=sql_file
-            )
+    def import_progress(self, stats: ImportStats) -> None:
+        EVENTS.emit(
+            "progress",
+            module=self.title,
+            read=stats.read,
+            total=stats.file_size,
+            size=stats.size,
+            statements=stats.statements,
+            seconds=round(stats.seconds, 3),
+        )
+        if EVENTS.enabled:
+            return
+        done = stats.read / stats.file_size if stats.file_size else 1
+        eta = ""
+        if stats.eta is not None:
+            minutes, seconds = divmod(round(stats.eta), 60)
+            eta = f", {minutes}m{seconds:02}s left"
+        click.secho(
+            f"  {done:.0%}: {pretty_size(stats.size)} of SQL, "
+            f"{pretty_size(stats.rate)}/s, "
+            f"{stats.statement_rate:,.0f} statements/s{eta}",
+            fg="yellow",
         )
-
-    def test_mysql_connectivity(self) -> None:
-        """
-        Tests MySQL connectivity, including root user login, additional user login, and
-        database existence if configured. This method verifies that the MySQL server is
-        functional and accessible using the provided credentials and database name.
-
-        Raises:
-            PlatformError: If root login fails, additional user login fails, or the
-                specified database does not exist or is not accessible.
-        """
-        # Test root connection
-        try:
-            self.run(f"mysql -uroot -p{self.args.db_root_pass} -e 'SELECT 1;'")
-            self.info("Root test", "User 'root' login successful.")
-        except Exception as e:
-            raise PlatformError(f"Root login failed: {e}")
-
-        # Test configured user if provided
-        if self.args.new_db_user_and_pass:
-            db_user, db_pass = self.args.new_db_user_and_pass
-            try:
-                self.run(f"mysql -u{db_user} -p{db_pass} -e 'SELECT 1;'")
-                self.info("User test", f"User '{db_user}' login successful.")
-            except Exception as e:
-                raise PlatformError(f'User "{db_user}" login failed, {e}')
-
-        # Test database existence if configured
-        if self.args.db_name:
-            try:
-                self.run(
-                    f"mysqlshow -uroot -p{self.args.db_root_pass} {self.args.db_name};"
-                )
-                self.info("Database test", f"Database '{self.args.db_name}' exists")
-            except Exception:
-                raise PlatformError(
-                    f'Database "{self.args.db_name}" does not exist or is not accessible.'
-                )
 
     def pre_install(self) -> None:
         self.configure_root_password()
 
     def post_install(self) -> None:
+        with MysqlSession(self, self.args.db_root_pass) as db:
+            # only for MySQL 5.7.8 and up?
+            if self.args.new_db_user_and_pass:
+                db.create_user(*self.args.new_db_user_and_pass)
+            if self.args.db_name:
+                db.create_database(self.args.db_name)
+            if self.args.sql_file:
+                db.execute()
+                self.import_sql(db, self.args.sql_file)
+
+            # Test the MySQL setup, the batch tests root's login
+            db.check_root()
+            if self.args.db_name:
+                db.check_database(self.args.db_name)
+            try:
+                ran = db.execute()
+                if self.args.new_db_user_and_pass:
+                    ran = db.check_login(*self.args.new_db_user_and_pass) and ran
+            except (CommandError, subprocess.CalledProcessError):
+                raise PlatformError("The MySQL setup failed, see the error above")
+
+        # Nothing was tested by a dry run or a script
+        if not ran:
+            return
+        self.info("Root test", "User 'root' login successful.")
         if self.args.new_db_user_and_pass:
-            db_user, db_pass = self.args.new_db_user_and_pass
-            self.setup_user(db_user, db_pass, self.args.db_root_pass)
+            db_user = self.args.new_db_user_and_pass[0]
+            self.info("User test", f"User '{db_user}' login successful.")
         if self.args.db_name:
-            self.create_schema(self.args.db_name, self.args.db_root_pass)
-        if self.args.sql_file:
-            self.import_sql(self.args.db_root_pass, self.args.sql_file)
+            self.info("Database test", f"Database '{self.args.db_name}' exists")
+
+
+class MysqlSession:
+    """Run batches of SQL as MySQL's root, each with one mysql client.
+
+    Statements are queued and execute() sends them all to one client
+    over the unix socket, which stops at the first one that fails, so
+    any number of databases and users are set up by one client.  root's
+    password is in an option file only root can read instead of on the
+    command line where ps shows it, the file is removed when the block
+    ends.  The option file and the SQL are sent to their commands' stdin
+    so neither is in the journal or the trace.
+
+    with MysqlSession(app, root_pass) as db:
+        db.create_database("shop", "blog")
+        db.create_user("shop", "secret")
+        db.execute()
+    """
+
+    OPTION_FILE = "/root/.boss-mysql.cnf"
+
+    def __init__(self, app: Bash, root_pass: str) -> None:
+        self.app = app
+        self.root_pass = root_pass
+        self.statements: list[str] = []
+        # --defaults-extra-file has to be the first option
+        self.client = (
+            f"sudo mysql --defaults-extra-file={self.OPTION_FILE} --protocol=socket"
+        )
+
+    def __enter__(self) -> "MysqlSession":
+        options = option_file("root", self.root_pass)
+        self.app.write_file(FileWrite(self.OPTION_FILE, options, mode=0o600))
+        return self
+
+    def argv(self) -> list[str]:
+        """The client's command, to run it on this machine without a shell."""
+        argv = shlex.split(self.client)
+        # sudo isn't needed, or might not be there, when boss runs as root
+        if os.geteuid() == 0:
+            return argv[1:]
+        return ["sudo", "--non-interactive"] + argv[1:]
+
+    def __exit__(self, *exc: Any) -> None:
+        self.statements = []
+        self.app.run(f"sudo rm -f {self.OPTION_FILE}")
+
+    def create_database(self, *names: str) -> None:
+        """Create empty databases, dropping any that already exist."""
+        for name in names:
+            self.statements.append(f"DROP DATABASE IF EXISTS {identifier(name)};")
+            self.statements.append(f"CREATE DATABASE {identifier(name)};")
+
+    def create_user(self, user: str, password: str) -> None:
+        """Create a local user that can do anything, replacing any that exists."""
+        account = f"{string(user)}@'localhost'"
+        self.statements.append(f"DROP USER IF EXISTS {account};")
+        self.statements.append(
+            f"CREATE USER {account} IDENTIFIED BY {string(password)};"
+        )
+        self.statements.append(f"GRANT ALL PRIVILEGES ON *.* TO {account};")
+
+    def check_root(self) -> None:
+        """Run something in the batch so it tests root's login."""
+        self.statements.append("SELECT 1;")
+
+    def check_database(self, name: str) -> None:
+        """Fail the batch if the database doesn't exist."""
+        self.statements.append(f"USE {identifier(name)};")
+
+    def execute(self) -> bool:
+        """Run the queued statements with one client.
+
+        False if the client didn't run, eg. in a dry run."""
+        statements, self.statements = self.statements, []
+        if not statements:
+            return False
+        sql = "\n".join(statements)
+        end = delimiter(sql)
+        # The SQL has passwords so it's the client's input, which isn't
+        # journaled, scripts get the same as a heredoc
+        result = self.app.run(
+            f"{self.client} --batch",
+            wrap=False,
+            display=f"{self.client} --batch <<'{end}'\n{sql}\n{end}",
+            input=f"{sql}\n".encode(),
+        )
+        return result is not None
+
+    def check_login(self, user: str, password: str) -> bool:
+        """Log in as a local user, False if the client didn't run.
+
+        The user's option file is the client's input, like execute()'s
+        SQL, so the password isn't on the command line."""
+        options = option_file(user, password)
+        end = delimiter(options)
+        cmd = (
+            "mysql --defaults-extra-file=/dev/stdin --protocol=socket "
+            "--execute='SELECT 1;'"
+        )
+        result = self.app.run(
+            cmd,
+            wrap=False,
+            display=f"{cmd} <<'{end}'\n{options}\n{end}",
+            input=f"{options}\n".encode(),
+        )
+        return result is not None
+
+
+def identifier(name: str) -> str:
+    """name quoted as a MySQL identifier, eg. a database name."""
+    return "`{}`".format(name.replace("`", "``"))
+
+
+def option_file(user: str, password: str) -> str:
+    """A mysql option file that logs in as user."""
+    password = password.replace("\\", "\\\\").replace('"', '\\"')
+    return f'[client]\nuser={user}\npassword="{password}"'
+
 
-        # Test the MySQL setup
-        self.test_mysql_connectivity()
+def string(value: str) -> str:
+    """value quoted as a MySQL string literal."""
+    return "'{}'".format(value.replace("\\", "\\\\").replace("'", "\\'"))
 
 
 class PhpMyAdmin(Bash):
@@ -142,7 +283,6 @@ class PhpMyAdmin(Bash):
     title = "PhpMyAdmin"
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
-        self.dist = Dist()
         super().__init__(*args, **kwargs)
         self.apt_pkgs = ["phpmyadmin"]
 
@@ -214,5 +354,4 @@ class Adminer(Bash):
                 append=False,
                 backup=False,
             )
-            self.run("sudo a2enconf adminer")
-            self.restart_apache()
+            self.enable_apache_confs("adminer")
@@ -1,10 +1,10 @@
 # run-shell-command :: ../../build.bash
 
-import urllib.request
 import json
 
 from ..bash import Bash
 from ..dist import Dist
+from ..download import DOWNLOADS
 from ..util import error
 
 # noinspection PyUnresolvedReferences
@@ -38,6 +38,24 @@ class FakeSMTP(Bash):
             self.cliini = "/etc/php/7.4/cli/php.ini"
         else:
             error("FakeSMTP: no php.ini defined for this version of Ubuntu")
+        # download mailhog & mhsendmail.  Get the latest release using
+        # GitHub's api.
+        self.releases = [
+            {
+                "release": "MailHog_linux_amd64",
+                "localname": "mailhog",
+                "url": "https://api.github.com/repos/mailhog/MailHog/releases/latest",
+            },
+            {
+                "release": "mhsendmail_linux_amd64",
+                "localname": "mhsendmail",
+                "url": "https://api.github.com/repos/mailhog/mhsendmail/releases/latest",
+            },
+        ]
+
+    def pre_install(self):
+        # Look the releases up while the packages are installed
+        DOWNLOADS.start([prog["url"] for prog in self.releases])
 
     def post_install(self):
         self.install_via_github()
@@ -79,31 +97,21 @@ class FakeSMTP(Bash):
         pass
 
     def install_via_github(self):
-        # download mailhog & mhsendmail.  Get the latest release using
-        # GitHub's api.
-        data = [
-            {
-                "release": "MailHog_linux_amd64",
-                "localname": "mailhog",
-                "url": "https://api.github.com/repos/mailhog/MailHog/releases/latest",
-            },
-            {
-                "release": "mhsendmail_linux_amd64",
-                "localname": "mhsendmail",
-                "url": "https://api.github.com/repos/mailhog/mhsendmail/releases/latest",
-            },
-        ]
-        # Sometimes github returns 'forbidden' when accessing the api.
-        # Rate limiting maybe? I don't know.
+        data = self.releases
+        # GitHub's api is rate limited.  The responses are cached and
+        # revalidated with their ETag, which doesn't count against the limit.
         try:
-            for prog in data:
-                r = urllib.request.urlopen(prog["url"]).read()
-                content = json.loads(r.decode("utf-8"))
-                for asset in content["assets"]:
-                    if asset["name"] == prog["release"]:
-                        self.curl(asset["browser_download_url"], prog["localname"])
-        except urllib.error.HTTPError as e:
-            error("MAILHOG github api: {}".format(e.msg))
+            releases = DOWNLOADS.fetch_all([prog["url"] for prog in data])
+        except DownloadError as e:
+            error("MAILHOG github api: {}".format(e))
+            return
+        files: list[tuple[str, str]] = []
+        for prog in data:
+            content = json.loads(releases[prog["url"]].read_text())
+            for asset in content["assets"]:
+                if asset["name"] == prog["release"]:
+                    files.append((asset["browser_download_url"], prog["localname"]))
+        self.download(files)
 
     def config_upstart(self):
         # 14.04 uses upstart
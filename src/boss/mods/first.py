@@ -14,6 +14,7 @@ class First(Bash):
     provides = ["first"]
     requires = []
     title = "First"
+    serial = True
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
@@ -70,22 +71,24 @@ class First(Bash):
             #     ("node", Snap.CLASSIC),
             # ]
 
-    def pre_install(self) -> None:
-        self.run("sudo apt-get update")
+    def post_install(self) -> None:
+        # Upgrade after the plan's packages are installed so the package
+        # index is only refreshed once.
+        self.apt_update()
         self.run("sudo apt-get upgrade -y")
 
-    def post_install(self) -> None:
         self.set_timezone()
 
         # install emacs-nox without postfix
-        self.run("sudo apt install -y --no-install-recommends emacs-nox")
+        if not self.is_apt_installed("emacs-nox"):
+            self.run("sudo apt install -y --no-install-recommends emacs-nox")
 
         # Restart fail2ban
         # `systemctl status fail2ban.service` reports warning: "The unit file,
         # source configuration file or drop-ins of fail2ban.service changed on disk."
         # restarting it seems to fix this.
         if self.is_apt_installed("fail2ban"):
-            self.run("sudo systemctl restart fail2ban.service")
+            self.restart("fail2ban")
 
     def set_timezone(self) -> None:
         self.run("sudo timedatectl set-timezone {}".format(Settings.timezone))
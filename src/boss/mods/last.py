@@ -5,6 +5,8 @@ import click
 
 from ..bash import Bash
 from ..errors import *
+from ..handlers import HANDLERS
+from ..trace import TRACER
 from typing import Any
 
 
@@ -12,16 +14,17 @@ class Last(Bash):
     """Show a summary of the installation process."""
 
     provides = ["done"]
-    requires: list[str] = []
+    requires = []
     title = "Done"
+    serial = True
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
 
-    def pre_install(self) -> None:
+    def post_install(self) -> None:
         # https://github.com/pwaller/pyfiglet/blob/master/doc/figfont.txt
         if self.args.generate_script:
-            sys.stdout.write("set +x\n")
+            self.run("set +x")
         self.run("figlet -w89 {}".format(self.args.servername))
 
         # titlec = linec = (255, 148, 0)
@@ -44,4 +47,38 @@ class Last(Bash):
                 )
             print()
 
+        services = sorted(HANDLERS.requested)
+        if services:
+            avoided = HANDLERS.avoided()
+            click.secho(
+                f"Service restarts and reloads ({avoided} avoided)",
+                fg=titlec,
+                bold=True,
+            )
+            for i, service in enumerate(services):
+                tree_line = end_tree if i == len(services) - 1 else "├─"
+                requested = HANDLERS.requested[service]
+                performed = HANDLERS.performed[service]
+                click.echo(
+                    click.style(f"  {tree_line} ", fg=linec, dim=True)
+                    + click.style(f"{service}: ", fg=keyc)
+                    + click.style(f"ran {performed} of {requested}.", fg=valuec)
+                )
+            print()
+
+        slowest = TRACER.slowest(10)
+        if slowest:
+            click.secho("Slowest commands", fg=titlec, bold=True)
+            for i, event in enumerate(slowest):
+                tree_line = end_tree if i == len(slowest) - 1 else "├─"
+                cmd = " ".join(event["args"]["cmd"].split())
+                cmd = cmd if len(cmd) <= 60 else cmd[:57] + "..."
+                click.echo(
+                    click.style(f"  {tree_line} ", fg=linec, dim=True)
+                    + click.style(f"{event['dur'] / 1e6:7.1f}s ", fg=keyc)
+                    + click.style(f"{event['args']['module']}: ", fg=keyc)
+                    + click.style(cmd, fg=valuec)
+                )
+            print()
+
         sys.stdout.write("\n")
@@ -32,5 +32,5 @@ class Netdata(Bash):
                 "s/bind socket to IP = .*$/bind socket to IP = *.*.*.*/",
                 "/etc/netdata/netdata.conf",
             )
-            self.run("sudo systemctl restart netdata")
+            self.restart("netdata")
             self.info("URL", "http://{}:19999".format(self.args.servername))
@@ -2,6 +2,7 @@
 
 from ..bash import Bash
 from ..dist import Dist
+from ..download import DOWNLOADS
 from ..errors import PlatformError, SecurityError
 from ..util import error
 
@@ -19,8 +20,6 @@ class PhpBin(Bash):
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
-        self.provides = ["php"]
-        self.requires = ["apache2"]
 
         if self.distro == (Dist.UBUNTU, Dist.V14_04):
             self.apt_pkgs = [
@@ -152,7 +151,7 @@ class PhpInfo(Bash):
             datetime.datetime.now().isoformat()
         )
 
-        if self.args.dry_run or self.args.generate_script or os.path.exists(self.loc):
+        if self.args.dry_run or not self.local or os.path.exists(self.loc):
             self.write_new_file(self.info_file, info)
             # cmd = 'echo \'{info}\' | sudo -u www-data tee {loc}'.format(
             #     info=info,
@@ -181,47 +180,41 @@ class Composer(Bash):
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
+        if self.distro >= (Dist.UBUNTU, Dist.V18_04):
+            self.apt_pkgs = ["composer"]
 
     def post_install(self) -> None:
         if self.distro < (Dist.UBUNTU, Dist.V18_04):
             self.source_install()
-        else:
-            self.apt_install()
 
         # add www-data to the ubuntu group so when running composer as
         # www-data user, it can create a cache in ubuntu's home dir.
         self.run("sudo usermod -aG $USER www-data")
 
-    def apt_install(self) -> None:
-        self.apt(["composer"])
-
     def source_install(self) -> None:
-        url = "https://composer.github.io/installer.sig"
-        sig_name = os.path.expanduser("~/composer.sig")
-        self.curl(url, sig_name)
-
-        expected_sig = None
-        if os.path.exists(sig_name):  # could be a dry run
-            with open(os.path.expanduser(sig_name)) as f:
-                expected_sig = f.read()
-            expected_sig = expected_sig.strip()
-            self.run("rm {}".format(sig_name))
-
+        sig_url = "https://composer.github.io/installer.sig"
         url = "https://getcomposer.org/installer"
         comp_name = "$HOME/composer_installer"
-        self.curl(url, comp_name)
 
-        actual_sig = None
-        result = self.run("sha384sum {}".format(comp_name), capture=True)
-        if result:  # could be a dry run
-            actual_sig = result.decode("utf-8").split()[0].strip()
-
-        if expected_sig != actual_sig:
-            raise SecurityError(
-                'Composer\'s signatures do not match.\nExpected: "{}"\n  Actual: "{}"'.format(
-                    expected_sig, actual_sig
+        if self.args.dry_run or not self.local:
+            sig_name = "$HOME/composer.sig"
+            self.curl(sig_url, sig_name)
+            self.curl(url, comp_name)
+            # "hash *file", a double space would be lost when the command is wrapped
+            self.run(f'echo "$(cat {sig_name}) *{comp_name}" | sha384sum --check')
+            self.run(f"rm {sig_name}")
+        else:
+            # Check the signature against the download cache in-process
+            DOWNLOADS.fetch_all([sig_url, url])
+            expected_sig = DOWNLOADS.fetch(sig_url).read_text().strip()
+            actual_sig = DOWNLOADS.digest(url, "sha384")
+            if expected_sig != actual_sig:
+                raise SecurityError(
+                    'Composer\'s signatures do not match.\nExpected: "{}"\n  Actual: "{}"'.format(
+                        expected_sig, actual_sig
+                    )
                 )
-            )
+            self.curl(url, comp_name)
 
         [
             self.run(command)
@@ -2,10 +2,10 @@
 
 import os
 
-from .cert import SelfCert
+from .cert import cert_names, site_cert
 from ..bash import Bash
+from ..certs import issue_command
 from ..errors import *
-from collections import namedtuple
 from typing import Any
 from pathlib import Path
 
@@ -71,45 +71,38 @@ class VirtualHost(Bash):
         vhost = "\n".join([i[12:] for i in vhost.split("\n")])
         return vhost
 
-    def existing_cert(self, servername: str) -> tuple[str, str]:
-        # retrieve the existing cert for servername
-        cert = SelfCert([], [])
-        _, _, crt, key = cert.cert_names(servername)
+    def existing_cert(self, site_name: str) -> tuple[str, str]:
+        # retrieve the cert the cert module made for site_name
+        _, _, crt, key = cert_names(site_cert(self.args, site_name))
         return (crt, key)
 
     def new_cert(self, site_name: str) -> tuple[str, str]:
-        # create a new cert using this site's site_name
-        CertArgs = namedtuple("CertArgs", "servername dry_run")
-        cert_args = CertArgs(site_name, self.args.dry_run)
-        cert = SelfCert(dry_run=self.args.dry_run, args=cert_args)
-        cert.pre_install()
-        _, _, crt, key = cert.cert_names(site_name)
+        # create a new cert for site_name signed by the local CA
+        cmd = issue_command({site_name: [site_name]}, self.args.cert_key_type)
+        self.run(cmd, wrap=False)
+        _, _, crt, key = cert_names(site_name)
         return (crt, key)
 
     def create_doc_root(self, document_root: str) -> None:
         # make www-root owner of the doc root
         doc_root = os.path.join("/var/www", document_root)
-        if not os.path.exists(doc_root):
+        if not self.local:
+            self.run(f'sudo mkdir -p "{doc_root}"')
+        elif not os.path.exists(doc_root):
             self.run(f'sudo mkdir "{doc_root}"')
         self.run(f'sudo chown www-data:www-data "{doc_root}"')
         self.run(f'sudo chmod g+rw "{doc_root}"')
 
     def post_install(self) -> None:
-        mods = ["ssl", "rewrite", "headers"]
-        for m in mods:
-            self.run("sudo a2enmod {}".format(m))
+        self.enable_apache_mods("ssl", "rewrite", "headers")
 
-        # disable all existing sites
-        self.run(
-            r"find /etc/apache2/sites-available/ -type f -exec basename '{}' \; | xargs -n 1 sudo a2dissite"
-        )
-        # then create the new sites and enable them
+        # create the new sites, they'll be the only ones enabled
         for site in self.args.site_name_and_root:
             site_name = site[0]
             full_document_root = os.path.join("/var/www", site[1])
             vhost_config = self._http(site_name, full_document_root)
 
-            crt, key = self.existing_cert(self.args.servername)
+            crt, key = self.existing_cert(site_name)
             vhost_config += self._https(site_name, full_document_root, crt, key)
 
             conf_file = "/etc/apache2/sites-available/{}.conf".format(site_name)
@@ -129,13 +122,11 @@ class VirtualHost(Bash):
                 info = "<?php phpinfo();"
 
             # enable this site
-
-            self.run("sudo a2ensite {}".format(site_name))
+            self.enable_apache_sites(site_name, only=True)
 
             self.info("Website", "https://{}".format(site_name))
             public_ip = self.run("hostname -I", capture=True)
             self.info("Public IP", f"http://{public_ip}")
             self.info("Root", full_document_root)
+            self.info("Cert", crt)
             self.info("Apache conf", conf_file)
-
-        self.restart_apache()
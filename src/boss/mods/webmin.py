@@ -1,5 +1,6 @@
 # run-shell-command :: ../../build.bash
 
+from ..apt import APT_INDEX
 from ..bash import Bash
 from ..errors import *
 
@@ -10,10 +11,14 @@ class Webmin(Bash):
     provides = ["webmin"]
     requires = ["apache2", "phpbin", "cert"]
     title = "Webmin console"
+    adds_apt_sources = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.apt_pkgs = ["webmin"]
+        self.downloads = [
+            ("http://www.webmin.com/jcameron-key.asc", "jcameron-key.asc")
+        ]
 
     def pre_install(self):
         # add webmin to sources.list, get PGP key
@@ -23,12 +28,11 @@ class Webmin(Bash):
             # 'wget http://www.webmin.com/jcameron-key.asc',
             # 'sudo apt-key add jcameron-key.asc',
         ]
-        self.curl("http://www.webmin.com/jcameron-key.asc", "jcameron-key.asc")
+        self.download(self.downloads)
         self.run("sudo apt-key add jcameron-key.asc")
         for cmd in cmds:
-            global APTUPDATED
-            APTUPDATED = False
             self.run(cmd)
+        APT_INDEX.source_added()
 
         self.info(
             "URL",
@@ -12,7 +12,7 @@ class Apache2(Bash):
     """
 
     provides = ["apache2"]
-    requires: list[str] = []
+    requires = []
     title = "Apache2"
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
@@ -32,7 +32,7 @@ class Nginx(Bash):
     """Stand-alone Nginx"""
 
     provides = ["nginx"]
-    requires: list[str] = []
+    requires = []
     title = "Nginx"
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
@@ -0,0 +1,196 @@
+from typing import Any, ClassVar
+
+from .apache import APACHE
+from .apt import APT_INDEX, DPKG, PREFETCH
+from .bash import Args, Bash, Settings, Snap
+from .download import DOWNLOADS
+from .events import EVENTS
+from .handlers import HANDLERS
+from .journal import JOURNAL, digest
+from .scheduler import Scheduler
+from .script import SCRIPT
+from .trace import TRACER
+from .util import notify, pretty_size, title
+
+
+class Packages(Bash):
+    """The apt and snap packages of every module in a plan."""
+
+    provides: ClassVar[list[str]] = []
+    requires: ClassVar[list[str]] = []
+    title = "Packages"
+
+
+class Services(Bash):
+    """Enables the Apache config and runs the restarts the modules asked for."""
+
+    provides: ClassVar[list[str]] = []
+    requires: ClassVar[list[str]] = []
+    title = "Services"
+
+
+class Plan:
+    """Run the wanted modules as one plan.
+
+    All the modules are instantiated up front so their packages can be
+    installed in a single apt transaction instead of one per module:
+
+    1. pre_install of every module, in MODS order.
+    2. One apt-get install with the packages of every module.
+    3. post_install of every module, in MODS order.
+    4. The Apache modules, confs and sites the modules asked for, in
+       one go, see ApacheConfig.  Then the service restarts they asked
+       for, once each, see Handlers.  Both also run before each serial
+       module, eg. Last.
+
+    Each hook and each command is recorded in the journal, and with
+    --resume the ones the previous run completed are skipped.  A skipped
+    hook's Apache config and restarts are asked for again, so they still
+    happen.
+
+    With more than one job, the hooks of modules that don't depend on
+    each other run at the same time, see Scheduler.
+
+    The packages are downloaded in the background while the pre_install
+    hooks run, once the leading serial modules (eg. AptProxy) have set
+    apt up.  The files the modules declare in their downloads are
+    fetched in the background from the start.
+    """
+
+    def __init__(self, mods: list[Any], args: Args) -> None:
+        self.args = args
+        self.apps: list[Bash] = [App(dry_run=args.dry_run, args=args) for App in mods]
+        for app in self.apps:
+            app.prefer_debs()
+        self.packages = Packages(dry_run=args.dry_run, args=args)
+        self.packages.apt_pkgs = self.apt_pkgs()
+        self.packages.snap_pkgs = self.snap_pkgs()
+        self.services = Services(dry_run=args.dry_run, args=args)
+
+    def apt_pkgs(self) -> list[str]:
+        """All the apt packages in module order without duplicates."""
+        packages: dict[str, None] = {}
+        for app in self.apps:
+            packages.update(dict.fromkeys(app.apt_pkgs))
+        return list(packages)
+
+    def snap_pkgs(self) -> list[tuple[str, Snap]]:
+        packages: dict[str, Snap] = {}
+        for app in self.apps:
+            for name, mode in app.snap_pkgs:
+                packages.setdefault(name, mode)
+        return list(packages.items())
+
+    def run(self) -> None:
+        # A script is generated one hook at a time, see ScriptWriter for
+        # how its independent sections run in parallel.
+        jobs = 1 if self.args.generate_script else self.args.jobs
+        scheduler = Scheduler(self.apps, jobs)
+        names = [type(i).__name__ for i in self.apps]
+        JOURNAL.open(self.args, names)
+        EVENTS.emit("run_start", servername=self.args.servername, modules=names)
+        status = 1
+        if self.args.generate_script:
+            SCRIPT.open(scheduler.waits)
+        try:
+            self.download()
+            setup = self.setup_apps()
+            for app in setup:
+                self.hook(app, "pre_install")
+            self.prefetch()
+            rest = [i for i in self.apps if i not in setup]
+            scheduler.run(lambda app: self.hook(app, "pre_install"), rest)
+
+            with SCRIPT.section(self.packages, "install"):
+                title(self.packages.title, script=self.args.generate_script)
+                if PREFETCH.thread:
+                    fetched = PREFETCH.wait()
+                    notify(f"Prefetched {pretty_size(fetched)} of packages")
+                self.step(self.packages, "install")
+
+            scheduler.run(lambda app: self.hook(app, "post_install"))
+            self.flush()
+            status = 0
+        finally:
+            scheduler.close()
+            SCRIPT.close()
+            JOURNAL.close(status)
+            EVENTS.emit("run_finish", status=status)
+            if self.args.profile:
+                TRACER.save(self.args.profile)
+
+    def setup_apps(self) -> list[Bash]:
+        """The serial modules at the start of the plan, eg. AptProxy and First."""
+        setup: list[Bash] = []
+        for app in self.apps:
+            if not type(app).serial:
+                break
+            setup.append(app)
+        return setup
+
+    def prefetch(self) -> None:
+        """Start downloading the plan's packages in the background."""
+        if self.args.dry_run or self.args.generate_script or self.args.remote:
+            return
+        batches = [DPKG.missing(app.apt_pkgs) for app in self.apps]
+        if not any(batches):
+            return
+        if APT_INDEX.needs_refresh(Settings.apt_lists_max_age):
+            # The index will be refreshed after the new sources are added,
+            # refreshing it now as well would do it twice.
+            if any(type(app).adds_apt_sources for app in self.apps):
+                return
+            title(self.packages.title, script=self.args.generate_script)
+            self.packages.apt_update()
+        PREFETCH.start(batches)
+
+    def download(self) -> None:
+        """Start fetching every module's downloads into the download cache."""
+        if self.args.dry_run or self.args.generate_script or self.args.remote:
+            return
+        DOWNLOADS.start([url for app in self.apps for url, _ in app.downloads])
+
+    def hook(self, app: Bash, name: str) -> None:
+        # Skip the title for modules that don't implement the hook
+        if getattr(type(app), name) is getattr(Bash, name):
+            return
+        if type(app).serial:
+            self.flush()
+        with SCRIPT.section(app, name):
+            title(app.title, script=self.args.generate_script)
+            self.step(app, name)
+
+    def flush(self) -> None:
+        """Apply the Apache config and run the restarts and reloads the
+        modules have asked for so far."""
+        if not (HANDLERS.pending or APACHE.wanted()):
+            return
+        with SCRIPT.section(self.services, "flush"):
+            title(self.services.title, script=self.args.generate_script)
+            # Never skipped by --resume, the hooks it skipped asked again
+            key = digest(JOURNAL.run_id, HANDLERS.flushes, "flush")
+            span = TRACER.span(self.services.title, "module", hook="flush")
+            with JOURNAL.module(self.services, "flush", key), span:
+                self.services.apply_apache()
+                self.services.flush_services()
+
+    def step(self, app: Bash, name: str) -> None:
+        """Run one of app's hooks unless the previous run completed it."""
+        key = JOURNAL.module_key(app, name)
+        if JOURNAL.skip(key, module=type(app).__name__, hook=name):
+            EVENTS.emit("module_skip", name=app.title, hook=name)
+            notify(f"{app.title} {name} was done in the previous run, skipped")
+            self.replay(JOURNAL.effects(key))
+            return
+        span = TRACER.span(app.title, "module", hook=name)
+        with JOURNAL.module(app, name, key), span:
+            getattr(app, name)()
+            app.flush_files()
+
+    def replay(self, effects: list[dict[str, Any]]) -> None:
+        """Ask again for what a skipped hook asked the plan to do."""
+        for effect in effects:
+            if effect["effect"] == "apache":
+                APACHE.enable(effect["kind"], *effect["names"], only=effect["only"])
+            elif effect["effect"] == "notify":
+                HANDLERS.notify(effect["service"], effect["action"])
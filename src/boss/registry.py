@@ -0,0 +1,114 @@
+import importlib
+from typing import Any, NamedTuple
+
+
+class Mod(NamedTuple):
+    """What the cli needs to know about a module without importing it.
+
+    The class is only imported with load(), once the module has been
+    selected.  check() makes sure this table matches the classes.
+    """
+
+    name: str
+    # Relative to the boss package
+    module: str
+    provides: tuple[str, ...] = ()
+    requires: tuple[str, ...] = ()
+    # The cli options that have to be given when the module is wanted
+    options: tuple[str, ...] = ()
+
+    def load(self) -> Any:
+        module = importlib.import_module(self.module, __package__)
+        return getattr(module, self.name)
+
+
+# All the mods available in the order they should be run
+MODS = (
+    Mod(
+        "AptProxy",
+        ".mods.aptproxy",
+        provides=("aptproxy",),
+        options=("host_ip",),
+    ),
+    Mod("First", ".mods.first", provides=("first",)),  # required
+    Mod(
+        "NewUserAsRoot",
+        ".mods.newuser",
+        provides=("newuserasroot",),
+        options=("new_system_user_and_pass",),
+    ),
+    Mod(
+        "Personalize",
+        ".mods.newuser",
+        provides=("personalize",),
+        requires=("first",),
+    ),
+    Mod("LetsEncryptCert", ".mods.cert", provides=("cert",)),
+    Mod("SelfCert", ".mods.cert", provides=("cert",)),
+    # Mod("Lamp", ".mods.lamp"),
+    Mod("Apache2", ".mods.webservers", provides=("apache2",)),
+    Mod("Nginx", ".mods.webservers", provides=("nginx",)),
+    Mod("PhpBin", ".mods.phpbin", provides=("phpbin",), requires=("apache2",)),
+    Mod(
+        "Mysql",
+        ".mods.databases",
+        provides=("mysql",),
+        options=("db_name", "db_root_pass"),
+    ),
+    Mod("Composer", ".mods.phpbin", provides=("composer",), requires=("phpbin",)),
+    Mod("Xdebug", ".mods.phpbin", provides=("xdebug",), requires=("phpbin",)),
+    Mod(
+        "PhpMyAdmin",
+        ".mods.databases",
+        provides=("phpmyadmin",),
+        requires=("apache2", "phpbin", "mysql"),
+        options=("db_root_pass",),
+    ),
+    Mod(
+        "Adminer",
+        ".mods.databases",
+        provides=("adminer",),
+        requires=("apache2", "phpbin", "mysql"),
+    ),
+    Mod(
+        "VirtualHost",
+        ".mods.virtualhost",
+        provides=("virtualhost",),
+        requires=("apache2", "cert"),
+        options=("site_name_and_root",),
+    ),
+    Mod("PhpInfo", ".mods.phpbin", provides=("phpinfo",), requires=("phpbin",)),
+    Mod(
+        "Craft",
+        ".mods.craft",
+        provides=("craft",),
+        requires=("apache2", "phpbin", "mysql", "composer", "virtualhost"),
+        options=("db_name", "new_db_user_and_pass", "site_name_and_root"),
+    ),
+    # Mod("FakeSMTP", ".mods.fakesmtp", provides=("fakesmtp",), requires=("phpbin",)),
+    Mod("Netdata", ".mods.netdata", provides=("netdata",), requires=("apache2",)),
+    Mod(
+        "Webmin",
+        ".mods.webmin",
+        provides=("webmin",),
+        requires=("apache2", "phpbin", "cert"),
+    ),
+    Mod("Bashrc", ".mods.bashrc", provides=("bashrc",)),
+    Mod("Last", ".mods.last", provides=("done",)),  # required
+)
+
+
+def get(name: str) -> Mod:
+    return next(i for i in MODS if i.name == name)
+
+
+def check() -> list[str]:
+    """Return how the table differs from the module classes, if it does."""
+    problems: list[str] = []
+    for mod in MODS:
+        cls = mod.load()
+        if tuple(cls.provides) != mod.provides:
+            problems.append(f"{mod.name}.provides is {cls.provides}")
+        if tuple(cls.requires) != mod.requires:
+            problems.append(f"{mod.name}.requires is {cls.requires}")
+    return problems
@@ -0,0 +1,75 @@
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from .bash import Bash
+
+
+class Scheduler:
+    """Run a hook of every module, in parallel where the modules allow it.
+
+    A module waits for the earlier modules that provide something it
+    requires.  Modules marked as serial (eg. First and Last) wait for
+    every module before them and every module after them waits for them.
+    Modules that don't depend on each other run at the same time on up
+    to `jobs` threads.  With one job everything runs in order in the
+    calling thread, exactly like a plain loop.
+
+    scheduler = Scheduler(apps, jobs=4)
+    scheduler.run(lambda app: app.pre_install())
+    scheduler.close()
+    """
+
+    def __init__(self, apps: list[Bash], jobs: int = 1) -> None:
+        self.apps = apps
+        self.jobs = jobs
+        self.waits = self.graph()
+        # One pool for every run so each thread keeps its shell session
+        self.pool = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+
+    def graph(self) -> dict[Bash, set[Bash]]:
+        """Map each module to the modules it has to wait for."""
+        waits: dict[Bash, set[Bash]] = {app: set() for app in self.apps}
+        for i, app in enumerate(self.apps):
+            requires = set(app.requires)
+            for earlier in self.apps[:i]:
+                if (
+                    type(app).serial
+                    or type(earlier).serial
+                    or requires.intersection(earlier.provides)
+                ):
+                    waits[app].add(earlier)
+        return waits
+
+    def run(self, hook: Callable[[Bash], None], apps: list[Bash] | None = None) -> None:
+        """Run hook for every module, or only for apps if given.
+
+        Modules that aren't in apps are treated as already done."""
+        pending = [i for i in self.apps if apps is None or i in apps]
+        if self.pool is None:
+            for app in pending:
+                hook(app)
+            return
+
+        done: set[Bash] = set(self.apps) - set(pending)
+        running: dict[Future[None], Bash] = {}
+        failure: BaseException | None = None
+        while pending or running:
+            # Stop starting modules after a failure but let running ones finish
+            if failure is None:
+                for app in [i for i in pending if self.waits[i] <= done]:
+                    pending.remove(app)
+                    running[self.pool.submit(hook, app)] = app
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done.add(running.pop(future))
+                # SystemExit from error() is caught by the pool as well
+                if future.exception() and failure is None:
+                    failure = future.exception()
+        if failure:
+            raise failure
+
+    def close(self) -> None:
+        if self.pool:
+            self.pool.shutdown()
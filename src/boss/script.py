@@ -0,0 +1,266 @@
+import io
+import re
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, TextIO
+
+from .util import display_cmd
+
+if TYPE_CHECKING:
+    from .bash import Bash
+
+# A sudo command that means the same thing when run by `sudo bash`: no
+# options, and nothing the calling shell would expand or redirect.
+SUDO_COMMAND = re.compile(r"^sudo (?!-)([^;&|<>$`~\\\n]+)$")
+
+# Run the parallel sections in the background with their output in logs,
+# sections that use apt or dpkg hold a lock so they run one at a time.
+HELPERS = r"""
+# Sections that don't depend on each other run at the same time, each
+# one's output is in $BOSS_LOGS/SECTION.log
+BOSS_LOGS=${BOSS_LOGS:-$(mktemp -d /tmp/boss-XXXXXX)}
+boss_pids=()
+boss_failed=0
+boss_start() {
+    local log="$BOSS_LOGS/$1.log"
+    if [ -n "$3" ]; then
+        ( flock 9; "$2" ) 9>"$BOSS_LOGS/dpkg.lock" >"$log" 2>&1 &
+    else
+        "$2" >"$log" 2>&1 &
+    fi
+    boss_pids+=("$!:$1")
+}
+boss_wait() {
+    local job
+    for job in "${boss_pids[@]}"; do
+        if ! wait "${job%%:*}"; then
+            echo "${job#*:} failed, see $BOSS_LOGS/${job#*:}.log" >&2
+            boss_failed=1
+        fi
+    done
+    boss_pids=()
+}
+"""
+
+
+@dataclass(eq=False)
+class Section:
+    """What one module hook added to the script."""
+
+    name: str
+    # Runs where it is, in the foreground, instead of as a background job
+    inline: bool
+    # The sections it has to wait for
+    after: list["Section"] = field(default_factory=list)
+    # ("text", str) or ("cmd", cmd, wrap, comment)
+    entries: list[tuple[Any, ...]] = field(default_factory=list)
+    dpkg: bool = False
+
+    def write(self, text: str) -> None:
+        if self.entries and self.entries[-1][0] == "text":
+            self.entries[-1] = ("text", self.entries[-1][1] + text)
+        else:
+            self.entries.append(("text", text))
+
+
+class ScriptWriter(io.TextIOBase):
+    """Collect a generated script by module hook, then write it in parallel.
+
+    While the plan runs, stdout is replaced by the writer so everything
+    a hook prints ends up in its section, as comments, and Bash.run()
+    adds its commands with command().  close() writes the script: sections that
+    don't depend on each other (see Scheduler.graph) become functions run
+    as background jobs, with a `boss_wait` barrier before the sections
+    that need them.  Serial modules and the package install run inline
+    and act as barriers too.
+
+    Consecutive plain sudo commands are merged into one `sudo bash` block.
+
+    SCRIPT.open(scheduler.waits)
+    with SCRIPT.section(app, "post_install"):
+        SCRIPT.command("sudo a2enmod rewrite")
+    SCRIPT.close()
+    """
+
+    encoding = "utf-8"
+    errors = "strict"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.stdout: TextIO | None = None
+        self.waits: dict["Bash", set["Bash"]] = {}
+        self.sections: list[Section] = []
+        # The section being added to, or the text between sections
+        self.current: Section | None = None
+        # Which section each module's latest hook went into
+        self.apps: dict["Bash", Section] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.stdout is not None
+
+    def open(self, waits: dict["Bash", set["Bash"]]) -> None:
+        self.waits = waits
+        sys.stdout.flush()
+        self.stdout = sys.stdout
+        sys.stdout = self  # type: ignore[assignment]
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: object) -> int:
+        # click checks if a stream is binary by writing b"" to it
+        if not isinstance(text, str):
+            raise TypeError(f"expected str, not {type(text).__name__}")
+        self.target().write(text)
+        return len(text)
+
+    def target(self) -> Section:
+        """The current section, or a new one for the text between sections."""
+        if self.current is None:
+            self.current = Section("text", inline=True)
+            self.sections.append(self.current)
+        return self.current
+
+    @contextmanager
+    def section(self, app: "Bash", hook: str) -> Iterator[None]:
+        """Put what's printed and run in the block in app's hook section."""
+        if not self.enabled:
+            yield
+            return
+        name = f"{type(app).__name__.lower()}-{hook}"
+        inline = app not in self.waits or type(app).serial
+        section = Section(name, inline=inline)
+        if not inline:
+            # Only the sections since the last inline one can be waited on
+            barrier = max(
+                (i for i, s in enumerate(self.sections) if s.inline), default=-1
+            )
+            recent = self.sections[barrier + 1 :]
+            section.after = [
+                self.apps[i]
+                for i in self.waits[app]
+                if i in self.apps and self.apps[i] in recent
+            ]
+        self.sections.append(section)
+        self.apps[app] = section
+        self.current = section
+        try:
+            yield
+        finally:
+            self.current = None
+
+    def command(
+        self, cmd: str, wrap: bool = True, comment: str = "", dpkg: bool = False
+    ) -> None:
+        section = self.target()
+        section.entries.append(("cmd", cmd, wrap, comment))
+        section.dpkg = section.dpkg or dpkg
+
+    def close(self) -> None:
+        """Restore stdout and write the script to it."""
+        if self.stdout is None:
+            return
+        sys.stdout = self.stdout
+        self.stdout = None
+        self.render()
+        self.sections = []
+        self.apps = {}
+
+    def render(self) -> None:
+        groups: list[list[Section]] = []
+        for section in self.sections:
+            if section.inline:
+                groups.append([section])
+            elif groups and not groups[-1][0].inline:
+                groups[-1].append(section)
+            else:
+                groups.append([section])
+        schedule = [level for group in groups for level in levels(group)]
+        parallel = any(len(i) > 1 for i in schedule)
+        if parallel:
+            sys.stdout.write(HELPERS)
+
+        count = 0
+        for level in schedule:
+            jobs = [i for i in level if any(e[0] == "cmd" for e in i.entries)]
+            # A section on its own might as well run in the foreground
+            if len(jobs) < 2:
+                for section in level:
+                    self.render_entries(section)
+                continue
+            for section in level:
+                if section not in jobs:
+                    self.render_entries(section)
+                    continue
+                count += 1
+                section.name = f"{count:02}-{section.name}"
+                function = "section_" + section.name.replace("-", "_")
+                sys.stdout.write(f"\n{function}() {{\n")
+                self.render_entries(section)
+                sys.stdout.write("}\n")
+                dpkg = " dpkg" if section.dpkg else ""
+                sys.stdout.write(f"boss_start {section.name} {function}{dpkg}\n")
+            sys.stdout.write("boss_wait\n")
+        if parallel:
+            sys.stdout.write('\n[ "$boss_failed" -eq 0 ]\n')
+        sys.stdout.flush()
+
+    def render_entries(self, section: Section) -> None:
+        for entry in merge_sudo(section.entries):
+            if entry[0] == "text":
+                sys.stdout.write(commented(entry[1]))
+            else:
+                _, cmd, wrap, comment = entry
+                display_cmd(cmd, wrap=wrap, script=True, comment=comment)
+
+
+def commented(text: str) -> str:
+    """Make text comments, so only the commands in a section run."""
+    return "".join(
+        line if not line.strip() or line.lstrip().startswith("#") else f"# {line}"
+        for line in text.splitlines(keepends=True)
+    )
+
+
+def levels(group: list[Section]) -> list[list[Section]]:
+    """Split sections into the ones that can start together, in order."""
+    depth: dict[Section, int] = {}
+    for section in group:
+        after = [depth[i] for i in section.after if i in depth]
+        depth[section] = max(after, default=-1) + 1
+    result: list[list[Section]] = []
+    for section in group:
+        level = depth[section]
+        while len(result) <= level:
+            result.append([])
+        result[level].append(section)
+    return result
+
+
+def merge_sudo(entries: list[tuple[Any, ...]]) -> list[tuple[Any, ...]]:
+    """Merge runs of plain sudo commands into one `sudo bash` heredoc."""
+    merged: list[tuple[Any, ...]] = []
+    run: list[tuple[Any, ...]] = []
+
+    def flush() -> None:
+        if len(run) > 1:
+            body = "\n".join(SUDO_COMMAND.sub(r"\1", i[1]) for i in run)
+            merged.append(("cmd", f"sudo bash -x <<'SUDO'\n{body}\nSUDO", False, ""))
+        else:
+            merged.extend(run)
+        run.clear()
+
+    for entry in entries:
+        if entry[0] == "cmd" and not entry[3] and SUDO_COMMAND.match(entry[1]):
+            run.append(entry)
+            continue
+        flush()
+        merged.append(entry)
+    flush()
+    return merged
+
+
+SCRIPT = ScriptWriter()
@@ -0,0 +1,285 @@
+import atexit
+import os
+import re
+import secrets
+import select
+import shlex
+import subprocess
+import tempfile
+import threading
+
+from .errors import CommandError
+
+# Shell operators that make a command more than a single simple command
+CONTROL_OPERATORS = {";", ";;", "&", "&&", "|", "||", "|&", "(", ")"}
+# Nothing can be typed into a remote command, so fail instead of prompting
+SSH_OPTIONS = ["-o", "BatchMode=yes", "-o", "ServerAliveInterval=30"]
+
+
+class Subprocess:
+    """Run every command in a new bash process."""
+
+    def run(
+        self, cmd: str, capture: bool = False, input: bytes | None = None
+    ) -> bytes | int:
+        if capture:
+            return subprocess.check_output(
+                cmd, shell=True, executable="/bin/bash", input=input
+            )
+        if input is None:
+            return subprocess.check_call(cmd, shell=True, executable="/bin/bash")
+        subprocess.run(cmd, shell=True, executable="/bin/bash", input=input, check=True)
+        return 0
+
+    def close(self) -> None:
+        return
+
+
+class Session:
+    """A long-lived bash process that commands are sent to over a pipe.
+
+    Each command runs in a subshell so a `cd` or `exit` can't change the
+    session.  When it's done, its exit status is written to a fifo
+    followed by a random sentinel, along with its output if it's being
+    captured.  The fifo is used instead of an inherited pipe because sudo
+    closes every file descriptor above stderr.
+
+    A command's input is sent to the session right after the command.
+    bash reads a pipe a byte at a time, so `head -c` gets exactly the
+    input and the session carries on from the next command.
+    """
+
+    def __init__(self, sudo: bool = False) -> None:
+        self.sentinel = secrets.token_hex(16)
+        self.tmpdir = tempfile.mkdtemp(prefix="boss-")
+        self.fifo = os.path.join(self.tmpdir, "reply")
+        os.mkfifo(self.fifo, 0o600)
+        # Opening read-write never blocks and there's always a writer so
+        # reads wait for data instead of returning EOF.
+        self.reply = os.open(self.fifo, os.O_RDWR)
+
+        argv = ["bash", "--noprofile", "--norc"]
+        if sudo:
+            argv = ["sudo", "--"] + argv
+        self.process = subprocess.Popen(argv, stdin=subprocess.PIPE)
+        self._send(
+            f"exec 3>{shlex.quote(self.fifo)}\n"
+            "if { : </dev/tty; } 2>/dev/null; then BOSS_STDIN=/dev/tty; "
+            "else BOSS_STDIN=/dev/null; fi\n"
+            'BOSS_HOME="$HOME" BOSS_USER="$USER"\n'
+        )
+
+    def run(
+        self, cmd: str, capture: bool = False, input: bytes | None = None
+    ) -> tuple[int, bytes]:
+        redirect = ">&3" if capture else ""
+        reply = f'printf "%s %d\\n" {self.sentinel} "$?" >&3\n'
+        if input is None:
+            self._send(
+                f'( eval {shlex.quote(cmd)} ) <"$BOSS_STDIN" {redirect}; {reply}'
+            )
+        else:
+            # What the command doesn't read is read by cat, so none of the
+            # input is left to be run as commands.
+            self._send(
+                f"head -c {len(input)} | {{ ( eval {shlex.quote(cmd)} ) {redirect}; "
+                f"status=$?; cat >/dev/null; exit $status; }}; {reply}",
+                input,
+            )
+        return self._read_reply()
+
+    def close(self) -> None:
+        if self.process.poll() is None and self.process.stdin:
+            self.process.stdin.close()
+            self.process.wait()
+        os.close(self.reply)
+        os.unlink(self.fifo)
+        os.rmdir(self.tmpdir)
+
+    def _send(self, text: str, input: bytes = b"") -> None:
+        if self.process.stdin is None or self.process.poll() is not None:
+            raise CommandError("The shell session has exited.")
+        self.process.stdin.write(text.encode() + input)
+        self.process.stdin.flush()
+
+    def _read_reply(self) -> tuple[int, bytes]:
+        sentinel = self.sentinel.encode()
+        data = b""
+        while True:
+            ready, _, _ = select.select([self.reply], [], [], 0.5)
+            if not ready:
+                if self.process.poll() is not None:
+                    raise CommandError("The shell session has exited.")
+                continue
+            data += os.read(self.reply, 65536)
+            index = data.find(sentinel)
+            if index >= 0 and data.find(b"\n", index) >= 0:
+                status = int(data[index + len(sentinel) :].split()[0])
+                return status, data[:index]
+
+
+class Sessions:
+    """Run commands in two long-lived shells, one as the user and one as root.
+
+    Commands of the form `sudo <simple command>` are run in the root
+    shell without the sudo, so sudo and its PAM checks are only run once
+    per Sessions.  Each thread has its own, see executor(), so with
+    --jobs every worker starts its own root shell.
+    $HOME and $USER still expand to the user's values as they would have
+    without the session.  Anything else runs in the user's shell.
+    """
+
+    def __init__(self) -> None:
+        self.user = Session()
+        self.root: Session | None = self.user if os.geteuid() == 0 else None
+
+    def run(
+        self, cmd: str, capture: bool = False, input: bytes | None = None
+    ) -> bytes | int:
+        root_cmd = strip_sudo(cmd)
+        if root_cmd is None:
+            status, output = self.user.run(cmd, capture, input)
+        else:
+            if self.root is None:
+                self.root = Session(sudo=True)
+            home = shlex.quote(os.path.expanduser("~"))
+            user = shlex.quote(os.environ.get("USER", ""))
+            root_cmd = f"HOME=$BOSS_HOME USER=$BOSS_USER {root_cmd}"
+            status, output = self.root.run(
+                f"HOME={home} USER={user}; {root_cmd}", capture, input
+            )
+        if status:
+            raise subprocess.CalledProcessError(status, cmd, output)
+        return output if capture else status
+
+    def close(self) -> None:
+        if self.root and self.root is not self.user:
+            self.root.close()
+        self.user.close()
+
+
+class Remote:
+    """Run every command on another machine over one ssh connection.
+
+    The first command starts an ssh ControlMaster for the host and every
+    command runs as a new session on it, so the host is connected to and
+    authenticated with once however many commands are run, including
+    ones run at the same time.  sudo has to work without a password on
+    the host since nothing can be typed in.
+
+    The local transport runs the commands with bash on this machine
+    instead, a stand-in for a host that doesn't need ssh or a network.
+    """
+
+    def __init__(self, host: str, transport: str = "ssh") -> None:
+        self.host = host
+        self.transport = transport
+        self.tmpdir = tempfile.mkdtemp(prefix="boss-ssh-")
+        self.control = os.path.join(self.tmpdir, "control")
+        self.connected = False
+        self.lock = threading.Lock()
+
+    def argv(self, cmd: str) -> list[str]:
+        if self.transport == "local":
+            return ["bash", "-c", cmd]
+        # ssh joins its arguments into one command for the remote shell
+        remote_cmd = "bash -c " + shlex.quote(cmd)
+        return ["ssh", *SSH_OPTIONS, "-S", self.control, self.host, "--", remote_cmd]
+
+    def connect(self) -> None:
+        with self.lock:
+            if self.connected or self.transport == "local":
+                return
+            # -f returns once it's authenticated, leaving the master running
+            master = ["ssh", *SSH_OPTIONS, "-M", "-N", "-f", "-S", self.control]
+            result = subprocess.run(
+                [*master, self.host], stdin=subprocess.DEVNULL, check=False
+            )
+            if result.returncode:
+                raise CommandError(f"ssh couldn't connect to {self.host}")
+            self.connected = True
+
+    def run(
+        self, cmd: str, capture: bool = False, input: bytes | None = None
+    ) -> bytes | int:
+        self.connect()
+        stdout = subprocess.PIPE if capture else None
+        if input is None:
+            result = subprocess.run(
+                self.argv(cmd), stdin=subprocess.DEVNULL, stdout=stdout, check=False
+            )
+        else:
+            # ssh sends the input to the command on the host
+            result = subprocess.run(
+                self.argv(cmd), input=input, stdout=stdout, check=False
+            )
+        if result.returncode:
+            raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout)
+        return result.stdout if capture else 0
+
+    def close(self) -> None:
+        if self.connected:
+            exit_master = ["ssh", "-S", self.control, "-O", "exit", self.host]
+            subprocess.run(exit_master, stderr=subprocess.DEVNULL, check=False)
+            self.connected = False
+        if os.path.exists(self.control):
+            os.unlink(self.control)
+        os.rmdir(self.tmpdir)
+
+
+def strip_sudo(cmd: str) -> str | None:
+    """Return the command without its sudo if it's a simple sudo command.
+
+    `sudo cp a b` returns `cp a b`.  None is returned for commands that
+    don't start with sudo, that pass sudo any options, or that are more
+    than one command, eg. `sudo cp a b && rm a`.
+    """
+    match = re.match(r"sudo\s+(?=[^-\s])", cmd)
+    if not match:
+        return None
+    rest = cmd[match.end() :]
+    # An unescaped newline separates commands too
+    if re.search(r"(?<!\\)\n", rest):
+        return None
+    lexer = shlex.shlex(rest, posix=True, punctuation_chars=True)
+    try:
+        if CONTROL_OPERATORS.intersection(lexer) or "`" in rest or "$(" in rest:
+            return None
+    except ValueError:
+        return None
+    return rest
+
+
+_local = threading.local()
+_executors: list[Subprocess | Sessions | Remote] = []
+_lock = threading.Lock()
+_remote: Remote | None = None
+
+
+def connect(host: str, transport: str = "ssh") -> None:
+    """Run every command on host from now on, see Remote."""
+    global _remote
+    with _lock:
+        _remote = Remote(host, transport)
+        _executors.append(_remote)
+
+
+def executor(session: bool = True) -> Subprocess | Sessions | Remote:
+    """The executor for the current thread, each thread has its own session."""
+    if _remote is not None:
+        return _remote
+    name = "sessions" if session else "subprocess"
+    current: Subprocess | Sessions | None = getattr(_local, name, None)
+    if current is None:
+        current = Sessions() if session else Subprocess()
+        setattr(_local, name, current)
+        with _lock:
+            _executors.append(current)
+    return current
+
+
+@atexit.register
+def close() -> None:
+    with _lock:
+        while _executors:
+            _executors.pop().close()
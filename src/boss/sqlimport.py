@@ -0,0 +1,621 @@
+import contextlib
+import gzip
+import lzma
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, BinaryIO
+
+from .errors import CommandError, DependencyError
+from .trace import TRACER
+
+# A line with nothing but whitespace or a -- or # comment
+COMMENT_LINE = re.compile(rb"\s*(?:(?:--\s|#).*)?", re.DOTALL)
+DELIMITER_COMMAND = re.compile(rb"\s*delimiter\s+(\S+)\s*$", re.IGNORECASE)
+# The rest of a quoted string or identifier, up to and including its quote
+QUOTE_END = {
+    b"'": re.compile(rb"[^'\\]*(?:\\.[^'\\]*)*'", re.DOTALL),
+    b'"': re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL),
+    b"`": re.compile(rb"[^`]*`"),
+}
+
+# Whitespace and comments before a statement, but not /*!...*/ since
+# MySQL runs what's in those.
+LEADING = rb"(?:\s+|/\*(?!!).*?\*/|(?:--\s|#)[^\n]*\n)*"
+NAME = rb"((?:`(?:[^`]|``)+`|\w+)(?:\.(?:`(?:[^`]|``)+`|\w+))?)"
+# The statements of a mysqldump that only touch the one table they name
+TABLE_STATEMENTS = [
+    re.compile(LEADING + head + NAME + tail, re.IGNORECASE | re.DOTALL)
+    for head, tail in [
+        (rb"DROP\s+TABLE\s+IF\s+EXISTS\s+", rb"\s*$"),
+        (rb"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?", rb"\s*\("),
+        (rb"LOCK\s+TABLES\s+", rb"\s+WRITE\s*$"),
+        (rb"/\*!\d+\s+ALTER\s+TABLE\s+", rb"\s+(?:DISABLE|ENABLE)\s+KEYS\s*\*/$"),
+        (
+            rb"(?:INSERT|REPLACE)\s+(?:IGNORE\s+)?INTO\s+",
+            rb"\s*(?:\([^()]*\)\s*)?VALUES?\s*\(",
+        ),
+    ]
+]
+CREATE_TABLE = re.compile(LEADING + rb"CREATE\s+TABLE\b", re.IGNORECASE | re.DOTALL)
+# Statements that only change the connection's settings, which every
+# connection has to run.  SET GLOBAL and the like only run once.
+SESSION = re.compile(
+    LEADING + rb"(?:/\*!\d+\s*)?(?:USE\s|SET\s+(?!(?:GLOBAL|PERSIST(?:_ONLY)?|PASSWORD"
+    rb"|(?:DEFAULT\s+)?ROLE)\b|@@(?:GLOBAL|PERSIST)))",
+    re.IGNORECASE | re.DOTALL,
+)
+USE = re.compile(LEADING + rb"(?:/\*!\d+\s*)?USE\s+" + NAME, re.IGNORECASE | re.DOTALL)
+UNLOCK = re.compile(LEADING + rb"UNLOCK\s+TABLES\s*$", re.IGNORECASE | re.DOTALL)
+
+# In a CREATE TABLE from mysqldump, one column or key per line
+SECONDARY_KEY = re.compile(rb"\s+(?:UNIQUE\s+)?KEY\s+`")
+FOREIGN_KEY = re.compile(rb"\s+(?:CONSTRAINT|FOREIGN\s+KEY)\b", re.IGNORECASE)
+AUTO_INCREMENT_COLUMN = re.compile(
+    rb"\s+(`(?:[^`]|``)+`)\s.*\bAUTO_INCREMENT\b", re.IGNORECASE
+)
+PRIMARY_KEY = re.compile(rb"\s+PRIMARY\s+KEY\s", re.IGNORECASE)
+
+# What each table's connection runs before its statements and after them.
+# The checks are off and the rows are committed a table at a time.
+LOAD_START = b"SET foreign_key_checks=0, unique_checks=0, autocommit=0"
+LOAD_END = b"COMMIT"
+
+# The programs that decompress a dump, by its suffix
+DECOMPRESS = {".gz": "gzip", ".xz": "xz", ".zst": "zstd"}
+
+
+def decompress_command(sql_file: str | Path) -> str | None:
+    """The command that writes a compressed dump's SQL to stdout.
+
+    None if sql_file isn't compressed."""
+    program = DECOMPRESS.get(Path(sql_file).suffix)
+    return f"{program} -dc {sql_file}" if program else None
+
+
+@dataclass
+class Statement:
+    text: bytes
+    delimiter: bytes = b";"
+
+
+class Splitter:
+    """Split SQL into statements, a line at a time.
+
+    A statement ends at the delimiter when it's not in a quoted string,
+    a quoted identifier or a comment.  DELIMITER commands change the
+    delimiter as they do for the mysql client, and whole line comments
+    between statements are dropped.
+
+    splitter = Splitter()
+    for line in dump:
+        for statement in splitter.feed(line):
+            ...
+    statements = splitter.finish()
+    """
+
+    def __init__(self) -> None:
+        # The statement so far
+        self.parts: list[bytes] = []
+        # The quote of the string or identifier the last line ended in
+        self.quote: bytes | None = None
+        # If the last line ended in a /* comment
+        self.comment = False
+        self.set_delimiter(b";")
+
+    def set_delimiter(self, delimiter: bytes) -> None:
+        self.delimiter = delimiter
+        first = re.escape(delimiter[:1])
+        # Everything up to the delimiter or the start of a comment, with
+        # whole strings and identifiers skipped in one go.  The loops are
+        # unrolled, runs of ordinary bytes are much faster to match.
+        text = rb"[^'\"`/#\-" + first + rb"]*"
+        alternatives = [
+            rb"'[^'\\]*(?:\\.[^'\\]*)*'",
+            rb'"[^"\\]*(?:\\.[^"\\]*)*"',
+            rb"`[^`]*`",
+            rb"/(?!\*)",
+            rb"-(?!-\s)",
+        ]
+        if len(delimiter) > 1:
+            alternatives.append(first)
+        self.plain = re.compile(
+            text
+            + rb"(?:(?!"
+            + re.escape(delimiter)
+            + rb")(?:"
+            + rb"|".join(alternatives)
+            + rb")"
+            + text
+            + rb")*",
+            re.DOTALL,
+        )
+
+    def feed(self, line: bytes) -> list[Statement]:
+        """The statements line finishes."""
+        if not self.parts and self.quote is None and not self.comment:
+            if COMMENT_LINE.fullmatch(line):
+                return []
+            command = DELIMITER_COMMAND.match(line)
+            if command:
+                self.set_delimiter(command[1])
+                return []
+        statements = []
+        start = pos = 0
+        while pos < len(line):
+            if self.quote is not None:
+                match = QUOTE_END[self.quote].match(line, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                self.quote = None
+            elif self.comment:
+                close = line.find(b"*/", pos)
+                if close < 0:
+                    break
+                pos = close + 2
+                self.comment = False
+            else:
+                match = self.plain.match(line, pos)
+                # It matches nothing when there's nothing plain
+                assert match
+                pos = match.end()
+                if line.startswith(self.delimiter, pos):
+                    self.parts.append(line[start:pos])
+                    text = b"".join(self.parts).strip()
+                    self.parts = []
+                    if text:
+                        statements.append(Statement(text, self.delimiter))
+                    pos = start = pos + len(self.delimiter)
+                elif line.startswith((b"'", b'"', b"`"), pos):
+                    # A string that goes on to the next line
+                    self.quote = line[pos : pos + 1]
+                    pos += 1
+                elif line.startswith(b"/*", pos):
+                    self.comment = True
+                    pos += 2
+                else:
+                    # A -- or # comment, to the end of the line
+                    break
+        rest = line[start:]
+        if self.parts or not COMMENT_LINE.fullmatch(rest):
+            self.parts.append(rest)
+        return statements
+
+    def finish(self) -> list[Statement]:
+        """The last statement, if it doesn't end with a delimiter."""
+        text = b"".join(self.parts).strip()
+        self.parts = []
+        return [Statement(text, self.delimiter)] if text else []
+
+
+def statements(lines: Iterable[bytes]) -> Iterator[Statement]:
+    splitter = Splitter()
+    for line in lines:
+        yield from splitter.feed(line)
+    yield from splitter.finish()
+
+
+class StatementWriter:
+    """Write statements for the mysql client, with DELIMITER commands."""
+
+    def __init__(self, stream: IO[bytes]) -> None:
+        self.stream = stream
+        self.delimiter = b";"
+
+    def use(self, delimiter: bytes) -> None:
+        if delimiter != self.delimiter:
+            self.stream.write(b"DELIMITER " + delimiter + b"\n")
+            self.delimiter = delimiter
+
+    def write(self, statement: Statement) -> int:
+        self.use(statement.delimiter)
+        self.stream.write(statement.text + statement.delimiter + b"\n")
+        return len(statement.text)
+
+
+class Chunk:
+    """Statements that run on one connection, a table's or a batch of others.
+
+    The statements before the table's data are kept, so its CREATE TABLE
+    can be changed, and the rest are spooled to a file, which is open
+    while the chunk is entered or until close().
+    """
+
+    def __init__(self, table: bytes | None, prologue: list[Statement], path: Path):
+        self.table = table
+        self.prologue = list(prologue)
+        self.head: list[Statement] = []
+        self.path = path
+        self.data = table is None
+        self.size = 0
+        self.statements = 0
+        # UNLOCK TABLES, the table's data is all there
+        self.done = False
+
+    def add(self, statement: Statement) -> None:
+        self.statements += 1
+        if not self.data and not CREATE_TABLE.match(statement.text):
+            self.data = any(i.match(statement.text) for i in TABLE_STATEMENTS[2:])
+        if self.data:
+            self.size += self.writer.write(statement)
+        else:
+            self.head.append(statement)
+
+    def __enter__(self) -> "Chunk":
+        self.file = open(self.path, "wb")
+        self.writer = StatementWriter(self.file)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def defer_indexes(self) -> list[Statement]:
+        """Take the secondary indexes out of the CREATE TABLE.
+
+        Returns the ALTER TABLE that adds them once the rows are in, which
+        builds each index in one sorted pass instead of a row at a time.
+        Only done for InnoDB tables as mysqldump writes them, without
+        foreign keys, whose indexes would be made for them, or an
+        AUTO_INCREMENT column outside the primary key.
+        """
+        for i, statement in enumerate(self.head):
+            if CREATE_TABLE.match(statement.text):
+                break
+        else:
+            return []
+        text = statement.text
+        start = text.find(b"(\n")
+        end = text.rfind(b"\n)")
+        if start < 0 or end < start or b"ENGINE=InnoDB" not in text[end:]:
+            return []
+        lines = text[start + 2 : end].split(b",\n")
+        keys = [i for i in lines if SECONDARY_KEY.match(i)]
+        if not keys or any(FOREIGN_KEY.match(i) for i in lines):
+            return []
+        primary = b"".join(i for i in lines if PRIMARY_KEY.match(i))
+        for line in lines:
+            column = AUTO_INCREMENT_COLUMN.match(line)
+            if column and column[1] not in primary:
+                return []
+        kept = [i for i in lines if i not in keys]
+        create = text[: start + 2] + b",\n".join(kept) + text[end:]
+        self.head[i] = Statement(create, statement.delimiter)
+        name = TABLE_STATEMENTS[1].match(text)[1]  # type: ignore[index]
+        adds = b", ".join(b"ADD " + i.strip() for i in keys)
+        return [Statement(b"ALTER TABLE " + name + b" " + adds)]
+
+
+class Dump:
+    """A dump's lines, decompressed as they're read if it's compressed.
+
+    gzip and xz dumps are decompressed here and zstd ones by the zstd
+    command, nothing is written to disk.  position() is how much of the
+    file has been read, which is how far the import has got.
+
+    with Dump("dump.sql.gz") as dump:
+        for line in dump:
+            ...
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.size = self.path.stat().st_size
+        self.process: subprocess.Popen[bytes] | None = None
+        # If every line has been read
+        self.finished = False
+
+    def __enter__(self) -> "Dump":
+        self.file = open(self.path, "rb")
+        suffix = self.path.suffix
+        self.stream: BinaryIO
+        if suffix == ".gz":
+            self.stream = gzip.GzipFile(fileobj=self.file)  # type: ignore[assignment]
+        elif suffix == ".xz":
+            self.stream = lzma.LZMAFile(self.file)  # type: ignore[assignment]
+        elif suffix == ".zst":
+            # zstd reads the file through the same descriptor, so
+            # position() still works
+            try:
+                self.process = subprocess.Popen(
+                    ["zstd", "-dc"], stdin=self.file, stdout=subprocess.PIPE
+                )
+            except FileNotFoundError:
+                self.file.close()
+                raise DependencyError(f"zstd is needed to read {self.path}")
+            self.stream = self.process.stdout  # type: ignore[assignment]
+        else:
+            self.stream = self.file
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        try:
+            if self.process:
+                if not self.finished:
+                    self.process.kill()
+                status = self.process.wait()
+                if status and self.finished:
+                    raise CommandError(
+                        f"Reading {self.path} failed, zstd exited {status}"
+                    )
+        finally:
+            self.stream.close()
+            self.file.close()
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            yield from self.stream
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            raise CommandError(f"Reading {self.path} failed: {e}")
+        self.finished = True
+
+    def position(self) -> int:
+        return os.lseek(self.file.fileno(), 0, os.SEEK_CUR)
+
+
+@dataclass
+class ImportStats:
+    tables: int = 0
+    statements: int = 0
+    # Bytes of statements
+    size: int = 0
+    seconds: float = 0.0
+    deferred: list[str] = field(default_factory=list)
+    # Bytes of the dump's file read so far, and all of them, which are
+    # fewer than size when it's compressed
+    read: int = 0
+    file_size: int = 0
+
+    @property
+    def rate(self) -> float:
+        """Bytes of statements a second."""
+        return self.size / self.seconds if self.seconds else 0.0
+
+    @property
+    def statement_rate(self) -> float:
+        return self.statements / self.seconds if self.seconds else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """Seconds until the whole dump has been read."""
+        if not self.read or not self.seconds:
+            return None
+        return self.seconds * (self.file_size - self.read) / self.read
+
+
+class SqlImport:
+    """Import a SQL dump over several connections, a table on each.
+
+    The dump is read once and split into statements.  Each table's
+    statements (mysqldump's DROP TABLE, CREATE TABLE, LOCK TABLES, its
+    INSERTs and UNLOCK TABLES) are spooled to a file and loaded by their
+    own mysql client while the next tables are read, with foreign key
+    and unique checks off and a commit per table.  A big InnoDB table
+    gets its secondary indexes after its rows, see Chunk.defer_indexes().
+
+    Every connection first runs the SET and USE statements that came
+    before its table, so it has the same settings as a serial import.
+    Anything else, eg. views, triggers and routines, runs on its own
+    once the tables before it are loaded and before the tables after
+    it start, so the result is what `mysql < dump.sql` gives.
+
+    The dump can be compressed, see Dump, and progress is called with
+    the stats every interval seconds while it's read.
+
+    SqlImport(["mysql", "--defaults-extra-file=root.cnf"], 8).run("dump.sql")
+    """
+
+    def __init__(
+        self,
+        client: list[str],
+        connections: int,
+        defer_indexes: int = 64 * 1024 * 1024,
+        module: str = "",
+        progress: Callable[[ImportStats], None] | None = None,
+        interval: float = 5.0,
+    ) -> None:
+        self.client = client
+        self.connections = connections
+        # Only tables with more bytes of SQL than this get their indexes later
+        self.defer_indexes = defer_indexes
+        self.module = module
+        self.progress = progress
+        self.interval = interval
+        self.stats = ImportStats()
+        self.failed: list[str] = []
+        self.lock = threading.Lock()
+        # Bounds how far reading gets ahead of loading, and so the spool
+        self.slots = threading.Semaphore(connections * 2)
+
+    def run(self, sql_file: str | Path) -> ImportStats:
+        self.start = self.next_report = time.perf_counter()
+        self.next_report += self.interval
+        spool = Path(tempfile.mkdtemp(prefix="boss-sql-"))
+        try:
+            with Dump(sql_file) as self.dump:
+                self.stats.file_size = self.dump.size
+                self.load(statements(self.dump), spool)
+                self.stats.read = self.dump.position()
+        finally:
+            shutil.rmtree(spool, ignore_errors=True)
+        self.stats.seconds = time.perf_counter() - self.start
+        if self.failed:
+            raise CommandError(f"Importing {', '.join(self.failed)} failed")
+        return self.stats
+
+    def load(self, dump: Iterable[Statement], spool: Path) -> None:
+        prologue: list[Statement] = []
+        database = b""
+        chunk: Chunk | None = None
+        # Tables with a chunk that's loading
+        loading: set[bytes] = set()
+        futures: list[Future[None]] = []
+        count = 0
+
+        # Closes the spool files if reading the dump fails
+        with (
+            ThreadPoolExecutor(self.connections) as pool,
+            contextlib.ExitStack() as files,
+        ):
+
+            def submit(chunk: Chunk) -> None:
+                chunk.close()
+                self.slots.acquire()
+                futures.append(pool.submit(self.load_chunk, chunk))
+
+            def barrier() -> None:
+                wait(futures)
+                for future in futures:
+                    future.result()
+                futures.clear()
+                loading.clear()
+
+            for statement in dump:
+                if self.failed:
+                    break
+                text = statement.text
+                self.stats.statements += 1
+                self.stats.size += len(text)
+                if self.progress and time.perf_counter() >= self.next_report:
+                    self.report()
+                table = self.table(statement, database)
+                if table is not None:
+                    if chunk and chunk.table == table and not chunk.done:
+                        chunk.add(statement)
+                        continue
+                    if chunk:
+                        if chunk.table is None:
+                            barrier()
+                            self.load_chunk(chunk, close=True)
+                        else:
+                            submit(chunk)
+                    if table in loading:
+                        barrier()
+                    count += 1
+                    path = spool / f"{count:06}.sql"
+                    chunk = files.enter_context(Chunk(table, prologue, path))
+                    chunk.add(statement)
+                    loading.add(table)
+                    self.stats.tables += 1
+                elif chunk and chunk.table and not chunk.done and UNLOCK.match(text):
+                    chunk.add(statement)
+                    chunk.done = True
+                elif (
+                    chunk
+                    and chunk.table
+                    and not chunk.data
+                    and SESSION.match(text)
+                    and not USE.match(text)
+                ):
+                    # The SETs around mysqldump's CREATE TABLE are only
+                    # about the table
+                    chunk.add(statement)
+                elif SESSION.match(text):
+                    # The tables after it need it, so the one before ends
+                    if chunk and chunk.table is not None:
+                        submit(chunk)
+                        chunk = None
+                    prologue.append(statement)
+                    use = USE.match(text)
+                    if use:
+                        database = use[1].strip(b"`")
+                    if chunk:
+                        chunk.add(statement)
+                else:
+                    # Runs alone, after every table before it
+                    if chunk is None or chunk.table is not None:
+                        if chunk:
+                            submit(chunk)
+                        count += 1
+                        path = spool / f"{count:06}.sql"
+                        chunk = files.enter_context(Chunk(None, prologue, path))
+                    chunk.add(statement)
+            if chunk and not self.failed:
+                if chunk.table is None:
+                    barrier()
+                    self.load_chunk(chunk, close=True)
+                else:
+                    submit(chunk)
+            elif chunk:
+                chunk.close()
+            barrier()
+
+    def report(self) -> None:
+        now = time.perf_counter()
+        self.next_report = now + self.interval
+        self.stats.seconds = now - self.start
+        self.stats.read = self.dump.position()
+        self.progress(self.stats)  # type: ignore[misc]
+
+    def table(self, statement: Statement, database: bytes) -> bytes | None:
+        """The table a statement is only about, with its database."""
+        for pattern in TABLE_STATEMENTS:
+            match = pattern.match(statement.text)
+            if match:
+                name = match[1].replace(b"`", b"")
+                return name if b"." in name else database + b"." + name
+        return None
+
+    def load_chunk(self, chunk: Chunk, close: bool = False) -> None:
+        """Run a chunk's statements on a new connection."""
+        if close:
+            chunk.close()
+            self.slots.acquire()
+        try:
+            if chunk.table is None:
+                name = "statements"
+                start: list[Statement] = []
+                end: list[Statement] = []
+            else:
+                name = chunk.table.decode(errors="replace")
+                start = [Statement(LOAD_START)]
+                end = [Statement(LOAD_END)]
+                if chunk.size > self.defer_indexes:
+                    alter = chunk.defer_indexes()
+                    if alter:
+                        end = alter + end
+                        with self.lock:
+                            self.stats.deferred.append(name)
+            cmd = f"mysql < {name}"
+            with TRACER.span(f"import {name}", "command", module=self.module, cmd=cmd):
+                self.pipe(chunk, start, end, name)
+        finally:
+            os.unlink(chunk.path)
+            self.slots.release()
+
+    def pipe(
+        self, chunk: Chunk, start: list[Statement], end: list[Statement], name: str
+    ) -> None:
+        process = subprocess.Popen(self.client, stdin=subprocess.PIPE)
+        assert process.stdin
+        try:
+            writer = StatementWriter(process.stdin)
+            for statement in chunk.prologue + start + chunk.head:
+                writer.write(statement)
+            writer.use(b";")
+            with open(chunk.path, "rb") as f:
+                shutil.copyfileobj(f, process.stdin, 1024 * 1024)
+            writer.delimiter = chunk.writer.delimiter
+            for statement in end:
+                writer.write(statement)
+            process.stdin.close()
+        except BrokenPipeError:
+            # The client stopped at an error, which it has shown
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        if process.wait():
+            with self.lock:
+                self.failed.append(name)
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+
+class Tracer:
+    """Time module hooks, commands and downloads.
+
+    Every span is kept as a trace event so it can be saved for
+    chrome://tracing or Perfetto (https://ui.perfetto.dev), where spans
+    on the same thread nest: a module's hook contains its commands.
+    Modules that run in parallel each get their own row.
+
+    Listeners are told when a span starts and finishes, eg.
+    ("command_start", {"name": ..., "cmd": ...}), see events.py.
+
+    tracer = Tracer()
+    with tracer.span("Apache2", "module", hook="post_install"):
+        with tracer.span("sudo a2enmod rewrite", "command") as args:
+            args["exit"] = 0
+    tracer.slowest(10)
+    tracer.save("boss-trace.json")
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.events: list[dict[str, Any]] = []
+        self.threads: dict[int, str] = {}
+        self.lock = threading.Lock()
+        self.listeners: list[Callable[[str, dict[str, Any]], None]] = []
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[dict[str, Any]]:
+        """Time the block, the args it yields end up in the event."""
+        for listener in self.listeners:
+            listener(f"{category}_start", {"name": name, **args})
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            # A CalledProcessError has the command's exit status
+            if isinstance(getattr(e, "returncode", None), int):
+                args["exit"] = e.returncode  # type: ignore[attr-defined]
+            else:
+                args["error"] = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            thread = threading.current_thread()
+            with self.lock:
+                self.threads.setdefault(thread.ident or 0, thread.name)
+                self.events.append(
+                    {
+                        "name": name,
+                        "cat": category,
+                        "ph": "X",
+                        "ts": round((start - self.start) * 1e6),
+                        "dur": round((end - start) * 1e6),
+                        "pid": os.getpid(),
+                        "tid": thread.ident or 0,
+                        "args": args,
+                    }
+                )
+            for listener in self.listeners:
+                seconds = round(end - start, 3)
+                listener(
+                    f"{category}_finish", {"name": name, "seconds": seconds, **args}
+                )
+
+    def slowest(self, count: int = 10) -> list[dict[str, Any]]:
+        """The command events that took the longest, longest first."""
+        with self.lock:
+            commands = [i for i in self.events if i["cat"] == "command"]
+        return sorted(commands, key=lambda i: i["dur"], reverse=True)[:count]
+
+    def save(self, filename: str | Path) -> None:
+        with self.lock:
+            names = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+                for tid, name in self.threads.items()
+            ]
+            trace = {"traceEvents": names + self.events, "displayTimeUnit": "ms"}
+        with open(filename, "w") as f:
+            json.dump(trace, f, default=str)
+
+
+TRACER = Tracer()
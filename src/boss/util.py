@@ -8,6 +8,8 @@ import click
 import string
 import random
 
+from .events import EVENTS
+
 
 def display_cmd(
     cmd: str,
@@ -16,6 +18,9 @@ def display_cmd(
     script: bool = False,
     comment: str = "",
 ) -> None:
+    # The command is in the command events
+    if EVENTS.enabled:
+        return
     indent = " " * indent_count
     leader = "+ "
     initial_indent = indent + leader
@@ -60,6 +65,9 @@ def display_cmd(
 
 
 def title(msg: str, script: bool = False, show_date: bool = True) -> None:
+    # The module events say what's running
+    if EVENTS.enabled:
+        return
     timestamp = ""
     if show_date:
         timestamp = " [{}]".format(datetime.datetime.now().isoformat())
@@ -81,6 +89,7 @@ def title(msg: str, script: bool = False, show_date: bool = True) -> None:
 
 
 def warn(msg: str, script: bool = False) -> None:
+    EVENTS.emit("warning", message=str(msg))
     if script:
         sys.stdout.write("# !!! WARNING: {} !!!\n".format(msg))
     else:
@@ -92,6 +101,7 @@ def warn(msg: str, script: bool = False) -> None:
 
 
 def notify(msg: str) -> None:
+    EVENTS.emit("notice", message=str(msg))
     click.echo(
         click.style("NOTICE: ", fg="blue", bold=True) + click.style(str(msg), fg="blue")
     )
@@ -99,6 +109,7 @@ def notify(msg: str) -> None:
 
 
 def error(msg: str, dry_run: bool = False) -> None:
+    EVENTS.emit("error", message=str(msg))
     click.echo(
         click.style("ERROR: ", fg="red", bold=True) + click.style(str(msg), fg="red")
     )
@@ -107,6 +118,15 @@ def error(msg: str, dry_run: bool = False) -> None:
         sys.exit(1)
 
 
+def pretty_size(size: float) -> str:
+    """Format a number of bytes, eg. 1536 -> '1.5 KB'."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
 def password_gen(level: str = "alpha-num", length: int = 10) -> str:
     levels = {
         "alpha-lower": string.ascii_lowercase,
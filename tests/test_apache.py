@@ -0,0 +1,41 @@
+import unittest
+
+from boss.apache import ApacheConfig
+
+
+class ApacheConfigTest(unittest.TestCase):
+    def test_command(self) -> None:
+        apache = ApacheConfig()
+        apache.enable("mods", "ssl", "rewrite")
+        apache.enable("conf", "adminer.conf")
+        apache.enable("sites", "example.test")
+        self.assertTrue(apache.wanted())
+        lines = str(apache.command()).splitlines()
+        self.assertIn("enable_mod ssl", lines)
+        self.assertIn("enable conf adminer", lines)
+        self.assertIn("enable sites example.test", lines)
+        self.assertFalse(any(i.startswith("find") for i in lines))
+        self.assertFalse(apache.wanted())
+        self.assertIsNone(apache.command())
+
+    def test_only_keeps_every_site_asked_for(self) -> None:
+        apache = ApacheConfig()
+        apache.enable("sites", "first.test.conf")
+        apache.command()
+        # A later flush, eg. after a serial module
+        apache.enable("sites", "second.test", only=True)
+        command = str(apache.command())
+        self.assertIn(
+            "find sites-enabled -mindepth 1 "
+            "! -name 'first.test.conf' ! -name 'second.test.conf' -delete",
+            command,
+        )
+        self.assertNotIn("enable sites first.test", command)
+
+    def test_unknown_kind(self) -> None:
+        with self.assertRaises(ValueError):
+            ApacheConfig().enable("site", "example.test")
+
+
+if __name__ == "__main__":
+    unittest.main()
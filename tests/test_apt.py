@@ -0,0 +1,96 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from boss.apt import DpkgStatus
+
+# Stanzas as they are in /var/lib/dpkg/status
+STATUS = b"""\
+Package: apache2
+Status: install ok installed
+Priority: optional
+Section: httpd
+Installed-Size: 465
+Maintainer: Ubuntu Developers <ubuntu-devel-discuss@lists.ubuntu.com>
+Architecture: amd64
+Version: 2.4.58-1ubuntu8.4
+Conffiles:
+ /etc/apache2/apache2.conf 354c9e6d2b88a0a3e0548f853840674c
+ /etc/apache2/ports.conf a961f23471d985c2b819b652b7f64321
+Description: Apache HTTP Server
+ The Apache HTTP Server Project's goal is to build a secure, efficient and
+ extensible HTTP server as standards-compliant open source software.
+ .
+ Status: install ok installed
+
+Package: mysql-server
+Status: deinstall ok config-files
+Priority: optional
+Section: database
+Architecture: all
+Version: 8.0.39-0ubuntu0.24.04.2
+Conffiles:
+ /etc/mysql/conf.d/mysql.cnf 6c67a7e5a9a8a4b5f7d3e0c1f9ad8e74
+
+Package: php8.3-cli
+Status: install ok unpacked
+Architecture: amd64
+Version: 8.3.6-0ubuntu0.24.04.2
+
+Package: php8.3-common
+Status: install ok half-configured
+Architecture: amd64
+Version: 8.3.6-0ubuntu0.24.04.2
+
+Package: snapd
+Status: hold ok installed
+Architecture: amd64
+Version: 2.63+24.04
+
+Package: libc6
+Status: install ok installed
+Architecture: i386
+Multi-Arch: same
+Version: 2.39-0ubuntu8.3"""
+
+
+class DpkgStatusTest(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "status"
+        self.path.write_bytes(STATUS)
+        self.status = DpkgStatus(self.path)
+
+    def test_installed(self) -> None:
+        self.assertEqual(
+            self.status.installed(),
+            {
+                "apache2",
+                "apache2:amd64",
+                "snapd",
+                "snapd:amd64",
+                "libc6",
+                "libc6:i386",
+            },
+        )
+
+    def test_missing(self) -> None:
+        self.assertEqual(
+            self.status.missing(["php8.3-cli", "apache2", "mysql-server", "curl"]),
+            ["php8.3-cli", "mysql-server", "curl"],
+        )
+
+    def test_parsed_again_when_changed(self) -> None:
+        self.assertNotIn("curl", self.status.installed())
+        with self.path.open("ab") as f:
+            f.write(b"\n\nPackage: curl\nStatus: install ok installed\n")
+        self.assertIn("curl", self.status.installed())
+
+    def test_no_status_file(self) -> None:
+        self.path.unlink()
+        self.assertEqual(self.status.installed(), frozenset())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+from boss.bash import DPKG_COMMAND, SED_SUBSTITUTE, Args, Bash
+
+
+class DpkgCommandTest(unittest.TestCase):
+    def test_apt_and_dpkg(self) -> None:
+        for cmd in [
+            "sudo apt-get --quiet update",
+            "export DEBIAN_FRONTEND=noninteractive; sudo apt-get --yes install php",
+            "DEBIAN_FRONTEND=noninteractive apt install curl",
+            "sudo -E dpkg -i /tmp/netdata.deb",
+            "sudo dpkg-reconfigure --frontend noninteractive tzdata",
+            "echo 'tzdata tzdata/Areas select America' | sudo debconf-set-selections",
+            "curl -sS https://example.com/key.asc | sudo apt-key add -",
+            "sudo bash -e <<'EOF'\ncd /tmp\napt-mark hold mysql-server\nEOF",
+            "sudo /usr/bin/apt-get --yes autoremove",
+            "sudo add-apt-repository --yes ppa:ondrej/php",
+        ]:
+            with self.subTest(cmd=cmd):
+                self.assertTrue(DPKG_COMMAND.search(cmd))
+
+    def test_other_commands(self) -> None:
+        for cmd in [
+            "sudo tee /etc/apt/apt.conf.d/01proxy",
+            "cat /etc/apt/sources.list",
+            "sudo cp boss.list /etc/apt/sources.list.d/",
+            "sudo snap install --classic certbot",
+            "sudo service apache2 restart",
+            "grep -q aptitude ~/.bashrc",
+        ]:
+            with self.subTest(cmd=cmd):
+                self.assertIsNone(DPKG_COMMAND.search(cmd))
+
+
+class SedSubstituteTest(unittest.TestCase):
+    def test_single_s_command(self) -> None:
+        for exp in [
+            "s/a/b/",
+            "s/^Port 22$/Port 2222/g",
+            "s|;sendmail_path =|sendmail_path = /usr/local/bin/mhsendmail|",
+            r"s/a\/b/c\/d/",
+            r"s/^#\(PermitRootLogin\).*/\1 no/I",
+            "s#bind socket to IP = .*$#bind socket to IP = *#2",
+        ]:
+            with self.subTest(exp=exp):
+                self.assertTrue(SED_SUBSTITUTE.match(exp))
+
+    def test_other_expressions(self) -> None:
+        for exp in [
+            "s/a/b/;s/c/d/",
+            "s/a/b/g;s/c/d/",
+            "s/a/b/w /tmp/changed",
+            "s/a/b",
+            "/^#/d",
+            "$ a include /etc/extra.conf",
+            "1,3s/a/b/",
+        ]:
+            with self.subTest(exp=exp):
+                self.assertIsNone(SED_SUBSTITUTE.match(exp))
+
+
+class Module(Bash):
+    title = "Module"
+
+
+class SedTest(unittest.TestCase):
+    """A module's edits applied by one sed, which reports what changed."""
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "sshd_config"
+        self.path.write_text("Port 22\n#PermitRootLogin yes\nX11Forwarding yes\n")
+        fields: dict[str, Any] = dict.fromkeys(Args._fields)
+        self.module = Module(args=Args(**fields))
+        for patch in [
+            mock.patch("boss.bash.STATE_DIR", Path(tmp.name) / "state"),
+            mock.patch.object(Module, "run", run_without_sudo),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_edits(self) -> None:
+        edits = [
+            "s/^Port 22$/Port 2222/",
+            "s/^#PermitRootLogin yes/PermitRootLogin no/;s/^X11Forwarding yes/#&/",
+            "s/^UsePAM no/UsePAM yes/",
+        ]
+        for exp in edits:
+            self.module.sed(exp, self.path)
+        with (
+            mock.patch("boss.bash.EVENTS") as events,
+            mock.patch("boss.bash.warn") as warn,
+        ):
+            self.module.flush_edits()
+        self.assertEqual(
+            self.path.read_text(),
+            "Port 2222\nPermitRootLogin no\n#X11Forwarding yes\n",
+        )
+        # Only the single s commands can say what they changed
+        self.assertEqual(
+            [
+                (i.kwargs["expression"], i.kwargs["changed"])
+                for i in events.emit.mock_calls
+            ],
+            [(edits[0], 1), (edits[2], 0)],
+        )
+        warn.assert_called_once()
+        self.assertIn("UsePAM", warn.call_args.args[0])
+
+
+def run_without_sudo(module: Bash, cmd: str, **kwargs: Any) -> str:
+    subprocess.run(cmd.removeprefix("sudo "), shell=True, check=True)
+    return "0"
+
+
+if __name__ == "__main__":
+    unittest.main()
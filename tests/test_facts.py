@@ -0,0 +1,90 @@
+import unittest
+from unittest import mock
+
+from boss.dist import Dist
+from boss.facts import Facts, Version, remote
+
+
+class VersionTest(unittest.TestCase):
+    def test_parse(self) -> None:
+        for version, parts in [
+            ("24.04", (24, 4)),
+            ("22.04.5", (22, 4)),
+            ("20.10", (20, 10)),
+            ("12", (12, 0)),
+            ("0", (0, 0)),
+            # A float loses 20.10's trailing zero
+            (20.10, (20, 10)),
+            (24.04, (24, 4)),
+            (Version(18, 4), (18, 4)),
+        ]:
+            with self.subTest(version=version):
+                parsed = Version.parse(version)
+                self.assertEqual((parsed.major, parsed.minor), parts)
+
+    def test_compare(self) -> None:
+        # As floats or strings 20.10 would come before 20.04, or equal 20.1
+        self.assertGreater(Version.parse("20.10"), Version.parse("20.04"))
+        self.assertGreater(Version.parse(20.10), 20.04)
+        self.assertLess(Version.parse("9.10"), "10.04")
+        self.assertLessEqual(Version.parse("22.04"), 22.04)
+        self.assertGreaterEqual(Version.parse("22.04.5"), "22.04")
+
+    def test_equal(self) -> None:
+        version = Version.parse("24.04")
+        self.assertEqual(version, (24, 4))
+        self.assertEqual(version, "24.04")
+        self.assertEqual(version, 24.04)
+        self.assertNotEqual(version, 24.4)
+        self.assertNotEqual(version, ["24.04"])
+        self.assertEqual(hash(version), hash(Version(24, 4)))
+
+    def test_str(self) -> None:
+        self.assertEqual(str(Version.parse(20.10)), "20.10")
+        self.assertEqual(str(Version.parse("24.04")), "24.04")
+
+
+class RemoteTest(unittest.TestCase):
+    def test_probe_output(self) -> None:
+        output = b"Ubuntu\n24.04\nnoble\narm64\n4\n8029764\n"
+        self.assertEqual(
+            remote(lambda cmd: output),
+            {
+                "name": "Ubuntu",
+                "version": "24.04",
+                "codename": "noble",
+                "architecture": "arm64",
+                "cpus": 4,
+                "memory": 8029764 * 1024,
+            },
+        )
+
+    def test_no_version(self) -> None:
+        # Debian's testing has no VERSION_ID
+        output = "Debian GNU/Linux\n\ntrixie\namd64\n2\n2000000\n"
+        self.assertEqual(remote(lambda cmd: output)["version"], "0")
+
+
+class DistTest(unittest.TestCase):
+    def dist(self, name: str, version: str) -> Dist:
+        current = Facts(name, Version.parse(version), "", "amd64", 1, 0)
+        with mock.patch("boss.dist.facts", return_value=current):
+            return Dist()
+
+    def test_compare(self) -> None:
+        dist = self.dist("Ubuntu", "20.10")
+        self.assertTrue(dist == Dist.UBUNTU)
+        self.assertTrue(dist > (Dist.UBUNTU, Dist.V20_04))
+        self.assertTrue(dist < (Dist.UBUNTU, Dist.V22_04))
+        self.assertTrue((Dist.UBUNTU, Dist.V14_04) < dist < (Dist.UBUNTU, Dist.V22_04))
+        self.assertFalse(dist == (Dist.UBUNTU, Dist.V20_04))
+
+    def test_other_distro(self) -> None:
+        dist = self.dist("Debian GNU/Linux", "12")
+        self.assertTrue(dist != Dist.UBUNTU)
+        self.assertFalse(dist >= (Dist.UBUNTU, Dist.V14_04))
+        self.assertFalse(dist < (Dist.UBUNTU, Dist.V24_04))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any
+
+from boss.errors import InventoryError
+from boss.fleet import Fleet, Host, read_inventory
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+# A dry run of one module, which the local transport runs on this machine
+BOSS_ARGS = ["first", "--dry-run", "--dist-version", "24.04"]
+
+
+class ReadInventoryTest(unittest.TestCase):
+    def test_hosts(self) -> None:
+        hosts = read_inventory(
+            [
+                "# web servers\n",
+                "deploy@web1.example.com\n",
+                "\n",
+                "web2.example.com web2.local  # staging\n",
+            ]
+        )
+        self.assertEqual(
+            [(i.address, i.servername) for i in hosts],
+            [
+                ("deploy@web1.example.com", "web1.example.com"),
+                ("web2.example.com", "web2.local"),
+            ],
+        )
+
+    def test_too_many_fields(self) -> None:
+        with self.assertRaisesRegex(InventoryError, "Line 2"):
+            read_inventory(["web1.example.com\n", "web2.example.com a b\n"])
+
+    def test_duplicate(self) -> None:
+        with self.assertRaisesRegex(InventoryError, "twice"):
+            read_inventory(["web1.example.com\n", "web1.example.com other.local\n"])
+
+    def test_empty(self) -> None:
+        with self.assertRaisesRegex(InventoryError, "no hosts"):
+            read_inventory(["# nothing yet\n", "\n"])
+
+
+class FleetTest(unittest.TestCase):
+    """Fleet.run() with the local transport, each host a dry run."""
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.log_dir = Path(tmp.name) / "logs"
+        environ = {
+            "PYTHONPATH": os.pathsep.join(
+                [str(SRC), *filter(None, [os.environ.get("PYTHONPATH")])]
+            ),
+            "XDG_STATE_HOME": str(Path(tmp.name) / "state"),
+            "XDG_CACHE_HOME": str(Path(tmp.name) / "cache"),
+        }
+        for name, value in environ.items():
+            self.addCleanup(restore, name, os.environ.get(name))
+            os.environ[name] = value
+
+    def fleet(self, hosts: list[Host], **kwargs: Any) -> Fleet:
+        return Fleet(
+            hosts, BOSS_ARGS, transport="local", log_dir=self.log_dir, **kwargs
+        )
+
+    def test_batches(self) -> None:
+        hosts = [Host(f"web{i}.test", f"web{i}.test") for i in range(1, 4)]
+        fleet = self.fleet(hosts, batch=2, parallel=2)
+        self.assertTrue(fleet.run())
+        for host in hosts:
+            self.assertEqual(host.status, "done")
+            self.assertGreater(host.commands, 0)
+            self.assertTrue(fleet.log(host).exists())
+
+    def test_failed_batch_stops_the_next(self) -> None:
+        # boss refuses a servername without a dot
+        hosts = [
+            Host("web1.test", "web1.test"),
+            Host("web2.test", "broken"),
+            Host("web3.test", "web3.test"),
+        ]
+        self.assertFalse(self.fleet(hosts, batch=1).run())
+        self.assertEqual([i.status for i in hosts], ["done", "failed", "skipped"])
+
+    def test_fail_fast(self) -> None:
+        hosts = [
+            Host("web1.test", "broken"),
+            Host("web2.test", "web2.test"),
+            Host("web3.test", "web3.test"),
+        ]
+        self.assertFalse(self.fleet(hosts, parallel=1, fail_fast=True).run())
+        self.assertEqual([i.status for i in hosts], ["failed", "skipped", "skipped"])
+        self.assertIn("exit status", hosts[0].message)
+
+    def test_without_fail_fast(self) -> None:
+        hosts = [Host("web1.test", "broken"), Host("web2.test", "web2.test")]
+        self.assertFalse(self.fleet(hosts, parallel=1).run())
+        self.assertEqual([i.status for i in hosts], ["failed", "done"])
+
+
+def restore(name: str, value: str | None) -> None:
+    if value is None:
+        os.environ.pop(name, None)
+    else:
+        os.environ[name] = value
+
+
+if __name__ == "__main__":
+    unittest.main()
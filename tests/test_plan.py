@@ -0,0 +1,133 @@
+import contextlib
+import io
+import tempfile
+import unittest
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+from boss import facts
+from boss.apache import ApacheConfig
+from boss.bash import Args, Bash
+from boss.errors import CommandError
+from boss.handlers import Handlers
+from boss.journal import JOURNAL
+from boss.plan import Plan
+
+
+def setUpModule() -> None:
+    facts.override(name="Ubuntu", version=24.04)
+
+
+def make_args(**changes: Any) -> Args:
+    fields: dict[str, Any] = dict.fromkeys(Args._fields)
+    fields.update(
+        servername="example.test",
+        modules=(),
+        jobs=1,
+        output="text",
+        transport="ssh",
+        db_root_pass="",
+        site_name_and_root=[],
+        cert_key_type="ecdsa",
+    )
+    fields.update(changes)
+    return Args(**fields)
+
+
+class Site(Bash):
+    title = "Site"
+    runs = 0
+
+    def post_install(self) -> None:
+        Site.runs += 1
+        self.enable_apache_mods("rewrite")
+        self.enable_apache_sites("example.test", only=True)
+        self.restart_apache()
+        self.reload("php8.3-fpm")
+
+
+class Database(Bash):
+    title = "Database"
+    fail = False
+
+    def post_install(self) -> None:
+        if Database.fail:
+            raise CommandError("mysql failed")
+
+
+class ResumeTest(unittest.TestCase):
+    """A resumed run skips the finished hooks but not what they asked for."""
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for name, value in [
+            ("path", Path(tmp.name) / "journal.jsonl"),
+            ("completed", {}),
+        ]:
+            patch = mock.patch.object(JOURNAL, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        Site.runs = 0
+        self.commands: list[str] = []
+
+    @contextlib.contextmanager
+    def process(self) -> Iterator[None]:
+        """What a new boss process starts with, commands are only recorded."""
+
+        def run(app: Bash, cmd: str, **kwargs: Any) -> None:
+            self.commands.append(cmd)
+
+        with contextlib.ExitStack() as stack:
+            apache = ApacheConfig()
+            handlers = Handlers()
+            for module in ("boss.bash", "boss.plan"):
+                stack.enter_context(mock.patch(f"{module}.APACHE", apache))
+                stack.enter_context(mock.patch(f"{module}.HANDLERS", handlers))
+            stack.enter_context(mock.patch.object(Bash, "run", run))
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            yield
+
+    def plan(self, **changes: Any) -> Plan:
+        return Plan([Site, Database], make_args(**changes))
+
+    def test_resume_after_a_failed_post_install(self) -> None:
+        Database.fail = True
+        with self.process(), self.assertRaises(CommandError):
+            self.plan().run()
+        self.assertEqual(Site.runs, 1)
+        self.assertEqual(self.commands, [])
+
+        Database.fail = False
+        with self.process():
+            self.plan(resume=True).run()
+        self.assertEqual(Site.runs, 1)
+        enable, configtest, *services = self.commands
+        self.assertIn("enable_mod rewrite", enable)
+        self.assertIn("enable sites example.test", enable)
+        self.assertIn("! -name 'example.test.conf'", enable)
+        self.assertEqual(configtest, "sudo apachectl configtest")
+        # The restart covers the reload after the config is enabled
+        self.assertEqual(
+            services,
+            ["sudo service apache2 restart", "sudo service php8.3-fpm reload"],
+        )
+
+    def test_resumed_twice(self) -> None:
+        Database.fail = True
+        with self.process(), self.assertRaises(CommandError):
+            self.plan().run()
+        # The skip is recorded with what the hook asked for
+        with self.process(), self.assertRaises(CommandError):
+            self.plan(resume=True).run()
+        Database.fail = False
+        with self.process():
+            self.plan(resume=True).run()
+        self.assertEqual(Site.runs, 1)
+        self.assertIn("enable sites example.test", self.commands[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import contextlib
+import io
+import unittest
+from typing import cast
+
+from boss.bash import Bash
+from boss.script import ScriptWriter, commented
+
+
+class Module:
+    serial = False
+
+
+class ScriptWriterTest(unittest.TestCase):
+    def test_printed_text_is_commented(self) -> None:
+        first, second = cast(Bash, Module()), cast(Bash, Module())
+        writer = ScriptWriter()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            writer.open({first: set(), second: set()})
+            for app in (first, second):
+                with writer.section(app, "post_install"):
+                    print("# Site ----")
+                    print("<VirtualHost *:80>\n    ServerName example.test\n")
+                    writer.command("a2query -s", wrap=False)
+            writer.close()
+        script = out.getvalue()
+        self.assertIn("boss_start 01-module-post_install", script)
+        self.assertIn("\n# <VirtualHost *:80>\n#     ServerName example.test\n", script)
+        self.assertIn("\n# Site ----\n", script)
+        self.assertIn("\na2query -s\n", script)
+        self.assertNotIn("\n<VirtualHost", script)
+
+    def test_commented(self) -> None:
+        self.assertEqual(
+            commented("NOTICE: done\n\n  # already\nx=1"),
+            "# NOTICE: done\n\n  # already\n# x=1",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
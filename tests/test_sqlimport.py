@@ -0,0 +1,330 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from boss.sqlimport import Chunk, SqlImport, Statement, statements
+
+# As mysqldump --databases shop blog --triggers writes it
+DUMP = b"""\
+-- MySQL dump 10.13  Distrib 8.0.39, for Linux (x86_64)
+--
+-- Host: localhost    Database: shop
+-- ------------------------------------------------------
+/*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */;
+/*!50503 SET NAMES utf8mb4 */;
+/*!40014 SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS, FOREIGN_KEY_CHECKS=0 */;
+
+--
+-- Current Database: `shop`
+--
+
+CREATE DATABASE /*!32312 IF NOT EXISTS*/ `shop` /*!40100 DEFAULT CHARACTER SET utf8mb4 */;
+
+USE `shop`;
+
+--
+-- Table structure for table `customers`
+--
+
+DROP TABLE IF EXISTS `customers`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `customers` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `name` varchar(64) NOT NULL,
+  `email` varchar(128) DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `email` (`email`),
+  KEY `name` (`name`)
+) ENGINE=InnoDB AUTO_INCREMENT=3 DEFAULT CHARSET=utf8mb4;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `customers`
+--
+
+LOCK TABLES `customers` WRITE;
+/*!40000 ALTER TABLE `customers` DISABLE KEYS */;
+INSERT INTO `customers` VALUES (1,'Ann; Smith','ann@example.test'),(2,'-- not a comment','it\\'s;bob@example.test');
+/*!40000 ALTER TABLE `customers` ENABLE KEYS */;
+UNLOCK TABLES;
+
+--
+-- Table structure for table `orders`
+--
+
+DROP TABLE IF EXISTS `orders`;
+CREATE TABLE `orders` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `customer_id` int NOT NULL,
+  `total` decimal(10,2) NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `customer_id` (`customer_id`),
+  CONSTRAINT `orders_ibfk_1` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+LOCK TABLES `orders` WRITE;
+INSERT INTO `orders` VALUES (1,1,9.99),(2,2,0.50);
+UNLOCK TABLES;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+DELIMITER ;;
+/*!50003 CREATE*/ /*!50017 DEFINER=`root`@`localhost`*/ /*!50003 TRIGGER `orders_total` BEFORE INSERT ON `orders` FOR EACH ROW BEGIN
+  IF NEW.total < 0 THEN SET NEW.total = 0; END IF;
+END */;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+
+--
+-- Current Database: `blog`
+--
+
+CREATE DATABASE /*!32312 IF NOT EXISTS*/ `blog` /*!40100 DEFAULT CHARACTER SET utf8mb4 */;
+
+USE `blog`;
+
+DROP TABLE IF EXISTS `posts`;
+CREATE TABLE `posts` (
+  `id` int NOT NULL,
+  `body` text,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+LOCK TABLES `posts` WRITE;
+INSERT INTO `posts` VALUES (1,'Hello;\\n-- world\\n# not a comment');
+UNLOCK TABLES;
+/*!40014 SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS */;
+
+-- Dump completed on 2024-09-01 12:00:00
+"""
+
+CUSTOMERS = b"""\
+CREATE TABLE `customers` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `name` varchar(64) NOT NULL,
+  `email` varchar(128) DEFAULT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB AUTO_INCREMENT=3 DEFAULT CHARSET=utf8mb4"""
+
+PROLOGUE = [
+    b"/*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */",
+    b"/*!50503 SET NAMES utf8mb4 */",
+    (
+        b"/*!40014 SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS, "
+        b"FOREIGN_KEY_CHECKS=0 */"
+    ),
+]
+LOAD_START = b"SET foreign_key_checks=0, unique_checks=0, autocommit=0"
+
+
+def split(sql: bytes) -> list[Statement]:
+    return list(statements(sql.splitlines(keepends=True)))
+
+
+def first_lines(sql: bytes) -> list[bytes]:
+    return [i.text.split(b"\n")[0] for i in split(sql)]
+
+
+class SplitTest(unittest.TestCase):
+    def test_strings_and_comments(self) -> None:
+        sql = (
+            b"-- a comment; with a delimiter\n"
+            b"# another;\n"
+            b"INSERT INTO `t;1` VALUES ('a; b -- c', \"d;\", 'it\\'s; # e');\n"
+            b"/* a comment; */ SELECT '--';  -- the end;\n"
+            b"INSERT INTO t VALUES ('two\n"
+            b"lines;\n"
+            b"-- in a string');\n"
+        )
+        self.assertEqual(
+            [i.text for i in split(sql)],
+            [
+                b"INSERT INTO `t;1` VALUES ('a; b -- c', \"d;\", 'it\\'s; # e')",
+                b"/* a comment; */ SELECT '--'",
+                b"INSERT INTO t VALUES ('two\nlines;\n-- in a string')",
+            ],
+        )
+
+    def test_delimiter(self) -> None:
+        sql = (
+            b"DELIMITER ;;\n"
+            b"CREATE TRIGGER t BEFORE INSERT ON o FOR EACH ROW BEGIN\n"
+            b"  SET NEW.a = 1; SET NEW.b = ';;';\n"
+            b"END ;;\n"
+            b"delimiter ;\n"
+            b"SELECT 1;\n"
+        )
+        trigger, select = split(sql)
+        self.assertEqual(trigger.delimiter, b";;")
+        self.assertTrue(trigger.text.endswith(b"SET NEW.b = ';;';\nEND"))
+        self.assertEqual(select, Statement(b"SELECT 1"))
+
+    def test_no_delimiter_at_the_end(self) -> None:
+        self.assertEqual(split(b"SELECT 1;\nSELECT 2\n")[-1].text, b"SELECT 2")
+
+    def test_dump(self) -> None:
+        dump = split(DUMP)
+        self.assertEqual(len(dump), 31)
+        self.assertEqual([i.text for i in dump[:3]], PROLOGUE)
+        self.assertEqual([i.delimiter for i in dump].count(b";;"), 1)
+
+
+class LoadTest(unittest.TestCase):
+    """Each connection's input, from a client that saves it."""
+
+    def load(self, defer_indexes: int = 1 << 30) -> tuple[list[bytes], list[str]]:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        dump = root / "dump.sql"
+        dump.write_bytes(DUMP)
+        loads = root / "loads"
+        loads.mkdir()
+        # One connection loads one chunk at a time, so they're numbered
+        # in the order they're loaded
+        client = ["sh", "-c", 'cat > "$1/$(ls "$1" | wc -l)"', "sh", str(loads)]
+        stats = SqlImport(client, 1, defer_indexes).run(dump)
+        self.assertEqual(stats.tables, 3)
+        self.assertEqual(stats.statements, 31)
+        paths = sorted(loads.iterdir(), key=lambda i: int(i.name))
+        return [i.read_bytes() for i in paths], stats.deferred
+
+    def test_chunks(self) -> None:
+        (shop, customers, orders, trigger, posts), deferred = self.load()
+        self.assertEqual(deferred, [])
+        self.assertEqual(
+            first_lines(shop),
+            PROLOGUE
+            + [
+                (
+                    b"CREATE DATABASE /*!32312 IF NOT EXISTS*/ `shop` "
+                    b"/*!40100 DEFAULT CHARACTER SET utf8mb4 */"
+                ),
+                b"USE `shop`",
+            ],
+        )
+        self.assertEqual(
+            first_lines(customers),
+            PROLOGUE
+            + [
+                b"USE `shop`",
+                LOAD_START,
+                b"DROP TABLE IF EXISTS `customers`",
+                b"/*!40101 SET @saved_cs_client     = @@character_set_client */",
+                b"/*!50503 SET character_set_client = utf8mb4 */",
+                b"CREATE TABLE `customers` (",
+                b"/*!40101 SET character_set_client = @saved_cs_client */",
+                b"LOCK TABLES `customers` WRITE",
+                b"/*!40000 ALTER TABLE `customers` DISABLE KEYS */",
+                (
+                    b"INSERT INTO `customers` VALUES (1,'Ann; Smith','ann@example.test'),"
+                    b"(2,'-- not a comment','it\\'s;bob@example.test')"
+                ),
+                b"/*!40000 ALTER TABLE `customers` ENABLE KEYS */",
+                b"UNLOCK TABLES",
+                b"COMMIT",
+            ],
+        )
+        self.assertEqual(
+            first_lines(orders)[4:],
+            [
+                LOAD_START,
+                b"DROP TABLE IF EXISTS `orders`",
+                b"CREATE TABLE `orders` (",
+                b"LOCK TABLES `orders` WRITE",
+                b"INSERT INTO `orders` VALUES (1,1,9.99),(2,2,0.50)",
+                b"UNLOCK TABLES",
+                b"COMMIT",
+            ],
+        )
+        # The trigger runs alone, after the tables before it
+        batch = split(trigger)
+        self.assertEqual(
+            [i.text.split(b"\n")[0] for i in batch][3:],
+            [
+                b"USE `shop`",
+                b"/*!50003 SET @saved_sql_mode       = @@sql_mode */",
+                (
+                    b"/*!50003 CREATE*/ /*!50017 DEFINER=`root`@`localhost`*/ "
+                    b"/*!50003 TRIGGER `orders_total` BEFORE INSERT ON `orders` "
+                    b"FOR EACH ROW BEGIN"
+                ),
+                b"/*!50003 SET sql_mode              = @saved_sql_mode */",
+                (
+                    b"CREATE DATABASE /*!32312 IF NOT EXISTS*/ `blog` "
+                    b"/*!40100 DEFAULT CHARACTER SET utf8mb4 */"
+                ),
+                b"USE `blog`",
+            ],
+        )
+        self.assertEqual(batch[5].delimiter, b";;")
+        self.assertIn(b"\nDELIMITER ;;\n", trigger)
+        self.assertIn(b"END */;;\nDELIMITER ;\n", trigger)
+        # The next database's table gets the settings from before it
+        self.assertEqual(
+            first_lines(posts)[3:],
+            [
+                b"USE `shop`",
+                b"/*!50003 SET @saved_sql_mode       = @@sql_mode */",
+                b"/*!50003 SET sql_mode              = @saved_sql_mode */",
+                b"USE `blog`",
+                LOAD_START,
+                b"DROP TABLE IF EXISTS `posts`",
+                b"CREATE TABLE `posts` (",
+                b"LOCK TABLES `posts` WRITE",
+                b"INSERT INTO `posts` VALUES (1,'Hello;\\n-- world\\n# not a comment')",
+                b"UNLOCK TABLES",
+                b"COMMIT",
+            ],
+        )
+
+    def test_defer_indexes(self) -> None:
+        (_, customers, orders, _, posts), deferred = self.load(defer_indexes=0)
+        self.assertEqual(deferred, ["shop.customers"])
+        *_, create, _, _, _, _, _, _, alter, commit = split(customers)
+        self.assertEqual(create.text, CUSTOMERS)
+        self.assertEqual(
+            alter.text,
+            b"ALTER TABLE `customers` ADD UNIQUE KEY `email` (`email`), "
+            b"ADD KEY `name` (`name`)",
+        )
+        self.assertEqual(commit.text, b"COMMIT")
+        # A foreign key needs its index, and posts has no secondary ones
+        creates = {i.text for i in split(DUMP) if i.text.startswith(b"CREATE TABLE")}
+        for sql in orders, posts:
+            self.assertNotIn(b"ALTER TABLE", sql)
+            self.assertEqual(len(creates.intersection(i.text for i in split(sql))), 1)
+
+
+class DeferIndexesTest(unittest.TestCase):
+    def defer(self, create: bytes) -> tuple[bytes, list[Statement]]:
+        with (
+            tempfile.TemporaryDirectory() as tmp,
+            Chunk(b"shop.t", [], Path(tmp) / "t.sql") as chunk,
+        ):
+            chunk.add(Statement(create))
+            alter = chunk.defer_indexes()
+        return chunk.head[0].text, alter
+
+    def test_auto_increment_outside_the_primary_key(self) -> None:
+        create = (
+            b"CREATE TABLE `t` (\n"
+            b"  `id` int NOT NULL,\n"
+            b"  `n` int NOT NULL AUTO_INCREMENT,\n"
+            b"  PRIMARY KEY (`id`),\n"
+            b"  KEY `n` (`n`)\n"
+            b") ENGINE=InnoDB"
+        )
+        self.assertEqual(self.defer(create), (create, []))
+
+    def test_not_innodb(self) -> None:
+        create = (
+            b"CREATE TABLE `t` (\n"
+            b"  `id` int NOT NULL,\n"
+            b"  KEY `id` (`id`)\n"
+            b") ENGINE=MyISAM"
+        )
+        self.assertEqual(self.defer(create), (create, []))
+
+
+if __name__ == "__main__":
+    unittest.main()